@@ -3,3 +3,5 @@
 from .image import process_image, process_image_enhanced  # noqa: F401
 from .pdf import process_pdf, process_pdf_enhanced  # noqa: F401
 from .pdf_to_images import pdf_to_images  # noqa: F401
+from .streaming import stream_image, astream_image  # noqa: F401
+from .batching import ContinuousBatchingEngine, process_images_batched  # noqa: F401
@@ -0,0 +1,273 @@
+"""Continuous batching for DeepSeek OCR on CPU.
+
+Pages are prefilled one at a time and then join a shared greedy decode batch.
+A finished page leaves the batch immediately and a waiting page takes its
+slot, so a short page never leaves the batch idle while a long one finishes.
+
+The batch KV cache is kept left-padded: every row ends at the same column,
+padding columns are masked out through the 2D attention mask, and position
+ids are tracked per sequence.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+import torch
+from transformers.cache_utils import DynamicCache
+
+from .image import PROMPT
+from .model_loader import load_model_and_tokenizer
+
+
+@dataclass
+class _Sequence:
+    request_id: str
+    tokens: List[int]
+    prompt_length: int
+    ngrams: Dict[Tuple[int, ...], Set[int]] = field(default_factory=dict)
+    finished: bool = False
+
+    @property
+    def num_generated(self) -> int:
+        return len(self.tokens) - self.prompt_length
+
+
+def _pad_cache_left(cache: DynamicCache, pad: int) -> None:
+    """Prepend pad zero columns to every layer of the cache (dim 2 is the sequence axis)."""
+    if pad <= 0:
+        return
+    for layer_idx in range(len(cache.key_cache)):
+        for tensors in (cache.key_cache, cache.value_cache):
+            states = tensors[layer_idx]
+            zeros = states.new_zeros(states.shape[:2] + (pad,) + states.shape[3:])
+            tensors[layer_idx] = torch.cat([zeros, states], dim=2)
+    cache._seen_tokens += pad
+
+
+def _concat_caches(first: DynamicCache, second: DynamicCache) -> DynamicCache:
+    """Stack two caches of equal length along the batch axis."""
+    merged = DynamicCache()
+    merged.key_cache = [torch.cat(pair, dim=0) for pair in zip(first.key_cache, second.key_cache)]
+    merged.value_cache = [torch.cat(pair, dim=0) for pair in zip(first.value_cache, second.value_cache)]
+    merged._seen_tokens = first._seen_tokens
+    return merged
+
+
+def _slice_cache(cache: DynamicCache, rows: torch.Tensor, start: int) -> None:
+    """Keep the given batch rows and drop the first start columns, in place."""
+    for tensors in (cache.key_cache, cache.value_cache):
+        for layer_idx, states in enumerate(tensors):
+            tensors[layer_idx] = states[rows, :, start:].contiguous()
+    cache._seen_tokens -= start
+
+
+class ContinuousBatchingEngine:
+    """
+    Greedy continuous-batching decoder around DeepseekOCRForCausalLM.
+
+    Example:
+        engine = ContinuousBatchingEngine(max_batch_size=4)
+        for path in image_paths:
+            engine.submit(path, path)
+        for result in engine.run():
+            print(result['request_id'], result['text'])
+    """
+
+    def __init__(
+        self,
+        model=None,
+        tokenizer=None,
+        max_batch_size: int = 4,
+        max_new_tokens: int = 8192,
+        no_repeat_ngram_size: int = 20,
+        base_size: int = 1024,
+        image_size: int = 640,
+        crop_mode: bool = True,
+    ):
+        if model is None or tokenizer is None:
+            tokenizer, model = load_model_and_tokenizer()
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.no_repeat_ngram_size = no_repeat_ngram_size
+        self.base_size = base_size
+        self.image_size = image_size
+        self.crop_mode = crop_mode
+        self.eos_token_id = tokenizer.eos_token_id
+        self.device = next(model.parameters()).device
+
+        self._queue: Deque[Tuple[str, str, str]] = deque()
+        self._active: List[_Sequence] = []
+        self._cache: Optional[DynamicCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+
+    def submit(self, request_id: str, image_path: str, prompt: str = PROMPT) -> None:
+        """Queue a page; it is admitted as soon as a batch slot is free."""
+        self._queue.append((request_id, str(Path(image_path).expanduser().resolve()), prompt))
+
+    def run(self) -> Iterator[Dict]:
+        """
+        Decode until every submitted page is finished.
+
+        Yields:
+            {'request_id': str, 'text': str, 'num_tokens': int} for each page, in completion order
+        """
+        autocast_device = "cuda" if self.device.type == "cuda" else "cpu"
+        with torch.autocast(autocast_device, dtype=torch.bfloat16):
+            with torch.no_grad():
+                while self._queue or self._active:
+                    while self._queue and len(self._active) < self.max_batch_size:
+                        self._admit(*self._queue.popleft())
+                    if any(seq.finished for seq in self._active):
+                        yield from self._retire()
+                        continue
+                    self._decode_step()
+                    yield from self._retire()
+
+    def _ban_and_pick(self, seq: _Sequence, logits: torch.Tensor) -> int:
+        """Apply the per-sequence n-gram ban to a (vocab,) logits row and pick the greedy token."""
+        n = self.no_repeat_ngram_size
+        if n > 0 and len(seq.tokens) >= n - 1:
+            banned = seq.ngrams.get(tuple(seq.tokens[len(seq.tokens) - n + 1:]) if n > 1 else ())
+            if banned:
+                logits = logits.clone()
+                logits[list(banned)] = float('-inf')
+        return int(torch.argmax(logits))
+
+    def _record_ngram(self, seq: _Sequence, end: int) -> None:
+        """Register the n-gram ending at tokens[end - 1]."""
+        n = self.no_repeat_ngram_size
+        if n <= 0 or end < n:
+            return
+        gram = seq.tokens[end - n:end]
+        seq.ngrams.setdefault(tuple(gram[:-1]), set()).add(gram[-1])
+
+    def _append(self, seq: _Sequence, token_id: int) -> None:
+        seq.tokens.append(token_id)
+        self._record_ngram(seq, len(seq.tokens))
+        if token_id == self.eos_token_id or seq.num_generated >= self.max_new_tokens:
+            seq.finished = True
+
+    def _admit(self, request_id: str, image_path: str, prompt: str) -> None:
+        """Prefill one page on its own and merge its cache into the running batch."""
+        inputs = self.model.prepare_inputs(
+            self.tokenizer,
+            prompt=prompt,
+            image_file=image_path,
+            base_size=self.base_size,
+            image_size=self.image_size,
+            crop_mode=self.crop_mode,
+        )
+        input_ids = inputs['input_ids'].unsqueeze(0)
+        cache = DynamicCache()
+        outputs = self.model.model(
+            input_ids=input_ids,
+            past_key_values=cache,
+            use_cache=True,
+            images=[(inputs['images_crop'], inputs['images_ori'])],
+            images_seq_mask=inputs['images_seq_mask'].unsqueeze(0),
+            images_spatial_crop=inputs['images_spatial_crop'],
+            return_dict=True,
+        )
+        logits = self.model.lm_head(outputs.last_hidden_state[:, -1]).float()[0]
+
+        seq = _Sequence(request_id=request_id, tokens=input_ids[0].tolist(), prompt_length=input_ids.shape[1])
+        for end in range(self.no_repeat_ngram_size, len(seq.tokens) + 1):
+            self._record_ngram(seq, end)
+        self._append(seq, self._ban_and_pick(seq, logits))
+
+        length = input_ids.shape[1]
+        mask = torch.ones((1, length), dtype=torch.long, device=self.device)
+        if self._cache is None:
+            self._cache, self._attention_mask = cache, mask
+        else:
+            batch_length = self._attention_mask.shape[1]
+            if length < batch_length:
+                _pad_cache_left(cache, batch_length - length)
+                mask = torch.cat([mask.new_zeros((1, batch_length - length)), mask], dim=1)
+            elif length > batch_length:
+                _pad_cache_left(self._cache, length - batch_length)
+                self._attention_mask = torch.cat(
+                    [self._attention_mask.new_zeros((self._attention_mask.shape[0], length - batch_length)),
+                     self._attention_mask],
+                    dim=1,
+                )
+            self._cache = _concat_caches(self._cache, cache)
+            self._attention_mask = torch.cat([self._attention_mask, mask], dim=0)
+        self._active.append(seq)
+
+    def _decode_step(self) -> None:
+        """Feed every active sequence's last token through one batched forward."""
+        input_ids = torch.tensor([[seq.tokens[-1]] for seq in self._active], dtype=torch.long, device=self.device)
+        # the pending token sits at position len(tokens) - 1 of its own sequence
+        position_ids = torch.tensor(
+            [[len(seq.tokens) - 1] for seq in self._active], dtype=torch.long, device=self.device
+        )
+        self._attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(self._active), 1))], dim=1
+        )
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=self._attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._cache,
+            use_cache=True,
+            return_dict=True,
+        )
+        self._cache = outputs.past_key_values
+        logits = outputs.logits[:, -1]
+        for row, seq in enumerate(self._active):
+            self._append(seq, self._ban_and_pick(seq, logits[row]))
+
+    def _retire(self) -> Iterator[Dict]:
+        """Remove finished sequences from the batch and trim columns that are padding in every row."""
+        finished = [seq for seq in self._active if seq.finished]
+        if not finished:
+            return
+        keep = [row for row, seq in enumerate(self._active) if not seq.finished]
+        self._active = [self._active[row] for row in keep]
+
+        if not keep:
+            self._cache, self._attention_mask = None, None
+        else:
+            rows = torch.tensor(keep, dtype=torch.long, device=self.device)
+            mask = self._attention_mask[rows]
+            # leading columns that are padding for every remaining row
+            start = int(mask.cumsum(dim=1).eq(0).all(dim=0).sum())
+            _slice_cache(self._cache, rows, start)
+            self._attention_mask = mask[:, start:]
+
+        for seq in finished:
+            generated = seq.tokens[seq.prompt_length:]
+            if generated and generated[-1] == self.eos_token_id:
+                generated = generated[:-1]
+            yield {
+                'request_id': seq.request_id,
+                'text': self.tokenizer.decode(generated, skip_special_tokens=False).strip(),
+                'num_tokens': len(generated),
+            }
+
+
+def process_images_batched(
+    image_paths: List[str],
+    max_batch_size: int = 4,
+    prompt: str = PROMPT,
+) -> Dict[str, str]:
+    """
+    Run OCR on several images with continuous batching.
+
+    Args:
+        image_paths: Input images
+        max_batch_size: Maximum number of pages decoded together
+        prompt: Prompt used for every page
+
+    Returns:
+        Mapping of image path to raw model output (with grounding references)
+    """
+    engine = ContinuousBatchingEngine(max_batch_size=max_batch_size)
+    for image_path in image_paths:
+        engine.submit(image_path, image_path, prompt=prompt)
+    return {result['request_id']: result['text'] for result in engine.run()}
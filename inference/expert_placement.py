@@ -0,0 +1,204 @@
+"""Expert placement driven by observed MoE routing statistics.
+
+Routing statistics come from a calibration run with
+inference.profiling.DecoderProfiler (save_expert_stats). The hot experts
+that cover most routed tokens stay resident; the cold ones are either
+memory-mapped from disk, so the OS pages them in on demand and can evict
+them again, or dropped entirely with the gate renormalising over the rest.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+
+def load_expert_stats(path: str) -> Dict[int, List[int]]:
+    """
+    Load routing statistics written by DecoderProfiler.save_expert_stats.
+
+    Returns:
+        Mapping of decoder layer index to per-expert routed token counts
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        stats = json.load(f)
+    return {int(layer): counts for layer, counts in stats['layers'].items()}
+
+
+def select_hot_experts(counts: List[int], coverage: float = 0.99, min_experts: int = 1) -> List[int]:
+    """
+    Pick the most used experts until they cover the given share of routed tokens.
+
+    Args:
+        counts: Routed token count per expert
+        coverage: Share of routed tokens the hot set must cover (0-1)
+        min_experts: Lower bound on the number of hot experts (e.g. num_experts_per_tok)
+
+    Returns:
+        Sorted list of hot expert ids
+    """
+    order = sorted(range(len(counts)), key=lambda expert: counts[expert], reverse=True)
+    total = sum(counts)
+    hot, covered = [], 0
+    for expert in order:
+        if len(hot) >= min_experts and total and covered >= coverage * total:
+            break
+        hot.append(expert)
+        covered += counts[expert]
+    return sorted(hot)
+
+
+def _moe_layers(model: torch.nn.Module) -> Dict[int, torch.nn.Module]:
+    """Decoder layer index -> DeepseekV2MoE block (dense layers are skipped)."""
+    decoder = model.model if hasattr(model, 'model') else model
+    return {
+        layer_idx: layer.mlp
+        for layer_idx, layer in enumerate(decoder.layers)
+        if type(layer.mlp).__name__ == 'DeepseekV2MoE'
+    }
+
+
+def _cold_experts(moe: torch.nn.Module, counts: List[int], coverage: float) -> List[int]:
+    hot = set(select_hot_experts(counts, coverage, min_experts=moe.num_experts_per_tok))
+    return [expert for expert in range(len(moe.experts)) if expert not in hot and moe.experts[expert] is not None]
+
+
+def drop_cold_experts(model: torch.nn.Module, stats: Dict[int, List[int]], coverage: float = 0.99) -> Dict[int, List[int]]:
+    """
+    Remove the experts outside the hot set of every MoE layer.
+
+    The gate stops routing to them and renormalises topk_weight over the
+    remaining experts, which changes model outputs for inputs unlike the
+    calibration pages.
+
+    Returns:
+        Mapping of layer index to dropped expert ids
+    """
+    dropped = {}
+    for layer_idx, moe in _moe_layers(model).items():
+        if layer_idx not in stats:
+            continue
+        cold = _cold_experts(moe, stats[layer_idx], coverage)
+        if cold:
+            moe.drop_experts(cold)
+            dropped[layer_idx] = cold
+    return dropped
+
+
+def _matches_file(path: Path, state_dict: Dict[str, torch.Tensor]) -> bool:
+    """Whether path already holds exactly these tensors."""
+    if not path.is_file():
+        return False
+    try:
+        existing = torch.load(path, mmap=True, weights_only=True)
+    except Exception:
+        return False
+    return existing.keys() == state_dict.keys() and all(
+        existing[name].dtype == tensor.dtype and existing[name].shape == tensor.shape
+        and torch.equal(existing[name], tensor)
+        for name, tensor in state_dict.items()
+    )
+
+
+def _save_atomic(state_dict: Dict[str, torch.Tensor], path: Path):
+    """torch.save to a temporary file next to path and move it into place."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            torch.save(state_dict, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def offload_cold_experts(
+    model: torch.nn.Module,
+    stats: Dict[int, List[int]],
+    offload_dir: str,
+    coverage: float = 0.99,
+    hot_dtype: Optional[torch.dtype] = torch.bfloat16,
+    cold_dtype: Optional[torch.dtype] = torch.bfloat16,
+) -> Dict[int, List[int]]:
+    """
+    Keep hot experts resident and memory-map cold experts from disk.
+
+    Cold expert weights are written to offload_dir and reloaded with
+    torch.load(mmap=True), so their pages are only read when a token is
+    routed to them. Routing itself is unchanged. A file that already holds
+    the same weights is reused. Other files are replaced atomically, so
+    processes sharing offload_dir never map a partly written file. The model must run under
+    bf16 autocast (as infer() does) when dtypes are changed.
+
+    Args:
+        model: DeepseekOCRForCausalLM (or its decoder)
+        stats: Output of load_expert_stats
+        offload_dir: Directory for the per-expert weight files
+        coverage: Share of routed tokens the resident experts must cover
+        hot_dtype: dtype for resident experts (None keeps the loaded dtype)
+        cold_dtype: dtype for offloaded experts (None keeps the loaded dtype)
+
+    Returns:
+        Mapping of layer index to offloaded expert ids
+    """
+    offload_dir = Path(offload_dir)
+    offload_dir.mkdir(parents=True, exist_ok=True)
+
+    offloaded = {}
+    for layer_idx, moe in _moe_layers(model).items():
+        if layer_idx not in stats:
+            continue
+        cold = _cold_experts(moe, stats[layer_idx], coverage)
+        for expert_id, expert in enumerate(moe.experts):
+            if expert is None:
+                continue
+            if expert_id not in cold:
+                if hot_dtype is not None:
+                    expert.to(hot_dtype)
+                continue
+            state_dict = {
+                name: (tensor.to(cold_dtype) if cold_dtype is not None else tensor).contiguous()
+                for name, tensor in expert.state_dict().items()
+            }
+            dtype_name = str(next(iter(state_dict.values())).dtype).replace('torch.', '')
+            path = offload_dir / f'layer_{layer_idx:02d}_expert_{expert_id:03d}_{dtype_name}.pt'
+            if not _matches_file(path, state_dict):
+                _save_atomic(state_dict, path)
+            del state_dict
+            expert.load_state_dict(torch.load(path, mmap=True, weights_only=True), assign=True)
+        if cold:
+            offloaded[layer_idx] = cold
+    return offloaded
+
+
+def apply_expert_placement(
+    model: torch.nn.Module,
+    stats_path: str,
+    mode: str = 'offload',
+    coverage: float = 0.99,
+    offload_dir: Optional[str] = None,
+) -> Dict[int, List[int]]:
+    """
+    Apply offload_cold_experts or drop_cold_experts from a statistics file.
+
+    Args:
+        model: DeepseekOCRForCausalLM
+        stats_path: JSON written by DecoderProfiler.save_expert_stats
+        mode: 'offload' or 'drop'
+        coverage: Share of routed tokens the kept experts must cover
+        offload_dir: Required for 'offload'
+
+    Returns:
+        Mapping of layer index to affected expert ids
+    """
+    stats = load_expert_stats(stats_path)
+    if mode == 'offload':
+        if offload_dir is None:
+            raise ValueError("offload_dir is required for mode='offload'")
+        return offload_cold_experts(model, stats, offload_dir, coverage=coverage)
+    if mode == 'drop':
+        return drop_cold_experts(model, stats, coverage=coverage)
+    raise ValueError(f"Unknown expert placement mode: {mode}")
@@ -7,7 +7,10 @@ including bounding boxes, element metadata, and type-specific overlays.
 
 __version__ = "0.1.0"
 
-from .element_extractor import extract_all_elements, extract_element_content
+from .element_extractor import extract_all_elements, extract_element_content, build_element
+from .element_store import ElementStore
+from .spatial_index import SpatialIndex
+from .grounding_parser import GroundingStreamParser, GroundingRef, iter_grounding_refs, parse_coordinate_list
 from .bbox_processor import (
     normalize_bbox,
     denormalize_bbox,
@@ -16,13 +19,28 @@ from .bbox_processor import (
     add_padding,
     calculate_bbox_metrics,
     check_overlap,
+    denormalize_boxes_999,
+    validate_boxes,
+    clip_boxes_to_image,
+    boxes_metrics,
+    iou_matrix,
+    process_model_boxes,
+    non_max_suppression,
+    merge_overlapping_boxes,
 )
 from .image_cropper import crop_and_save_element, save_all_elements
-from .overlay_generator import generate_type_overlays, generate_type_overlay
+from .overlay_generator import generate_type_overlays, generate_type_overlay, PageRenderContext
 
 __all__ = [
     "extract_all_elements",
     "extract_element_content",
+    "build_element",
+    "ElementStore",
+    "SpatialIndex",
+    "GroundingStreamParser",
+    "GroundingRef",
+    "iter_grounding_refs",
+    "parse_coordinate_list",
     "normalize_bbox",
     "denormalize_bbox",
     "denormalize_bbox_999",
@@ -30,8 +48,17 @@ __all__ = [
     "add_padding",
     "calculate_bbox_metrics",
     "check_overlap",
+    "denormalize_boxes_999",
+    "validate_boxes",
+    "clip_boxes_to_image",
+    "boxes_metrics",
+    "iou_matrix",
+    "process_model_boxes",
+    "non_max_suppression",
+    "merge_overlapping_boxes",
     "crop_and_save_element",
     "save_all_elements",
     "generate_type_overlays",
     "generate_type_overlay",
+    "PageRenderContext",
 ]
@@ -3,10 +3,222 @@ Bounding box processing utilities.
 
 Provides functions for coordinate transformations, validation,
 and geometric operations on bounding boxes.
+
+The *_boxes functions work on (N, 4) arrays of x1, y1, x2, y2 rows and are
+what the extraction pipeline uses; the dict functions are single-box
+wrappers around them.
 """
 
 from typing import Dict, Tuple, Optional
 
+import numpy as np
+
+
+def _box_array(bbox: Dict[str, float]) -> np.ndarray:
+    """(1, 4) array from a bbox dict."""
+    return np.array([[bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']]])
+
+
+def _box_dict(row) -> Dict:
+    x1, y1, x2, y2 = row.tolist()
+    return {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
+
+
+def denormalize_boxes_999(boxes: np.ndarray, image_width: int, image_height: int) -> np.ndarray:
+    """
+    Convert (N, 4) DeepSeek model coordinates (0-999) to absolute pixels.
+    
+    Values are truncated toward zero like int().
+    
+    Returns:
+        (N, 4) int64 array
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scale = np.array([image_width, image_height, image_width, image_height], dtype=np.float64)
+    return np.trunc(boxes / 999 * scale).astype(np.int64)
+
+
+def validate_boxes(
+    boxes: np.ndarray,
+    image_width: int,
+    image_height: int,
+    allow_out_of_bounds: bool = False
+) -> np.ndarray:
+    """
+    Boolean mask of valid boxes (ordered corners, non-negative, optionally inside the image).
+    
+    Args:
+        boxes: (N, 4) array
+        image_width: Image width in pixels
+        image_height: Image height in pixels
+        allow_out_of_bounds: If True, allow boxes partially outside image
+    
+    Returns:
+        (N,) bool array
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    valid = (x1 < x2) & (y1 < y2) & (x1 >= 0) & (y1 >= 0)
+    if not allow_out_of_bounds:
+        valid &= (x2 <= image_width) & (y2 <= image_height)
+    return valid
+
+
+def clip_boxes_to_image(boxes: np.ndarray, image_width: int, image_height: int) -> np.ndarray:
+    """Clip (N, 4) boxes to the image; the dtype is kept."""
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    upper = np.array([image_width, image_height, image_width, image_height], dtype=boxes.dtype)
+    return np.clip(boxes, 0, upper)
+
+
+def boxes_metrics(boxes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Width, height, area and aspect ratio of (N, 4) boxes.
+    
+    Returns:
+        Dictionary of (N,) arrays: width, height, area, aspect_ratio
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    width = boxes[:, 2] - boxes[:, 0]
+    height = boxes[:, 3] - boxes[:, 1]
+    aspect_ratio = np.divide(
+        width, height, out=np.zeros(len(boxes), dtype=np.float64), where=height > 0
+    )
+    return {
+        'width': width,
+        'height': height,
+        'area': width * height,
+        'aspect_ratio': aspect_ratio,
+    }
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    All-pairs IoU between two sets of boxes.
+    
+    Args:
+        boxes_a: (N, 4) array
+        boxes_b: (M, 4) array (default: boxes_a)
+    
+    Returns:
+        (N, M) float64 array of IoU values in [0,1]
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = boxes_a if boxes_b is None else np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    
+    inter_w = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2]) - np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    inter_h = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3]) - np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    inter = np.where((inter_w > 0) & (inter_h > 0), inter_w * inter_h, 0.0)
+    
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    iou_threshold: float,
+    labels: Optional[np.ndarray] = None,
+    scores: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Greedy IoU-based non-maximum suppression.
+    
+    Boxes are visited by descending score (by position when scores is None,
+    so earlier boxes win) and suppress every later box with the same label
+    whose IoU reaches iou_threshold.
+    
+    Args:
+        boxes: (N, 4) array
+        iou_threshold: IoU at which a box counts as a duplicate
+        labels: (N,) labels; only boxes with equal labels suppress each other
+        scores: (N,) priority of each box
+    
+    Returns:
+        (N,) bool mask of boxes to keep
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    order = np.arange(len(boxes)) if scores is None else np.argsort(-np.asarray(scores), kind='stable')
+    duplicate = iou_matrix(boxes[order]) >= iou_threshold
+    if labels is not None:
+        ordered_labels = np.asarray(labels)[order]
+        duplicate &= ordered_labels[:, None] == ordered_labels[None, :]
+    
+    keep_sorted = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if keep_sorted[i]:
+            keep_sorted[i + 1:] &= ~duplicate[i, i + 1:]
+    
+    keep = np.empty(len(boxes), dtype=bool)
+    keep[order] = keep_sorted
+    return keep
+
+
+def merge_overlapping_boxes(boxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Replace every group of boxes connected by IoU >= iou_threshold with its union box.
+    
+    Args:
+        boxes: (N, 4) array
+        iou_threshold: IoU at which two boxes are merged
+    
+    Returns:
+        (M, 4) array, M <= N, in order of each group's first box
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    if len(boxes) < 2:
+        return boxes
+    
+    connected = (iou_matrix(boxes) >= iou_threshold) | np.eye(len(boxes), dtype=bool)
+    group = np.arange(len(boxes))
+    # propagate the smallest connected index until groups are stable
+    while True:
+        merged = np.where(connected, group[None, :], len(boxes)).min(axis=1)
+        if np.array_equal(merged, group):
+            break
+        group = merged
+    
+    # group ids are the smallest member index, so np.unique keeps first-box order
+    roots, inverse = np.unique(group, return_inverse=True)
+    union = boxes[roots].copy()
+    np.minimum.at(union[:, 0], inverse, boxes[:, 0])
+    np.minimum.at(union[:, 1], inverse, boxes[:, 1])
+    np.maximum.at(union[:, 2], inverse, boxes[:, 2])
+    np.maximum.at(union[:, 3], inverse, boxes[:, 3])
+    return union
+
+
+def process_model_boxes(
+    boxes_999: np.ndarray,
+    image_width: int,
+    image_height: int,
+    min_width: float = 10,
+    min_height: float = 10,
+    validate_strict: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Denormalise, validate, clip and size-filter model boxes in one call.
+    
+    Args:
+        boxes_999: (N, 4) boxes in model coordinates (0-999 range)
+        image_width: Image width in pixels
+        image_height: Image height in pixels
+        min_width: Minimum box width in pixels
+        min_height: Minimum box height in pixels
+        validate_strict: Drop boxes that fail validate_boxes before clipping
+    
+    Returns:
+        Tuple of (N, 4) int64 clipped pixel boxes and (N,) bool mask of boxes to keep
+    """
+    boxes = denormalize_boxes_999(boxes_999, image_width, image_height)
+    keep = np.ones(len(boxes), dtype=bool)
+    if validate_strict:
+        keep &= validate_boxes(boxes, image_width, image_height, allow_out_of_bounds=True)
+    boxes = clip_boxes_to_image(boxes, image_width, image_height)
+    keep &= (boxes[:, 2] - boxes[:, 0] >= min_width) & (boxes[:, 3] - boxes[:, 1] >= min_height)
+    return boxes, keep
+
 
 def normalize_bbox(
     bbox: Dict[str, float],
@@ -75,12 +287,7 @@ def denormalize_bbox_999(
     Returns:
         Bounding box with absolute pixel coordinates
     """
-    return {
-        'x1': int(bbox['x1'] / 999 * image_width),
-        'y1': int(bbox['y1'] / 999 * image_height),
-        'x2': int(bbox['x2'] / 999 * image_width),
-        'y2': int(bbox['y2'] / 999 * image_height),
-    }
+    return _box_dict(denormalize_boxes_999(_box_array(bbox), image_width, image_height)[0])
 
 
 def validate_bbox(
@@ -102,22 +309,7 @@ def validate_bbox(
         True if bbox is valid, False otherwise
     """
     try:
-        x1, y1, x2, y2 = bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']
-        
-        # Check valid ordering
-        if x1 >= x2 or y1 >= y2:
-            return False
-        
-        # Check non-negative
-        if x1 < 0 or y1 < 0:
-            return False
-        
-        # Check bounds
-        if not allow_out_of_bounds:
-            if x2 > image_width or y2 > image_height:
-                return False
-        
-        return True
+        return bool(validate_boxes(_box_array(bbox), image_width, image_height, allow_out_of_bounds)[0])
     except (KeyError, TypeError):
         return False
 
@@ -158,17 +350,8 @@ def calculate_bbox_metrics(bbox: Dict[str, float]) -> Dict[str, float]:
     Returns:
         Dictionary with metrics: width, height, area, aspect_ratio
     """
-    width = bbox['x2'] - bbox['x1']
-    height = bbox['y2'] - bbox['y1']
-    area = width * height
-    aspect_ratio = width / height if height > 0 else 0.0
-    
-    return {
-        'width': width,
-        'height': height,
-        'area': area,
-        'aspect_ratio': aspect_ratio,
-    }
+    metrics = boxes_metrics(_box_array(bbox))
+    return {key: values[0].item() for key, values in metrics.items()}
 
 
 def check_overlap(bbox1: Dict[str, float], bbox2: Dict[str, float]) -> float:
@@ -182,26 +365,7 @@ def check_overlap(bbox1: Dict[str, float], bbox2: Dict[str, float]) -> float:
     Returns:
         IoU value in [0,1], where 0 = no overlap, 1 = complete overlap
     """
-    # Calculate intersection coordinates
-    x1_inter = max(bbox1['x1'], bbox2['x1'])
-    y1_inter = max(bbox1['y1'], bbox2['y1'])
-    x2_inter = min(bbox1['x2'], bbox2['x2'])
-    y2_inter = min(bbox1['y2'], bbox2['y2'])
-    
-    # Check if there is an intersection
-    if x1_inter >= x2_inter or y1_inter >= y2_inter:
-        return 0.0
-    
-    # Calculate areas
-    inter_area = (x2_inter - x1_inter) * (y2_inter - y1_inter)
-    bbox1_area = (bbox1['x2'] - bbox1['x1']) * (bbox1['y2'] - bbox1['y1'])
-    bbox2_area = (bbox2['x2'] - bbox2['x1']) * (bbox2['y2'] - bbox2['y1'])
-    union_area = bbox1_area + bbox2_area - inter_area
-    
-    # Calculate IoU
-    iou = inter_area / union_area if union_area > 0 else 0.0
-    
-    return iou
+    return float(iou_matrix(_box_array(bbox1), _box_array(bbox2))[0, 0])
 
 
 def clip_bbox_to_image(
@@ -220,9 +384,4 @@ def clip_bbox_to_image(
     Returns:
         Clipped bounding box
     """
-    return {
-        'x1': max(0, min(bbox['x1'], image_width)),
-        'y1': max(0, min(bbox['y1'], image_height)),
-        'x2': max(0, min(bbox['x2'], image_width)),
-        'y2': max(0, min(bbox['y2'], image_height)),
-    }
+    return _box_dict(clip_boxes_to_image(_box_array(bbox), image_width, image_height)[0])
@@ -5,17 +5,13 @@ Parses grounding references from DeepSeek OCR output and extracts
 individual elements with metadata and bounding boxes.
 """
 
-import re
 from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 from PIL import Image
+import numpy as np
 
-from .bbox_processor import (
-    denormalize_bbox_999,
-    validate_bbox,
-    calculate_bbox_metrics,
-    clip_bbox_to_image,
-)
+from .bbox_processor import merge_overlapping_boxes, non_max_suppression, process_model_boxes
+from .grounding_parser import iter_grounding_refs, parse_coordinate_list
 
 
 def parse_grounding_references(text: str) -> List[Tuple[str, str]]:
@@ -30,9 +26,7 @@ def parse_grounding_references(text: str) -> List[Tuple[str, str]]:
     Returns:
         List of tuples (label_type, coordinates_str)
     """
-    pattern = r'<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>'
-    matches = re.findall(pattern, text, re.DOTALL)
-    return matches
+    return [(ref.label, ref.coords) for ref in iter_grounding_refs(text)]
 
 
 def parse_coordinates(coords_str: str) -> Optional[List[List[float]]]:
@@ -45,14 +39,109 @@ def parse_coordinates(coords_str: str) -> Optional[List[List[float]]]:
     Returns:
         List of bounding boxes, each as [x1, y1, x2, y2], or None if invalid
     """
-    try:
-        coords = eval(coords_str)
-        if isinstance(coords, list):
-            return coords
-        return None
-    except Exception as e:
-        print(f"Warning: Failed to parse coordinates: {e}")
+    coords = parse_coordinate_list(coords_str)
+    if coords is None:
+        print(f"Warning: Failed to parse coordinates: {coords_str!r}")
+    return coords
+
+
+def build_element(
+    label_type: str,
+    coords_list: List[List[float]],
+    image_width: int,
+    image_height: int,
+    page_number: int,
+    element_index: int,
+    extract_options: Optional[Dict] = None,
+    span: Optional[Tuple[int, int]] = None
+) -> Optional[Dict]:
+    """
+    Build one element dictionary from a parsed grounding reference.
+    
+    Args:
+        label_type: Element type from the <|ref|> tag
+        coords_list: Bounding boxes in model coordinates (0-999 range)
+        image_width: Source image width in pixels
+        image_height: Source image height in pixels
+        page_number: Page number in document (1-indexed)
+        element_index: Index of the element on the page
+        extract_options: Extraction configuration (see extract_all_elements)
+        span: (start, end) offsets of the reference in the model output, kept as 'source_span'
+    
+    Returns:
+        Element dictionary, or None if no bounding box survives validation
+    """
+    options = extract_options or {}
+    
+    boxes, keep = process_model_boxes(
+        _model_boxes(coords_list),
+        image_width,
+        image_height,
+        min_width=options.get('min_width', 10),
+        min_height=options.get('min_height', 10),
+        validate_strict=options.get('validate_strict', False),
+    )
+    return _element_from_boxes(
+        label_type, boxes[keep], image_width, image_height, page_number, element_index, span
+    )
+
+
+def _model_boxes(coords_list: List[List[float]]) -> np.ndarray:
+    """(k, 4) array of the 4-value entries in a parsed coordinate list."""
+    rows = [coords for coords in coords_list if isinstance(coords, list) and len(coords) == 4]
+    return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def _element_from_boxes(
+    label_type: str,
+    boxes: np.ndarray,
+    image_width: int,
+    image_height: int,
+    page_number: int,
+    element_index: int,
+    span: Optional[Tuple[int, int]] = None
+) -> Optional[Dict]:
+    """Element dictionary from its validated (k, 4) pixel boxes."""
+    # Skip if no valid boxes
+    if not len(boxes):
         return None
+    
+    # Calculate metrics
+    total_area = int(((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])).sum())
+    
+    # Overall bounding box (union of all boxes)
+    overall_width = int(boxes[:, 2].max() - boxes[:, 0].min())
+    overall_height = int(boxes[:, 3].max() - boxes[:, 1].min())
+    overall_aspect_ratio = overall_width / overall_height if overall_height > 0 else 0.0
+    
+    keys = ('x1', 'y1', 'x2', 'y2')
+    scale = np.array([image_width, image_height, image_width, image_height], dtype=np.float64)
+    bounding_boxes = [dict(zip(keys, row)) for row in boxes.tolist()]
+    # Normalize bounding boxes to 0-1 range
+    bounding_boxes_normalized = [dict(zip(keys, row)) for row in (boxes / scale).tolist()]
+    
+    element = {
+        'id': f'page_{page_number:04d}_elem_{element_index:04d}',
+        'type': label_type,
+        'page': page_number,
+        'index': element_index,
+        'bounding_boxes': bounding_boxes,
+        'bounding_boxes_normalized': bounding_boxes_normalized,
+        'metrics': {
+            'num_boxes': len(bounding_boxes),
+            'total_area': total_area,
+            'width': overall_width,
+            'height': overall_height,
+            'aspect_ratio': overall_aspect_ratio,
+        },
+        'image_dimensions': {
+            'width': image_width,
+            'height': image_height,
+        },
+    }
+    if span is not None:
+        element['source_span'] = {'start': span[0], 'end': span[1]}
+    return element
 
 
 def extract_all_elements(
@@ -73,6 +162,10 @@ def extract_all_elements(
             - min_width: int, minimum element width (default: 10)
             - min_height: int, minimum element height (default: 10)
             - validate_strict: bool, reject invalid bboxes (default: False)
+            - merge_iou: float, merge boxes of one element that overlap at or
+              above this IoU into their union (default: None, disabled)
+            - nms_iou: float, drop an element when an earlier element of the
+              same type overlaps it at or above this IoU (default: None, disabled)
     
     Returns:
         List of element dictionaries with structure:
@@ -91,112 +184,65 @@ def extract_all_elements(
                 'aspect_ratio': float,
             },
             'image_dimensions': {'width': int, 'height': int},
+            'source_span': {'start': int, 'end': int},  # offsets in model_output
         }
     """
-    options = extract_options or {}
-    padding = options.get('padding', 0)
-    min_width = options.get('min_width', 10)
-    min_height = options.get('min_height', 10)
-    validate_strict = options.get('validate_strict', False)
-    
     image_width, image_height = image.size
     
-    # Parse grounding references
-    grounding_refs = parse_grounding_references(model_output)
-    
-    elements = []
-    element_index = 0
+    options = extract_options or {}
     
-    for label_type, coords_str in grounding_refs:
-        # Parse coordinates
-        coords_list = parse_coordinates(coords_str)
-        if coords_list is None:
+    # Grounding references and their coordinates are parsed in a single pass
+    refs = []
+    for ref in iter_grounding_refs(model_output):
+        if ref.boxes is None:
+            print(f"Warning: Failed to parse coordinates: {ref.coords!r}")
             continue
-        
-        # Convert to absolute pixels and validate
-        bounding_boxes = []
-        for coords in coords_list:
-            if len(coords) != 4:
-                continue
-            
-            # Create bbox dict from model coordinates (0-999 range)
-            bbox_model = {
-                'x1': coords[0],
-                'y1': coords[1],
-                'x2': coords[2],
-                'y2': coords[3],
-            }
-            
-            # Convert to absolute pixels
-            bbox_abs = denormalize_bbox_999(bbox_model, image_width, image_height)
-            
-            # Validate
-            if not validate_bbox(bbox_abs, image_width, image_height, allow_out_of_bounds=True):
-                if validate_strict:
-                    continue
-            
-            # Clip to image bounds
-            bbox_abs = clip_bbox_to_image(bbox_abs, image_width, image_height)
-            
-            # Check minimum size
-            width = bbox_abs['x2'] - bbox_abs['x1']
-            height = bbox_abs['y2'] - bbox_abs['y1']
-            if width < min_width or height < min_height:
-                continue
-            
-            bounding_boxes.append(bbox_abs)
-        
+        refs.append(ref)
+    
+    # Denormalise, validate and clip every box on the page at once
+    ref_boxes = [_model_boxes(ref.boxes) for ref in refs]
+    all_boxes = np.concatenate(ref_boxes) if ref_boxes else np.zeros((0, 4))
+    boxes, keep = process_model_boxes(
+        all_boxes,
+        image_width,
+        image_height,
+        min_width=options.get('min_width', 10),
+        min_height=options.get('min_height', 10),
+        validate_strict=options.get('validate_strict', False),
+    )
+    offsets = np.cumsum([0] + [len(b) for b in ref_boxes])
+    
+    candidates = []
+    for ref, start, end in zip(refs, offsets[:-1], offsets[1:]):
+        element_boxes = boxes[start:end][keep[start:end]]
         # Skip if no valid boxes
-        if not bounding_boxes:
+        if not len(element_boxes):
             continue
-        
-        # Calculate metrics
-        total_area = sum((b['x2'] - b['x1']) * (b['y2'] - b['y1']) for b in bounding_boxes)
-        
-        # Calculate overall bounding box (union of all boxes)
-        min_x1 = min(b['x1'] for b in bounding_boxes)
-        min_y1 = min(b['y1'] for b in bounding_boxes)
-        max_x2 = max(b['x2'] for b in bounding_boxes)
-        max_y2 = max(b['y2'] for b in bounding_boxes)
-        
-        overall_width = max_x2 - min_x1
-        overall_height = max_y2 - min_y1
-        overall_aspect_ratio = overall_width / overall_height if overall_height > 0 else 0.0
-        
-        # Normalize bounding boxes to 0-1 range
-        bounding_boxes_normalized = [
-            {
-                'x1': b['x1'] / image_width,
-                'y1': b['y1'] / image_height,
-                'x2': b['x2'] / image_width,
-                'y2': b['y2'] / image_height,
-            }
-            for b in bounding_boxes
-        ]
-        
-        # Create element dict
-        element = {
-            'id': f'page_{page_number:04d}_elem_{element_index:04d}',
-            'type': label_type,
-            'page': page_number,
-            'index': element_index,
-            'bounding_boxes': bounding_boxes,
-            'bounding_boxes_normalized': bounding_boxes_normalized,
-            'metrics': {
-                'num_boxes': len(bounding_boxes),
-                'total_area': total_area,
-                'width': overall_width,
-                'height': overall_height,
-                'aspect_ratio': overall_aspect_ratio,
-            },
-            'image_dimensions': {
-                'width': image_width,
-                'height': image_height,
-            },
-        }
-        
-        elements.append(element)
-        element_index += 1
+        if options.get('merge_iou') is not None:
+            element_boxes = merge_overlapping_boxes(element_boxes, options['merge_iou'])
+        candidates.append((ref, element_boxes))
+    
+    # Drop repeated elements of the same type before anything is cropped or drawn
+    if options.get('nms_iou') is not None and candidates:
+        union_boxes = np.array([
+            (b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max()) for _, b in candidates
+        ])
+        labels = np.array([ref.label for ref, _ in candidates], dtype=object)
+        kept = non_max_suppression(union_boxes, options['nms_iou'], labels=labels)
+        candidates = [candidate for candidate, k in zip(candidates, kept) if k]
+    
+    elements = [
+        _element_from_boxes(
+            ref.label,
+            element_boxes,
+            image_width,
+            image_height,
+            page_number,
+            element_index,
+            span=(ref.start, ref.end),
+        )
+        for element_index, (ref, element_boxes) in enumerate(candidates)
+    ]
     
     return elements
 
@@ -0,0 +1,322 @@
+"""
+Columnar element storage.
+
+Holds extraction results as a struct of NumPy arrays instead of one nested
+dict per element: int32 pixel boxes for all elements back to back, per-element
+offsets into them, label ids into a shared label list, page numbers and page
+indices. Dict views matching build_element output are produced on demand.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .spatial_index import SpatialIndex
+
+
+class ElementStore:
+    """
+    Struct-of-arrays container for extracted elements.
+    
+    Element i owns boxes[box_offsets[i]:box_offsets[i + 1]].
+    
+    Example:
+        store = ElementStore.from_elements(elements)
+        tables = store.select(store.label_mask('table'))
+        unions = tables.union_boxes()
+        first = tables[0]  # same dict layout as extract_all_elements
+    """
+    
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        box_offsets: np.ndarray,
+        label_ids: np.ndarray,
+        labels: Sequence[str],
+        pages: np.ndarray,
+        indices: np.ndarray,
+        page_sizes: Dict[int, Tuple[int, int]],
+        spans: Optional[np.ndarray] = None
+    ):
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.box_offsets = np.asarray(box_offsets, dtype=np.int64)
+        self.label_ids = np.asarray(label_ids, dtype=np.int32)
+        self.labels = list(labels)
+        self.pages = np.asarray(pages, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.page_sizes = dict(page_sizes)
+        # (start, end) offsets into the page's model output, -1 when unknown
+        self.spans = (
+            np.full((len(self.label_ids), 2), -1, dtype=np.int64) if spans is None
+            else np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        )
+    
+    @classmethod
+    def empty(cls) -> 'ElementStore':
+        """Store with no elements."""
+        return cls(
+            np.zeros((0, 4), dtype=np.int32),
+            np.zeros(1, dtype=np.int64),
+            np.zeros(0, dtype=np.int32),
+            [],
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.int32),
+            {},
+        )
+    
+    @classmethod
+    def from_elements(cls, elements: Iterable[Dict]) -> 'ElementStore':
+        """
+        Build a store from element dicts (as returned by extract_all_elements).
+        
+        Args:
+            elements: Element dictionaries, possibly from several pages
+        
+        Returns:
+            ElementStore with the same elements in the same order
+        """
+        boxes = []
+        box_offsets = [0]
+        label_ids = []
+        label_index = {}
+        pages = []
+        indices = []
+        spans = []
+        page_sizes = {}
+        
+        for element in elements:
+            for bbox in element['bounding_boxes']:
+                boxes.append((bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']))
+            box_offsets.append(len(boxes))
+            label_ids.append(label_index.setdefault(element['type'], len(label_index)))
+            pages.append(element['page'])
+            indices.append(element['index'])
+            dims = element['image_dimensions']
+            page_sizes[element['page']] = (dims['width'], dims['height'])
+            span = element.get('source_span')
+            spans.append((span['start'], span['end']) if span else (-1, -1))
+        
+        return cls(
+            np.array(boxes, dtype=np.int32).reshape(-1, 4),
+            np.array(box_offsets, dtype=np.int64),
+            np.array(label_ids, dtype=np.int32),
+            list(label_index),
+            np.array(pages, dtype=np.int32),
+            np.array(indices, dtype=np.int32),
+            page_sizes,
+            np.array(spans, dtype=np.int64).reshape(-1, 2),
+        )
+    
+    @classmethod
+    def concat(cls, stores: Iterable['ElementStore']) -> 'ElementStore':
+        """
+        Concatenate stores (e.g. one per page) into one, merging label dictionaries.
+        
+        Args:
+            stores: Stores to join, in order
+        
+        Returns:
+            Combined ElementStore
+        """
+        stores = [store for store in stores if len(store)]
+        if not stores:
+            return cls.empty()
+        
+        label_index = {}
+        label_ids = []
+        box_offsets = [np.zeros(1, dtype=np.int64)]
+        page_sizes = {}
+        num_boxes = 0
+        for store in stores:
+            remap = np.array(
+                [label_index.setdefault(label, len(label_index)) for label in store.labels],
+                dtype=np.int32,
+            )
+            label_ids.append(remap[store.label_ids])
+            box_offsets.append(store.box_offsets[1:] + num_boxes)
+            num_boxes += len(store.boxes)
+            page_sizes.update(store.page_sizes)
+        
+        return cls(
+            np.concatenate([store.boxes for store in stores]),
+            np.concatenate(box_offsets),
+            np.concatenate(label_ids),
+            list(label_index),
+            np.concatenate([store.pages for store in stores]),
+            np.concatenate([store.indices for store in stores]),
+            page_sizes,
+            np.concatenate([store.spans for store in stores]),
+        )
+    
+    def __len__(self) -> int:
+        return len(self.label_ids)
+    
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+    
+    def __getitem__(self, i: int) -> Dict:
+        """Dict view of element i, laid out like build_element output."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        
+        page = int(self.pages[i])
+        image_width, image_height = self.page_sizes[page]
+        element_boxes = self.element_boxes(i).astype(np.int64)
+        bounding_boxes = [
+            {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
+            for x1, y1, x2, y2 in element_boxes.tolist()
+        ]
+        width = int(element_boxes[:, 2].max() - element_boxes[:, 0].min())
+        height = int(element_boxes[:, 3].max() - element_boxes[:, 1].min())
+        total_area = int(((element_boxes[:, 2] - element_boxes[:, 0]) * (element_boxes[:, 3] - element_boxes[:, 1])).sum())
+        
+        element = {
+            'id': f'page_{page:04d}_elem_{int(self.indices[i]):04d}',
+            'type': self.labels[self.label_ids[i]],
+            'page': page,
+            'index': int(self.indices[i]),
+            'bounding_boxes': bounding_boxes,
+            'bounding_boxes_normalized': [
+                {
+                    'x1': b['x1'] / image_width,
+                    'y1': b['y1'] / image_height,
+                    'x2': b['x2'] / image_width,
+                    'y2': b['y2'] / image_height,
+                }
+                for b in bounding_boxes
+            ],
+            'metrics': {
+                'num_boxes': len(bounding_boxes),
+                'total_area': total_area,
+                'width': width,
+                'height': height,
+                'aspect_ratio': width / height if height > 0 else 0.0,
+            },
+            'image_dimensions': {
+                'width': image_width,
+                'height': image_height,
+            },
+        }
+        if self.spans[i, 0] >= 0:
+            element['source_span'] = {'start': int(self.spans[i, 0]), 'end': int(self.spans[i, 1])}
+        return element
+    
+    def to_elements(self) -> List[Dict]:
+        """All elements as dicts."""
+        return list(self)
+    
+    @property
+    def types(self) -> np.ndarray:
+        """Label string per element."""
+        return np.array(self.labels, dtype=object)[self.label_ids] if self.labels else np.zeros(0, dtype=object)
+    
+    @property
+    def num_boxes(self) -> np.ndarray:
+        """Number of boxes per element."""
+        return np.diff(self.box_offsets)
+    
+    @property
+    def box_owner(self) -> np.ndarray:
+        """Element index of every row in boxes."""
+        return np.repeat(np.arange(len(self)), self.num_boxes)
+    
+    def element_boxes(self, i: int) -> np.ndarray:
+        """(k, 4) boxes of element i."""
+        return self.boxes[self.box_offsets[i]:self.box_offsets[i + 1]]
+    
+    def label_mask(self, *labels: str) -> np.ndarray:
+        """Boolean mask of elements whose type is one of labels."""
+        wanted = [self.labels.index(label) for label in labels if label in self.labels]
+        return np.isin(self.label_ids, wanted)
+    
+    def page_mask(self, *pages: int) -> np.ndarray:
+        """Boolean mask of elements on the given pages."""
+        return np.isin(self.pages, pages)
+    
+    def select(self, mask: np.ndarray) -> 'ElementStore':
+        """
+        Keep a subset of elements.
+        
+        Args:
+            mask: Boolean mask or integer index array over elements
+        
+        Returns:
+            New ElementStore sharing the label dictionary
+        """
+        rows = np.flatnonzero(mask) if np.asarray(mask).dtype == bool else np.asarray(mask, dtype=np.int64)
+        counts = self.num_boxes[rows]
+        box_rows = (
+            np.concatenate([np.arange(self.box_offsets[r], self.box_offsets[r + 1]) for r in rows])
+            if len(rows) else np.zeros(0, dtype=np.int64)
+        )
+        pages = self.pages[rows]
+        return ElementStore(
+            self.boxes[box_rows],
+            np.concatenate([[0], np.cumsum(counts)]),
+            self.label_ids[rows],
+            self.labels,
+            pages,
+            self.indices[rows],
+            {int(page): self.page_sizes[int(page)] for page in np.unique(pages)},
+            self.spans[rows],
+        )
+    
+    def spatial_index(self, page: int, cell_size: Optional[float] = None) -> SpatialIndex:
+        """
+        Grid index over the boxes of one page.
+        
+        Args:
+            page: Page number
+            cell_size: Grid cell edge in pixels (default: median box edge)
+        
+        Returns:
+            SpatialIndex whose queries return element indices into this store
+        """
+        owners = self.box_owner
+        on_page = self.pages[owners] == page
+        return SpatialIndex(self.boxes[on_page], owners[on_page], cell_size)
+    
+    def union_boxes(self) -> np.ndarray:
+        """(N, 4) union box of every element."""
+        if not len(self):
+            return np.zeros((0, 4), dtype=np.int32)
+        starts = self.box_offsets[:-1]
+        union = np.empty((len(self), 4), dtype=np.int32)
+        union[:, :2] = np.minimum.reduceat(self.boxes[:, :2], starts, axis=0)
+        union[:, 2:] = np.maximum.reduceat(self.boxes[:, 2:], starts, axis=0)
+        return union
+    
+    def box_areas(self) -> np.ndarray:
+        """Area of every row in boxes."""
+        boxes = self.boxes.astype(np.int64)
+        return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    
+    def metrics(self) -> Dict[str, np.ndarray]:
+        """Per-element metrics (num_boxes, total_area, width, height, aspect_ratio) as arrays."""
+        union = self.union_boxes().astype(np.int64)
+        width = union[:, 2] - union[:, 0]
+        height = union[:, 3] - union[:, 1]
+        total_area = (
+            np.add.reduceat(self.box_areas(), self.box_offsets[:-1]) if len(self)
+            else np.zeros(0, dtype=np.int64)
+        )
+        aspect_ratio = np.divide(
+            width, height, out=np.zeros(len(self), dtype=np.float64), where=height > 0
+        )
+        return {
+            'num_boxes': self.num_boxes,
+            'total_area': total_area,
+            'width': width,
+            'height': height,
+            'aspect_ratio': aspect_ratio,
+        }
+    
+    def nbytes(self) -> int:
+        """Bytes held by the array columns."""
+        return sum(
+            array.nbytes
+            for array in (self.boxes, self.box_offsets, self.label_ids, self.pages, self.indices, self.spans)
+        )
@@ -0,0 +1,223 @@
+"""
+Single-pass grounding reference parser.
+
+The grounding format emitted by DeepSeek OCR is
+
+    <|ref|>label<|/ref|><|det|>[[x1, y1, x2, y2], ...]<|/det|>
+
+This module is the one parser for it: references are found with a linear
+scan (no regex backtracking, no repeated scans) and coordinate lists are
+read by a small tokenizer instead of eval(). The same scanner backs the
+batch API (iter_grounding_refs) and the streaming API
+(GroundingStreamParser), which reports each reference as soon as its
+closing <|/det|> arrives.
+"""
+
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+REF_OPEN = '<|ref|>'
+REF_CLOSE = '<|/ref|>'
+DET_OPEN = '<|det|>'
+DET_CLOSE = '<|/det|>'
+
+
+class GroundingRef(NamedTuple):
+    """One grounding reference found in model output."""
+
+    label: str
+    coords: str
+    # parsed coordinate list, or None if coords is malformed
+    boxes: Optional[List[List[int]]]
+    # offsets of the whole <|ref|>...<|/det|> span in the scanned text
+    start: int
+    end: int
+
+
+def parse_coordinate_list(coords_str: str) -> Optional[List[list]]:
+    """
+    Parse a nested list of numbers such as '[[12, 40, 300, 96], [5, 5, 9, 9]]'.
+
+    Args:
+        coords_str: Coordinate text between <|det|> and <|/det|>
+
+    Returns:
+        Nested lists of ints (floats if a number has a decimal point), or None if malformed
+    """
+    stack: List[list] = []
+    result = None
+    number = ''
+    expect_value = True
+
+    def flush() -> bool:
+        nonlocal number
+        if not number:
+            return True
+        try:
+            value = float(number) if '.' in number else int(number)
+        except ValueError:
+            return False
+        stack[-1].append(value)
+        number = ''
+        return True
+
+    for ch in coords_str:
+        if ch.isdigit() or ch in '.-':
+            if not stack or result is not None:
+                return None
+            number += ch
+            expect_value = False
+        elif ch == '[':
+            if result is not None or number or not expect_value:
+                return None
+            new_list: list = []
+            if stack:
+                stack[-1].append(new_list)
+            stack.append(new_list)
+            expect_value = True
+        elif ch == ']':
+            if not stack or not flush():
+                return None
+            closed = stack.pop()
+            if not stack:
+                result = closed
+            expect_value = False
+        elif ch == ',':
+            if not stack or expect_value or not flush():
+                return None
+            expect_value = True
+        elif ch.isspace():
+            if not flush():
+                return None
+        else:
+            return None
+
+    if stack or result is None:
+        return None
+    return result
+
+
+def _scan(text: str, pos: int, final: bool) -> Tuple[List[Tuple[int, int, int, int, int]], int, Optional[str]]:
+    """
+    Find complete references in text starting at pos.
+
+    Returns (refs, resume, waiting) where each ref is (start, ref_end, det_start, det_end, end)
+    offsets, resume is where scanning has to continue once more text is available and waiting
+    is the closing marker the unfinished reference at resume still lacks (None otherwise).
+    """
+    refs = []
+    while True:
+        start = text.find(REF_OPEN, pos)
+        if start < 0:
+            # keep a possible partial '<|ref|' at the end
+            return refs, len(text) if final else max(pos, len(text) - len(REF_OPEN) + 1), None
+        ref_end = text.find(REF_CLOSE, start + len(REF_OPEN))
+        if ref_end < 0:
+            return refs, len(text) if final else start, REF_CLOSE
+        det_start = ref_end + len(REF_CLOSE)
+        if not text.startswith(DET_OPEN, det_start):
+            if not final and len(text) - det_start < len(DET_OPEN) and DET_OPEN.startswith(text[det_start:]):
+                # <|det|> may still be arriving
+                return refs, start, None
+            # not followed by <|det|>; resume at the next <|ref|>
+            pos = start + len(REF_OPEN)
+            continue
+        det_end = text.find(DET_CLOSE, det_start + len(DET_OPEN))
+        if det_end < 0:
+            return refs, len(text) if final else start, DET_CLOSE
+        end = det_end + len(DET_CLOSE)
+        refs.append((start, ref_end, det_start, det_end, end))
+        pos = end
+
+
+def _make_ref(text: str, offsets: Tuple[int, int, int, int, int], base: int = 0) -> GroundingRef:
+    start, ref_end, det_start, det_end, end = offsets
+    coords = text[det_start + len(DET_OPEN):det_end]
+    return GroundingRef(
+        label=text[start + len(REF_OPEN):ref_end],
+        coords=coords,
+        boxes=parse_coordinate_list(coords),
+        start=base + start,
+        end=base + end,
+    )
+
+
+def iter_grounding_refs(text: str) -> Iterator[GroundingRef]:
+    """
+    Yield every grounding reference in text, in order, in one pass.
+
+    Args:
+        text: Raw model output
+
+    Yields:
+        GroundingRef records with offsets into text
+    """
+    refs, _, _ = _scan(text, 0, final=True)
+    for offsets in refs:
+        yield _make_ref(text, offsets)
+
+
+class GroundingStreamParser:
+    """
+    Streaming counterpart of iter_grounding_refs.
+
+    Text fed in with feed() is buffered only from the last unfinished
+    <|ref|> onward, so the scan buffer stays bounded by the longest
+    reference. While a reference is open, each chunk is only searched for
+    the closing marker it is waiting for, so the open reference is not
+    rescanned token by token. The full text is kept for get_text() only
+    with keep_text=True. Offsets in the returned records refer to the
+    concatenation of all chunks.
+
+    Example:
+        parser = GroundingStreamParser()
+        for chunk in streamer:
+            for ref in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self, keep_text: bool = False):
+        """
+        Args:
+            keep_text: Whether to keep every chunk for get_text()
+        """
+        self._buffer = ''
+        # offset of _buffer[0] in the full text
+        self._base = 0
+        # closing marker the open reference at _buffer[0] lacks, and where in _buffer to look for it
+        self._waiting: Optional[str] = None
+        self._search_from = 0
+        self.keep_text = keep_text
+        self.text = []
+
+    def feed(self, chunk: str) -> List[GroundingRef]:
+        """
+        Add a chunk of model output.
+
+        Args:
+            chunk: Newly decoded text
+
+        Returns:
+            GroundingRef records completed by this chunk
+        """
+        if self.keep_text:
+            self.text.append(chunk)
+        self._buffer += chunk
+
+        if self._waiting is not None and self._buffer.find(self._waiting, self._search_from) < 0:
+            self._search_from = max(0, len(self._buffer) - len(self._waiting) + 1)
+            return []
+
+        offsets, resume, waiting = _scan(self._buffer, 0, final=False)
+        references = [_make_ref(self._buffer, ref, self._base) for ref in offsets]
+
+        self._buffer = self._buffer[resume:]
+        self._base += resume
+        self._waiting = waiting
+        self._search_from = max(0, len(self._buffer) - len(waiting) + 1) if waiting else 0
+        return references
+
+    def get_text(self) -> str:
+        """Return all text fed so far (requires keep_text=True)."""
+        if not self.keep_text:
+            raise ValueError('GroundingStreamParser was created without keep_text=True')
+        return ''.join(self.text)
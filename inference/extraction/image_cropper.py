@@ -1,17 +1,53 @@
 """
 Image cropping utilities for element extraction.
 
-Saves individual element images with metadata.
+Saves individual element images with metadata, encoding crops in parallel.
 """
 
+import hashlib
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from PIL import Image
 
 from .element_extractor import extract_element_content
 
 
+# Written next to the crops; maps image filename to a digest of the cropped pixels
+CROP_MANIFEST = "crops_manifest.json"
+# Per-page metadata file for metadata_format='jsonl'
+METADATA_JSONL = "elements.jsonl"
+
+
+def _element_metadata(element: Dict, image_filename: str, element_image: Image.Image, padding: int) -> Dict:
+    """Metadata record stored for one cropped element."""
+    return {
+        'element_id': element['id'],
+        'type': element['type'],
+        'page': element['page'],
+        'index': element['index'],
+        'bounding_boxes': element['bounding_boxes'],
+        'bounding_boxes_normalized': element['bounding_boxes_normalized'],
+        'metrics': element['metrics'],
+        'image_dimensions': element['image_dimensions'],
+        'cropped_image': {
+            'filename': image_filename,
+            'width': element_image.width,
+            'height': element_image.height,
+            'padding': padding,
+        },
+    }
+
+
+def _crop_digest(element_image: Image.Image) -> str:
+    """Digest of the cropped pixels (mode, size and data)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{element_image.mode}:{element_image.width}x{element_image.height}".encode())
+    digest.update(element_image.tobytes())
+    return digest.hexdigest()
+
+
 def crop_and_save_element(
     image: Image.Image,
     element: Dict,
@@ -55,23 +91,7 @@ def crop_and_save_element(
             metadata_filename = f"{element_id}_{element_type}.json"
             metadata_path = output_dir / metadata_filename
             
-            # Create metadata dict
-            metadata = {
-                'element_id': element['id'],
-                'type': element['type'],
-                'page': element['page'],
-                'index': element['index'],
-                'bounding_boxes': element['bounding_boxes'],
-                'bounding_boxes_normalized': element['bounding_boxes_normalized'],
-                'metrics': element['metrics'],
-                'image_dimensions': element['image_dimensions'],
-                'cropped_image': {
-                    'filename': image_filename,
-                    'width': element_image.width,
-                    'height': element_image.height,
-                    'padding': padding,
-                },
-            }
+            metadata = _element_metadata(element, image_filename, element_image, padding)
             
             with open(metadata_path, 'w', encoding='utf-8') as f:
                 json.dump(metadata, f, indent=2)
@@ -83,33 +103,120 @@ def crop_and_save_element(
         return None
 
 
+def _write_crop(
+    image: Image.Image,
+    element: Dict,
+    output_dir: Path,
+    padding: int,
+    sidecar: bool,
+    previous: Optional[Dict[str, str]]
+) -> Optional[Tuple[Path, Dict, Optional[str]]]:
+    """Crop and encode one element; runs in a worker thread. previous is None unless skip_unchanged."""
+    try:
+        element_image = extract_element_content(image, element, padding)
+        if element_image is None:
+            return None
+        
+        image_filename = f"{element['id']}_{element['type']}.jpg"
+        image_path = output_dir / image_filename
+        digest = None
+        if previous is None:
+            element_image.save(image_path, quality=95)
+        else:
+            # Skip the JPEG encode when the same pixels were written by a previous run
+            digest = _crop_digest(element_image)
+            if previous.get(image_filename) != digest or not image_path.exists():
+                element_image.save(image_path, quality=95)
+        
+        metadata = _element_metadata(element, image_filename, element_image, padding)
+        if sidecar:
+            with open(image_path.with_suffix('.json'), 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, indent=2)
+        return image_path, metadata, digest
+    
+    except Exception as e:
+        print(f"Error saving element {element.get('id', 'unknown')}: {e}")
+        return None
+
+
 def save_all_elements(
     image: Image.Image,
     elements: list[Dict],
     output_dir: Path,
     padding: int = 0,
-    save_metadata: bool = True
+    save_metadata: bool = True,
+    metadata_format: str = 'sidecar',
+    skip_unchanged: bool = False,
+    max_workers: Optional[int] = None
 ) -> Dict[str, Path]:
     """
     Save all elements as individual images with metadata.
     
+    Crops are cut and JPEG-encoded in a thread pool (PIL releases the GIL
+    while encoding). The source image is decoded once up front, since lazily
+    opened images are not safe to decode from several threads. With
+    skip_unchanged=True a manifest of crop digests is kept alongside, so a
+    later run only re-encodes crops whose pixels changed.
+    
     Args:
         image: Source image
         elements: List of element dictionaries
         output_dir: Directory to save elements
         padding: Pixels to add around elements (default: 0)
         save_metadata: Whether to save JSON metadata (default: True)
+        metadata_format: 'sidecar' for one JSON file per element, or 'jsonl'
+            for a single elements.jsonl with one compact line per element
+        skip_unchanged: Reuse existing crop files whose pixels are unchanged (keeps crops_manifest.json)
+        max_workers: Encoder threads (default: ThreadPoolExecutor default)
     
     Returns:
         Dictionary mapping element IDs to saved image paths
     """
+    if metadata_format not in ('sidecar', 'jsonl'):
+        raise ValueError(f"Unknown metadata_format: {metadata_format}")
+    
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Decode before fanning out; crop() on a lazily opened image races on the decoder
+    image.load()
+    
+    manifest_path = output_dir / CROP_MANIFEST
+    previous = {} if skip_unchanged else None
+    if skip_unchanged and manifest_path.exists():
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable crop manifest {manifest_path}: {e}")
+    
+    sidecar = save_metadata and metadata_format == 'sidecar'
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda element: _write_crop(image, element, output_dir, padding, sidecar, previous),
+            elements,
+        ))
+    
     saved_paths = {}
+    manifest = {}
+    records = []
+    for element, result in zip(elements, results):
+        if result is None:
+            continue
+        image_path, metadata, digest = result
+        saved_paths[element['id']] = image_path
+        if digest is not None:
+            manifest[image_path.name] = digest
+        records.append(metadata)
+    
+    if save_metadata and metadata_format == 'jsonl':
+        with open(output_dir / METADATA_JSONL, 'w', encoding='utf-8') as f:
+            for metadata in records:
+                f.write(json.dumps(metadata, separators=(',', ':')))
+                f.write('\n')
     
-    for element in elements:
-        image_path = crop_and_save_element(
-            image, element, output_dir, padding, save_metadata
-        )
-        if image_path:
-            saved_paths[element['id']] = image_path
+    if skip_unchanged:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, separators=(',', ':'))
     
     return saved_paths
@@ -4,6 +4,8 @@ Overlay generator for type-specific bounding box visualizations.
 Creates separate overlay images for each element type.
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional
 from PIL import Image, ImageDraw, ImageFont
@@ -91,6 +93,151 @@ def draw_element_boxes(
                 pass
 
 
+def _label_size(draw: ImageDraw.Draw, label: str, font) -> Optional[tuple]:
+    """Width and height of a box label, or None if it cannot be measured."""
+    try:
+        text_bbox = draw.textbbox((0, 0), label, font=font)
+    except Exception:
+        return None
+    return text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
+
+
+def _union_bounds(elements: List[Dict]) -> Optional[tuple]:
+    """Integer (x1, y1, x2, y2) covering every box of the given elements."""
+    boxes = [bbox for element in elements for bbox in element['bounding_boxes']]
+    if not boxes:
+        return None
+    return (
+        int(min(b['x1'] for b in boxes)),
+        int(min(b['y1'] for b in boxes)),
+        int(max(b['x2'] for b in boxes)) + 1,
+        int(max(b['y2'] for b in boxes)) + 1,
+    )
+
+
+class PageRenderContext:
+    """
+    One decoded page shared by element cropping and overlay rendering.
+    
+    The page is decoded once and never drawn on. Each overlay gets its own
+    output copy, and its semi-transparent fills go into an RGBA layer that
+    only covers the boxes of that layer, so no full-page RGBA is needed per
+    element type.
+    
+    Example:
+        context = PageRenderContext.open(image_path)
+        save_all_elements(context.image, elements, elements_dir)
+        generate_type_overlays(context, elements, overlays_dir)
+    """
+    
+    def __init__(self, image: Image.Image):
+        image.load()
+        self.image = image
+    
+    @classmethod
+    def open(cls, image_path) -> 'PageRenderContext':
+        """Decode a page image from disk."""
+        return cls(Image.open(image_path))
+    
+    @property
+    def size(self) -> tuple:
+        return self.image.size
+    
+    def render_overlays(
+        self,
+        elements: List[Dict],
+        font: Optional[ImageFont.FreeTypeFont] = None,
+        element_types: Optional[List[str]] = None,
+        combined: bool = True,
+        line_width: int = 2
+    ) -> Dict[str, Image.Image]:
+        """
+        Draw per-type overlays and the combined overlay in one pass over the elements.
+        
+        Args:
+            elements: All elements
+            font: Font for labels (optional)
+            element_types: Types to render separately (default: every type present)
+            combined: Also render the color-coded overlay with all types (key 'all_types')
+            line_width: Width of bounding box lines
+        
+        Returns:
+            Dictionary mapping element type (and 'all_types') to rendered image
+        """
+        if font is None:
+            font = ImageFont.load_default()
+        if element_types is None:
+            element_types = sorted(set(e['type'] for e in elements))
+        
+        # one canvas per output; the fill layer of each only covers its boxes
+        layers = {}
+        for key in list(element_types) + (['all_types'] if combined else []):
+            selected = elements if key == 'all_types' else [e for e in elements if e['type'] == key]
+            canvas = self.image.copy()
+            bounds = _union_bounds(selected)
+            fill_layer = None
+            if bounds is not None:
+                fill_layer = Image.new('RGBA', (bounds[2] - bounds[0], bounds[3] - bounds[1]), (0, 0, 0, 0))
+            layers[key] = {
+                'canvas': canvas,
+                'draw': ImageDraw.Draw(canvas),
+                'fill_layer': fill_layer,
+                'fill_draw': ImageDraw.Draw(fill_layer) if fill_layer is not None else None,
+                'origin': bounds[:2] if bounds is not None else (0, 0),
+            }
+        
+        # walk elements grouped by type (first-appearance order) so the combined
+        # overlay stacks boxes the same way as drawing one type after another
+        by_type = {}
+        for element in elements:
+            by_type.setdefault(element['type'], []).append(element)
+        
+        label_sizes = {}
+        for element in (e for group in by_type.values() for e in group):
+            element_type = element['type']
+            targets = [layers[key] for key in (element_type, 'all_types') if key in layers]
+            if not targets:
+                continue
+            color = get_color_for_type(element_type)
+            color_alpha = color + (20,)
+            width = 4 if element_type == 'title' else line_width
+            if element_type not in label_sizes:
+                label_sizes[element_type] = _label_size(targets[0]['draw'], element_type, font)
+            label_size = label_sizes[element_type]
+            
+            for bbox in element['bounding_boxes']:
+                x1, y1, x2, y2 = bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']
+                for layer in targets:
+                    draw = layer['draw']
+                    draw.rectangle([x1, y1, x2, y2], outline=color, width=width)
+                    
+                    ox, oy = layer['origin']
+                    layer['fill_draw'].rectangle(
+                        [x1 - ox, y1 - oy, x2 - ox, y2 - oy], fill=color_alpha, outline=(0, 0, 0, 0)
+                    )
+                    
+                    if label_size is None:
+                        continue
+                    text_x = x1
+                    text_y = max(0, y1 - 15)
+                    try:
+                        draw.rectangle(
+                            [text_x, text_y, text_x + label_size[0], text_y + label_size[1]],
+                            fill=(255, 255, 255, 30)
+                        )
+                        draw.text((text_x, text_y), element_type, font=font, fill=color)
+                    except Exception:
+                        pass
+        
+        overlays = {}
+        for key, layer in layers.items():
+            canvas = layer['canvas']
+            if layer['fill_layer'] is not None:
+                canvas.paste(layer['fill_layer'], layer['origin'], layer['fill_layer'])
+            overlays[key] = canvas
+        return overlays
+
+
 def generate_type_overlay(
     image: Image.Image,
     elements: List[Dict],
@@ -101,7 +248,7 @@ def generate_type_overlay(
     Generate overlay image showing only one element type.
     
     Args:
-        image: Source image
+        image: Source image (or PageRenderContext)
         elements: All elements
         element_type: Type to visualize
         font: Font for labels (optional)
@@ -109,29 +256,8 @@ def generate_type_overlay(
     Returns:
         Image with bounding boxes for specified type
     """
-    # Filter elements by type
-    filtered_elements = [e for e in elements if e['type'] == element_type]
-    
-    if not filtered_elements:
-        # Return original image if no elements of this type
-        return image.copy()
-    
-    # Create drawing contexts
-    img_draw = image.copy()
-    draw = ImageDraw.Draw(img_draw)
-    overlay = Image.new('RGBA', img_draw.size, (0, 0, 0, 0))
-    draw2 = ImageDraw.Draw(overlay)
-    
-    # Get color for this type
-    color = get_color_for_type(element_type)
-    
-    # Draw boxes
-    draw_element_boxes(draw, draw2, filtered_elements, color, font)
-    
-    # Composite overlay
-    img_draw.paste(overlay, (0, 0), overlay)
-    
-    return img_draw
+    context = image if isinstance(image, PageRenderContext) else PageRenderContext(image)
+    return context.render_overlays(elements, font, element_types=[element_type], combined=False)[element_type]
 
 
 def generate_all_types_overlay(
@@ -143,58 +269,37 @@ def generate_all_types_overlay(
     Generate overlay showing all element types with different colors.
     
     Args:
-        image: Source image
+        image: Source image (or PageRenderContext)
         elements: All elements
         font: Font for labels (optional)
     
     Returns:
         Image with color-coded bounding boxes for all types
     """
-    if not elements:
-        return image.copy()
-    
-    # Create drawing contexts
-    img_draw = image.copy()
-    draw = ImageDraw.Draw(img_draw)
-    overlay = Image.new('RGBA', img_draw.size, (0, 0, 0, 0))
-    draw2 = ImageDraw.Draw(overlay)
-    
-    # Group elements by type
-    elements_by_type = {}
-    for element in elements:
-        element_type = element['type']
-        if element_type not in elements_by_type:
-            elements_by_type[element_type] = []
-        elements_by_type[element_type].append(element)
-    
-    # Draw each type with its color
-    for element_type, type_elements in elements_by_type.items():
-        color = get_color_for_type(element_type)
-        draw_element_boxes(draw, draw2, type_elements, color, font)
-    
-    # Composite overlay
-    img_draw.paste(overlay, (0, 0), overlay)
-    
-    return img_draw
+    context = image if isinstance(image, PageRenderContext) else PageRenderContext(image)
+    return context.render_overlays(elements, font, element_types=[])['all_types']
 
 
 def generate_type_overlays(
     image: Image.Image,
     elements: List[Dict],
     output_dir: Path,
-    font: Optional[ImageFont.FreeTypeFont] = None
+    font: Optional[ImageFont.FreeTypeFont] = None,
+    max_workers: Optional[int] = None
 ) -> Dict[str, Path]:
     """
     Generate and save type-specific overlay images.
     
     Creates separate overlay images for each element type found,
-    plus one combined overlay with all types color-coded.
+    plus one combined overlay with all types color-coded. All overlays
+    are drawn in one pass and JPEG-encoded in parallel.
     
     Args:
-        image: Source image
+        image: Source image (or PageRenderContext)
         elements: List of all elements
         output_dir: Directory to save overlay images
         font: Font for labels (optional)
+        max_workers: Threads used for encoding (default: one per overlay, up to CPU count)
     
     Returns:
         Dictionary mapping overlay type to saved file path
@@ -202,29 +307,25 @@ def generate_type_overlays(
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    saved_overlays = {}
-    
     if not elements:
-        return saved_overlays
+        return {}
     
-    # Get unique element types
-    element_types = sorted(set(e['type'] for e in elements))
+    context = image if isinstance(image, PageRenderContext) else PageRenderContext(image)
+    overlays = context.render_overlays(elements, font)
     
-    # Generate per-type overlays
-    for element_type in element_types:
-        overlay_image = generate_type_overlay(image, elements, element_type, font)
-        
-        # Save overlay
-        filename = f"{element_type}_only.jpg"
-        filepath = output_dir / filename
-        overlay_image.save(filepath, quality=95)
-        
-        saved_overlays[element_type] = filepath
+    saved_overlays = {
+        key: output_dir / ("all_types_colored.jpg" if key == 'all_types' else f"{key}_only.jpg")
+        for key in overlays
+    }
     
-    # Generate combined overlay with all types
-    all_types_overlay = generate_all_types_overlay(image, elements, font)
-    all_types_path = output_dir / "all_types_colored.jpg"
-    all_types_overlay.save(all_types_path, quality=95)
-    saved_overlays['all_types'] = all_types_path
+    # PIL releases the GIL while encoding, so threads scale here
+    workers = max_workers or min(len(overlays), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(overlays[key].save, saved_overlays[key], quality=95)
+            for key in overlays
+        ]
+        for future in futures:
+            future.result()
     
     return saved_overlays
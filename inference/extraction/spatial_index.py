@@ -0,0 +1,198 @@
+"""
+Uniform-grid spatial index over element boxes.
+
+Built per page. Each box is registered in every grid cell it touches, so
+region, containment and nearest-neighbour queries only test the boxes in the
+cells they visit instead of every element on the page.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SpatialIndex:
+    """
+    Grid index over (N, 4) pixel boxes, answering queries with element indices.
+    
+    Multi-box elements are indexed box by box; owners maps every box row to
+    the element it belongs to, and queries return each element once.
+    
+    Example:
+        index = SpatialIndex.from_elements(elements)
+        overlapping = index.query({'x1': 0, 'y1': 0, 'x2': 500, 'y2': 200})
+        nearest = index.nearest(figure_box, k=3)
+    """
+    
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        owners: Optional[np.ndarray] = None,
+        cell_size: Optional[float] = None
+    ):
+        """
+        Args:
+            boxes: (N, 4) boxes as x1, y1, x2, y2
+            owners: (N,) element index per box (default: box row)
+            cell_size: Grid cell edge in pixels (default: median box edge)
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.owners = (
+            np.arange(len(self.boxes)) if owners is None
+            else np.asarray(owners, dtype=np.int64)
+        )
+        if cell_size is None:
+            if len(self.boxes):
+                edges = np.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+                cell_size = float(np.median(edges))
+            else:
+                cell_size = 1.0
+        self.cell_size = max(float(cell_size), 1.0)
+        self._box_counts = np.bincount(self.owners) if len(self.owners) else np.zeros(0, dtype=np.int64)
+        
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        spans = self._cell_spans(self.boxes)
+        for row, (cx1, cy1, cx2, cy2) in enumerate(spans.tolist()):
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    self._cells.setdefault((cx, cy), []).append(row)
+    
+    @classmethod
+    def from_elements(cls, elements: Sequence[Dict], cell_size: Optional[float] = None) -> 'SpatialIndex':
+        """Index the bounding boxes of element dicts; queries return positions in elements."""
+        boxes = []
+        owners = []
+        for position, element in enumerate(elements):
+            for bbox in element['bounding_boxes']:
+                boxes.append((bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']))
+                owners.append(position)
+        return cls(np.array(boxes, dtype=np.float64).reshape(-1, 4), np.array(owners, dtype=np.int64), cell_size)
+    
+    def __len__(self) -> int:
+        return len(np.unique(self.owners))
+    
+    def _cell_spans(self, boxes: np.ndarray) -> np.ndarray:
+        """Inclusive (cx1, cy1, cx2, cy2) cell range of each box."""
+        return np.floor(boxes / self.cell_size).astype(np.int64)
+    
+    def _candidates(self, region: np.ndarray) -> np.ndarray:
+        """Box rows registered in the cells a region touches."""
+        cx1, cy1, cx2, cy2 = self._cell_spans(region.reshape(1, 4))[0].tolist()
+        rows = set()
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                rows.update(self._cells.get((cx, cy), ()))
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+    
+    def _elements(self, rows: np.ndarray) -> List[int]:
+        return np.unique(self.owners[rows]).tolist()
+    
+    def query(self, region) -> List[int]:
+        """
+        Elements with a box overlapping the region (positive-area intersection).
+        
+        Args:
+            region: Bbox dict or (x1, y1, x2, y2)
+        
+        Returns:
+            Sorted element indices
+        """
+        region = _as_box(region)
+        rows = self._candidates(region)
+        boxes = self.boxes[rows]
+        hit = (
+            (boxes[:, 0] < region[2]) & (region[0] < boxes[:, 2])
+            & (boxes[:, 1] < region[3]) & (region[1] < boxes[:, 3])
+        )
+        return self._elements(rows[hit])
+    
+    def within(self, region) -> List[int]:
+        """Elements whose boxes all lie inside the region."""
+        region = _as_box(region)
+        rows = self._candidates(region)
+        boxes = self.boxes[rows]
+        inside = (
+            (boxes[:, 0] >= region[0]) & (boxes[:, 1] >= region[1])
+            & (boxes[:, 2] <= region[2]) & (boxes[:, 3] <= region[3])
+        )
+        # every box of an element inside the region lies in the visited cells
+        inside_counts = np.bincount(self.owners[rows[inside]], minlength=len(self._box_counts))
+        return np.flatnonzero((inside_counts == self._box_counts) & (self._box_counts > 0)).tolist()
+    
+    def containing(self, region) -> List[int]:
+        """Elements with a box that fully contains the region (a point is a zero-size region)."""
+        region = _as_box(region)
+        rows = self._candidates(region)
+        boxes = self.boxes[rows]
+        contains = (
+            (boxes[:, 0] <= region[0]) & (boxes[:, 1] <= region[1])
+            & (boxes[:, 2] >= region[2]) & (boxes[:, 3] >= region[3])
+        )
+        return self._elements(rows[contains])
+    
+    def nearest(self, region, k: int = 1, exclude: Sequence[int] = ()) -> List[Tuple[int, float]]:
+        """
+        The k elements closest to a region, by gap between boxes (0 when touching or overlapping).
+        
+        Searches rings of grid cells outward from the region and stops once
+        the ring radius guarantees no closer box is left.
+        
+        Args:
+            region: Bbox dict, (x1, y1, x2, y2) or (x, y)
+            k: Number of elements to return
+            exclude: Element indices to skip (e.g. the query element itself)
+        
+        Returns:
+            List of (element index, distance) sorted by distance
+        """
+        region = _as_box(region)
+        excluded = set(exclude)
+        if k <= 0 or len(self.boxes) == 0:
+            return []
+        
+        cx1, cy1, cx2, cy2 = self._cell_spans(region.reshape(1, 4))[0].tolist()
+        all_cells = np.array(list(self._cells.keys()), dtype=np.int64)
+        max_ring = int(max(
+            np.abs(all_cells[:, 0] - cx1).max(), np.abs(all_cells[:, 0] - cx2).max(),
+            np.abs(all_cells[:, 1] - cy1).max(), np.abs(all_cells[:, 1] - cy2).max(),
+        ))
+        
+        seen = set()
+        best: Dict[int, float] = {}
+        for ring in range(max_ring + 1):
+            for cx in range(cx1 - ring, cx2 + ring + 1):
+                for cy in range(cy1 - ring, cy2 + ring + 1):
+                    if ring and cx1 - ring < cx < cx2 + ring and cy1 - ring < cy < cy2 + ring:
+                        continue  # interior cells were visited by an earlier ring
+                    for row in self._cells.get((cx, cy), ()):
+                        if row in seen:
+                            continue
+                        seen.add(row)
+                        owner = int(self.owners[row])
+                        if owner in excluded:
+                            continue
+                        distance = _box_gap(self.boxes[row], region)
+                        if distance < best.get(owner, float('inf')):
+                            best[owner] = distance
+            ranked = sorted(best.items(), key=lambda item: (item[1], item[0]))
+            # boxes not yet seen are at least `ring` whole cells away
+            if len(ranked) >= k and ranked[k - 1][1] <= ring * self.cell_size:
+                return ranked[:k]
+        return sorted(best.items(), key=lambda item: (item[1], item[0]))[:k]
+
+
+def _as_box(region) -> np.ndarray:
+    """(4,) float array from a bbox dict, a box or a point."""
+    if isinstance(region, dict):
+        region = (region['x1'], region['y1'], region['x2'], region['y2'])
+    region = np.asarray(region, dtype=np.float64).reshape(-1)
+    if region.shape == (2,):
+        region = np.concatenate([region, region])
+    return region
+
+
+def _box_gap(box: np.ndarray, region: np.ndarray) -> float:
+    """Euclidean gap between two boxes (0 if they touch or overlap)."""
+    dx = max(region[0] - box[2], box[0] - region[2], 0.0)
+    dy = max(region[1] - box[3], box[1] - region[3], 0.0)
+    return float(np.hypot(dx, dy))
@@ -2,13 +2,57 @@
 
 from pathlib import Path
 from typing import Optional, Dict, Union
-from PIL import Image
 
 from .model_loader import load_model_and_tokenizer
 
 
-def process_image(image_path: str, output_dir: Optional[str] = None) -> str:
-    """Run OCR on a single image using the DeepSeek model on CPU."""
+PROMPT = "<image>\n<|grounding|>Convert the document to markdown. "
+
+
+def export_image_prefill(image_path: str, output_path: str, prompt: str = PROMPT) -> str:
+    """
+    Run the vision encoders on an image and save its prefill inputs (token ids,
+    image-seq mask and projected image features) to a safetensors file.
+
+    The file can be passed to process_image(prefill_file=...) in any process,
+    including with a different prompt, without re-running the vision encoders.
+    """
+    image_path = str(Path(image_path).expanduser().resolve())
+    tokenizer, model = load_model_and_tokenizer()
+    return model.export_prefill(
+        tokenizer,
+        str(Path(output_path).expanduser().resolve()),
+        prompt=prompt,
+        image_file=image_path,
+        base_size=1024,
+        image_size=640,
+        crop_mode=True,
+    )
+
+
+def process_image(
+    image_path: str,
+    output_dir: Optional[str] = None,
+    prefill_file: Optional[str] = None,
+    prompt: str = PROMPT,
+    reuse_prefix_cache: bool = False,
+    speculative_tokens: int = 0,
+    constrain_grounding: bool = False,
+) -> str:
+    """Run OCR on a single image using the DeepSeek model on CPU.
+
+    If ``prefill_file`` points to a file written by export_image_prefill, its image
+    embeddings are used instead of running the vision encoders; the page is only
+    decoded again to draw the result boxes, and a prefill exported from a different
+    image file is rejected. With
+    ``reuse_prefix_cache``, further prompts on the same image fork the KV cache of
+    the shared image prefix and only prefill their own text tokens.
+    ``speculative_tokens`` > 0 enables speculative decoding with that many drafted
+    tokens per step (n-gram prompt lookup plus the grounding syntax).
+    ``constrain_grounding`` restricts <|det|> blocks to well-formed coordinate lists
+    and fast-forwards the tokens the grounding syntax fully determines. It is off by
+    default, like in model.infer, so the default output is plain greedy decoding.
+    """
     image_path = str(Path(image_path).expanduser().resolve())
     output_dir_path: Optional[Path] = None
     if output_dir is not None:
@@ -17,7 +61,6 @@ def process_image(image_path: str, output_dir: Optional[str] = None) -> str:
 
     tokenizer, model = load_model_and_tokenizer()
 
-    prompt = "<image>\n<|grounding|>Convert the document to markdown. "
     result = model.infer(
         tokenizer,
         prompt=prompt,
@@ -28,6 +71,10 @@ def process_image(image_path: str, output_dir: Optional[str] = None) -> str:
         crop_mode=True,
         save_results=bool(output_dir),
         test_compress=True,
+        prefill_file=prefill_file,
+        reuse_prefix_cache=reuse_prefix_cache,
+        speculative_tokens=speculative_tokens,
+        constrain_grounding=constrain_grounding,
     )
     if result is None and output_dir_path:
         result_file = output_dir_path / "result.mmd"
@@ -46,6 +93,7 @@ def process_image_enhanced(
     extract_options: Optional[Dict] = None,
     generate_overlays: bool = True,
     save_elements: bool = True,
+    page_number: int = 1,
 ) -> Dict:
     """
     Run OCR on a single image with enhanced element extraction.
@@ -56,14 +104,17 @@ def process_image_enhanced(
     Args:
         image_path: Path to input image
         output_dir: Directory for output files (required for enhanced mode)
-        extract_options: Options for element extraction (see extract_all_elements)
+        extract_options: Options for element extraction (see extract_all_elements);
+            'padding', 'metadata_format' and 'skip_unchanged' are also passed to save_all_elements
         generate_overlays: Whether to generate type-specific overlay images
         save_elements: Whether to save individual element images
+        page_number: Page number stored in element ids and metadata
     
     Returns:
         Dictionary with:
             - 'markdown': Extracted markdown text
             - 'elements': List of extracted elements with metadata
+            - 'spatial_index': SpatialIndex over the element boxes (queries return positions in 'elements')
             - 'element_paths': Dict mapping element IDs to saved image paths
             - 'overlay_paths': Dict mapping overlay types to image paths
             - 'raw_output': Raw model output with grounding references
@@ -76,6 +127,8 @@ def process_image_enhanced(
         extract_all_elements,
         save_all_elements,
         generate_type_overlays,
+        PageRenderContext,
+        SpatialIndex,
     )
     
     # Process with standard pipeline first
@@ -99,20 +152,21 @@ def process_image_enhanced(
     with open(raw_output_path, 'r', encoding='utf-8') as f:
         raw_output = f.read()
     
-    # Load the image
-    image = Image.open(image_path)
+    # Decode the page once; cropping and overlays share it
+    page = PageRenderContext.open(image_path)
     
     # Extract elements
     elements = extract_all_elements(
-        image=image,
+        image=page.image,
         model_output=raw_output,
-        page_number=1,
+        page_number=page_number,
         extract_options=extract_options,
     )
     
     result = {
         'markdown': markdown,
         'elements': elements,
+        'spatial_index': SpatialIndex.from_elements(elements),
         'raw_output': raw_output,
         'element_paths': {},
         'overlay_paths': {},
@@ -121,13 +175,21 @@ def process_image_enhanced(
     # Save individual elements
     if save_elements:
         elements_dir = output_dir_path / "elements"
-        element_paths = save_all_elements(image, elements, elements_dir)
+        options = extract_options or {}
+        element_paths = save_all_elements(
+            page.image,
+            elements,
+            elements_dir,
+            padding=options.get('padding', 0),
+            metadata_format=options.get('metadata_format', 'sidecar'),
+            skip_unchanged=options.get('skip_unchanged', False),
+        )
         result['element_paths'] = element_paths
     
     # Generate type-specific overlays
     if generate_overlays:
         overlays_dir = output_dir_path / "overlays"
-        overlay_paths = generate_type_overlays(image, elements, overlays_dir)
+        overlay_paths = generate_type_overlays(page, elements, overlays_dir)
         result['overlay_paths'] = overlay_paths
     
     return result
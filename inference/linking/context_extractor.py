@@ -0,0 +1,121 @@
+"""
+Element text and surrounding context.
+
+The text of an element is the model output between its grounding reference
+and the next one, located through the element's 'source_span'. Context is
+read from neighbouring elements in document order.
+"""
+
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+from ..extraction.grounding_parser import iter_grounding_refs
+
+# Element types treated as section headings, with their hierarchy level
+HEADING_LEVELS = {
+    'title': 1,
+    'sub_title': 2,
+}
+
+
+def element_texts(model_output: str, elements: List[Dict]) -> List[str]:
+    """
+    Text of each element: the output following its grounding reference up to the next reference.
+    
+    Args:
+        model_output: Raw page output with grounding references
+        elements: Elements of that page (with 'source_span')
+    
+    Returns:
+        One stripped string per element ('' when the element has no span)
+    """
+    starts = [ref.start for ref in iter_grounding_refs(model_output)]
+    texts = []
+    for element in elements:
+        span = element.get('source_span')
+        if not span:
+            texts.append('')
+            continue
+        following = bisect_right(starts, span['start'])
+        end = starts[following] if following < len(starts) else len(model_output)
+        texts.append(model_output[span['end']:end].strip())
+    return texts
+
+
+def attach_element_text(elements: List[Dict], model_output: str) -> List[Dict]:
+    """
+    Store each element's text under 'text' (in place).
+    
+    Returns:
+        The same element list
+    """
+    for element, text in zip(elements, element_texts(model_output, elements)):
+        element['text'] = text
+    return elements
+
+
+def heading_text(element: Dict) -> str:
+    """Heading text without leading markdown '#' markers."""
+    return element.get('text', '').lstrip('#').strip()
+
+
+def section_paths(all_elements: List[Dict]) -> List[List[str]]:
+    """
+    Section hierarchy in effect at every element, in one pass.
+    
+    Args:
+        all_elements: Elements in document order
+    
+    Returns:
+        For each element, the heading texts from the outermost level down
+    """
+    current: List[Optional[str]] = [None] * (max(HEADING_LEVELS.values()) + 1)
+    paths = []
+    for element in all_elements:
+        level = HEADING_LEVELS.get(element['type'])
+        if level is not None:
+            current[level] = heading_text(element)
+            for deeper in range(level + 1, len(current)):
+                current[deeper] = None
+        paths.append([title for title in current if title])
+    return paths
+
+
+def extract_element_context(
+    element: Dict,
+    all_elements: List[Dict],
+    window_size: int = 2,
+    position: Optional[int] = None,
+    section_path: Optional[List[str]] = None
+) -> Dict:
+    """
+    Extract surrounding context for an element.
+    
+    Args:
+        element: Element to describe
+        all_elements: Elements of the document in reading order (with 'text')
+        window_size: Number of neighbours on each side
+        position: Index of element in all_elements, if already known
+        section_path: Section hierarchy of element, if already known (see section_paths)
+    
+    Returns:
+        Dictionary with preceding_elements, following_elements, preceding_text,
+        following_text, section and section_hierarchy
+    """
+    if position is None:
+        position = next(i for i, candidate in enumerate(all_elements) if candidate['id'] == element['id'])
+    
+    preceding = all_elements[max(0, position - window_size):position]
+    following = all_elements[position + 1:position + 1 + window_size]
+    
+    if section_path is None:
+        section_path = section_paths(all_elements[:position + 1])[-1]
+    
+    return {
+        'preceding_elements': [e['id'] for e in preceding],
+        'following_elements': [e['id'] for e in following],
+        'preceding_text': ' '.join(e.get('text', '') for e in preceding if e.get('text')),
+        'following_text': ' '.join(e.get('text', '') for e in following if e.get('text')),
+        'section': section_path[-1] if section_path else None,
+        'section_hierarchy': list(section_path),
+    }
@@ -0,0 +1,85 @@
+"""
+Image manifest generation.
+
+Lists every image element of a processed document with its crop path,
+bounds, caption, surrounding context and the places that reference it.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+from .context_extractor import extract_element_context, section_paths
+from .reference_resolver import resolve_references
+
+MANIFEST_FILENAME = "image_manifest.json"
+
+
+def build_image_manifest(
+    document_structure: Dict,
+    output_dir: Optional[str] = None,
+    references: Optional[Dict] = None,
+    window_size: int = 2
+) -> Dict:
+    """
+    Build the image manifest of a document.
+    
+    Args:
+        document_structure: {'pages': [{'page': n, 'elements': [...]}, ...]} with element 'text'
+        output_dir: Document output directory; the manifest is written there when given
+        references: Result of resolve_references, if already computed
+        window_size: Context window (elements on each side)
+    
+    Returns:
+        Dictionary with 'num_images' and 'images', one entry per image element
+    """
+    if references is None:
+        references = resolve_references(document_structure)
+    captions = {
+        target['element_id']: target['caption']
+        for target in references['targets'].values()
+        if 'caption' in target
+    }
+    referenced_by = {}
+    for reference in references['references']:
+        if reference['target'] is not None:
+            referenced_by.setdefault(reference['target'], []).append(
+                {'element_id': reference['source'], 'page': reference['page'], 'text': reference['text']}
+            )
+    
+    all_elements = [element for page in document_structure['pages'] for element in page.get('elements', [])]
+    paths = section_paths(all_elements)
+    
+    images = []
+    for position, element in enumerate(all_elements):
+        if element['type'] != 'image':
+            continue
+        boxes = element['bounding_boxes']
+        images.append({
+            'image_id': f"img_{len(images) + 1:04d}",
+            'element_id': element['id'],
+            'page': element['page'],
+            'current_path': f"page_{element['page']:04d}/elements/{element['id']}_{element['type']}.jpg",
+            'bounding_box': {
+                'x1': min(b['x1'] for b in boxes),
+                'y1': min(b['y1'] for b in boxes),
+                'x2': max(b['x2'] for b in boxes),
+                'y2': max(b['y2'] for b in boxes),
+            },
+            'caption': captions.get(element['id']),
+            'context': extract_element_context(
+                element, all_elements, window_size, position=position, section_path=paths[position]
+            ),
+            'referenced_by': referenced_by.get(element['id'], []),
+            'referenced_in_pages': references['referenced_in_pages'].get(element['id'], []),
+        })
+    
+    manifest = {
+        'num_images': len(images),
+        'images': images,
+    }
+    if output_dir is not None:
+        manifest_path = Path(output_dir) / MANIFEST_FILENAME
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,157 @@
+"""
+Cross-reference resolution.
+
+Finds mentions such as "Figure 1", "Fig. 1", "Table 2", "Eq. (3)" or
+"Section 2.1" in element text and links them to the elements they name:
+figures and tables through their captions (caption -> nearest image/table on
+the same page via SpatialIndex), equations through their \\tag{n} / (n)
+number and sections through numbered headings.
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..extraction.spatial_index import SpatialIndex
+from .context_extractor import HEADING_LEVELS, heading_text
+
+REFERENCE_PATTERN = re.compile(
+    r'\b(figure|fig\.|table|tab\.|equation|eq\.|section|sec\.)\s*\(?(\d+(?:\.\d+)*)\)?',
+    re.IGNORECASE,
+)
+REFERENCE_KINDS = {
+    'figure': 'figure', 'fig.': 'figure',
+    'table': 'table', 'tab.': 'table',
+    'equation': 'equation', 'eq.': 'equation',
+    'section': 'section', 'sec.': 'section',
+}
+# Element types a caption of each kind belongs to
+CAPTIONED_TYPES = {
+    'figure': ('image',),
+    'table': ('table',),
+}
+EQUATION_NUMBER_PATTERN = re.compile(r'\\tag\{(\d+(?:\.\d+)*)\}|\((\d+(?:\.\d+)*)\)\s*(?:\$\$|\\\])?\s*$')
+SECTION_NUMBER_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)\.?\s')
+
+
+def _document_elements(document_structure: Dict) -> List[Dict]:
+    return [element for page in document_structure['pages'] for element in page.get('elements', [])]
+
+
+def iter_references(text: str) -> Iterator[Tuple[str, str, int, int]]:
+    """Yield (kind, number, start, end) for every reference mention in text."""
+    for match in REFERENCE_PATTERN.finditer(text):
+        yield REFERENCE_KINDS[match.group(1).lower()], match.group(2), match.start(), match.end()
+
+
+def _union_box(element: Dict) -> Tuple[float, float, float, float]:
+    boxes = element['bounding_boxes']
+    return (
+        min(b['x1'] for b in boxes), min(b['y1'] for b in boxes),
+        max(b['x2'] for b in boxes), max(b['y2'] for b in boxes),
+    )
+
+
+def _caption_targets(elements: List[Dict]) -> Dict[Tuple[str, str], Dict]:
+    """(kind, number) -> caption and captioned element, for captions that start with a reference."""
+    targets = {}
+    by_page = defaultdict(list)
+    for element in elements:
+        by_page[element['page']].append(element)
+    
+    for page_elements in by_page.values():
+        indices = {}
+        for kind, types in CAPTIONED_TYPES.items():
+            candidates = [e for e in page_elements if e['type'] in types]
+            if candidates:
+                indices[kind] = (SpatialIndex.from_elements(candidates), candidates)
+        
+        for element in page_elements:
+            text = element.get('text', '').lstrip('*_ ')
+            match = REFERENCE_PATTERN.match(text)
+            if match is None or element['type'] in ('title', 'sub_title'):
+                continue
+            kind = REFERENCE_KINDS[match.group(1).lower()]
+            if kind not in indices or element['type'] in CAPTIONED_TYPES[kind]:
+                continue
+            index, candidates = indices[kind]
+            nearest = index.nearest(_union_box(element), k=1)
+            key = (kind, match.group(2))
+            if nearest and key not in targets:
+                targets[key] = {
+                    'element_id': candidates[nearest[0][0]]['id'],
+                    'caption_id': element['id'],
+                    'caption': text.strip(),
+                    'page': element['page'],
+                }
+    return targets
+
+
+def _numbered_targets(elements: List[Dict]) -> Dict[Tuple[str, str], Dict]:
+    """(kind, number) -> element for numbered equations and section headings."""
+    targets = {}
+    for element in elements:
+        text = element.get('text', '')
+        if element['type'] == 'equation':
+            match = EQUATION_NUMBER_PATTERN.search(text)
+            if match:
+                key = ('equation', match.group(1) or match.group(2))
+                targets.setdefault(key, {'element_id': element['id'], 'page': element['page']})
+        elif element['type'] in HEADING_LEVELS:
+            match = SECTION_NUMBER_PATTERN.match(heading_text(element))
+            if match:
+                key = ('section', match.group(1))
+                targets.setdefault(key, {'element_id': element['id'], 'page': element['page']})
+    return targets
+
+
+def resolve_references(document_structure: Dict) -> Dict:
+    """
+    Find and resolve cross-references in the document.
+    
+    Args:
+        document_structure: {'pages': [{'elements': [...]}, ...]} with element 'text'
+            (see attach_element_text)
+    
+    Returns:
+        Dictionary with:
+            - 'targets': 'figure 1' style key -> target element (and caption) info
+            - 'references': every mention with source element, kind, number and resolved target
+            - 'unresolved': mentions without a target (broken or forward to unprocessed pages)
+            - 'referenced_in_pages': target element id -> sorted pages mentioning it
+    """
+    elements = _document_elements(document_structure)
+    targets = _numbered_targets(elements)
+    targets.update(_caption_targets(elements))
+    
+    references = []
+    referenced_in_pages = defaultdict(set)
+    for element in elements:
+        text = element.get('text', '')
+        if not text:
+            continue
+        for kind, number, start, end in iter_references(text):
+            target = targets.get((kind, number))
+            # a caption's leading "Figure 1" defines the target rather than referring to it
+            if target is not None and target.get('caption_id') == element['id']:
+                continue
+            target_id: Optional[str] = target['element_id'] if target else None
+            references.append({
+                'source': element['id'],
+                'page': element['page'],
+                'kind': kind,
+                'number': number,
+                'text': text[start:end],
+                'target': target_id,
+            })
+            if target_id is not None:
+                referenced_in_pages[target_id].add(element['page'])
+    
+    return {
+        'targets': {f'{kind} {number}': target for (kind, number), target in targets.items()},
+        'references': references,
+        'unresolved': [reference for reference in references if reference['target'] is None],
+        'referenced_in_pages': {
+            target_id: sorted(pages) for target_id, pages in referenced_in_pages.items()
+        },
+    }
@@ -0,0 +1,575 @@
+"""
+Inverted index over element text.
+
+Each commit of a SearchIndexWriter writes an immutable segment directory:
+    
+    seg_<id>/
+        lexicon.npy         uint8 UTF-8 bytes of the sorted terms, concatenated
+        lexicon_offsets.npy int64 (T + 1,) start of each term in lexicon.npy
+        offsets.npy         int64 (T + 1,) start of each term's postings
+        postings.npy        int32 (P, 2) element row and token position, grouped by term
+        elements.npy        int32 (E, 3) document id, label id and page per element row
+        names.json          document names, labels, element ids and merged segments
+
+Pages are added as they finish and committed as small segments. After each
+commit, segments of similar size are merged once MERGE_FACTOR of them have
+piled up, so an index shared by many documents keeps a logarithmic number of
+segments; merge_segments() folds any set of segments into one. SearchIndex
+memory-maps every array, the lexicon included, so opening an index parses no
+term list and a query reads only the postings of its own terms.
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .context_extractor import element_texts
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+TAG_PATTERN = re.compile(r'<[^>]*>')
+SEGMENT_PREFIX = 'seg_'
+# segments per size tier before they are merged (segment sizes grow by this factor per tier)
+MERGE_FACTOR = 8
+MERGE_LOCK = 'merge.lock'
+# a merge lock older than this (seconds) is left over from a crashed process
+MERGE_LOCK_TIMEOUT = 600
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of text, with HTML tags removed."""
+    return TOKEN_PATTERN.findall(TAG_PATTERN.sub(' ', text).lower())
+
+
+def _segment_dirs(index_dir: Path) -> List[Path]:
+    return sorted(
+        path for path in index_dir.glob(f'{SEGMENT_PREFIX}*')
+        if path.is_dir() and not path.name.endswith('.tmp')
+    )
+
+
+class Lexicon:
+    """
+    Sorted terms stored as one UTF-8 byte array and term start offsets.
+    
+    UTF-8 byte order equals code point order, so the array is sorted like
+    the str terms and lookups are a binary search over byte slices.
+    """
+    
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+    
+    @classmethod
+    def from_terms(cls, terms: Sequence[str]) -> 'Lexicon':
+        encoded = [term.encode('utf-8') for term in terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def _bytes(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+    
+    def __getitem__(self, i: int) -> str:
+        return self._bytes(i).decode('utf-8')
+    
+    def terms(self) -> List[str]:
+        data = self.data.tobytes()
+        bounds = self.offsets.tolist()
+        return [data[start:end].decode('utf-8') for start, end in zip(bounds[:-1], bounds[1:])]
+    
+    def find(self, term: str) -> Optional[int]:
+        """Index of term, or None if it is not in the lexicon."""
+        key = term.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._bytes(lo) == key:
+            return lo
+        return None
+
+
+def _write_segment(
+    index_dir: Path,
+    terms: Sequence[str],
+    offsets: np.ndarray,
+    postings: np.ndarray,
+    elements: np.ndarray,
+    names: Dict
+) -> Path:
+    """Write a segment to a temporary directory, then rename it into place."""
+    # names sort in commit order
+    name = f'{SEGMENT_PREFIX}{time.time_ns():020d}_{uuid.uuid4().hex[:8]}'
+    tmp_dir = index_dir / f'{name}.tmp'
+    tmp_dir.mkdir(parents=True)
+    lexicon = Lexicon.from_terms(terms)
+    np.save(tmp_dir / 'lexicon.npy', lexicon.data)
+    np.save(tmp_dir / 'lexicon_offsets.npy', lexicon.offsets)
+    with open(tmp_dir / 'names.json', 'w', encoding='utf-8') as f:
+        json.dump(names, f, ensure_ascii=False)
+    np.save(tmp_dir / 'offsets.npy', np.asarray(offsets, dtype=np.int64))
+    np.save(tmp_dir / 'postings.npy', np.asarray(postings, dtype=np.int32).reshape(-1, 2))
+    np.save(tmp_dir / 'elements.npy', np.asarray(elements, dtype=np.int32).reshape(-1, 3))
+    segment_dir = index_dir / name
+    tmp_dir.rename(segment_dir)
+    return segment_dir
+
+
+@contextmanager
+def _merge_lock(index_dir: Path, wait: bool = True):
+    """
+    Hold the index's merge lock; yields False instead of waiting when wait is False
+    and another process is merging.
+    """
+    lock_path = index_dir / MERGE_LOCK
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime > MERGE_LOCK_TIMEOUT:
+                    lock_path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if not wait:
+                yield False
+                return
+            time.sleep(0.05)
+    os.close(fd)
+    try:
+        yield True
+    finally:
+        lock_path.unlink()
+
+
+class SearchIndexWriter:
+    """
+    Buffers element text and writes it as index segments.
+    
+    Example:
+        writer = SearchIndexWriter('output/search_index')
+        for page in pages:
+            writer.add_elements('paper', page['elements'])
+            writer.commit()
+        merge_segments('output/search_index')
+    """
+    
+    def __init__(self, index_dir, auto_merge: bool = True):
+        """
+        Args:
+            index_dir: Index directory (created if missing)
+            auto_merge: Whether commit() runs merge_tiers() on the index
+        """
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.auto_merge = auto_merge
+        self._reset()
+    
+    def _reset(self):
+        # term -> flat [row, position, row, position, ...]
+        self._postings = defaultdict(list)
+        self._elements = []
+        self._element_ids = []
+        self._documents = {}
+        self._labels = {}
+    
+    def __len__(self) -> int:
+        return len(self._elements)
+    
+    def add_elements(
+        self,
+        document: str,
+        elements: Iterable[Dict],
+        texts: Optional[Sequence[str]] = None
+    ):
+        """
+        Add elements of one document to the pending segment.
+        
+        Args:
+            document: Document name (e.g. the PDF stem)
+            elements: Element dicts with 'id', 'type', 'page' and 'text'
+            texts: Text per element, overriding element['text']
+        """
+        document_id = self._documents.setdefault(document, len(self._documents))
+        for i, element in enumerate(elements):
+            row = len(self._elements)
+            label_id = self._labels.setdefault(element['type'], len(self._labels))
+            self._elements.append((document_id, label_id, element['page']))
+            self._element_ids.append(element['id'])
+            text = texts[i] if texts is not None else element.get('text', '')
+            for position, term in enumerate(tokenize(text)):
+                postings = self._postings[term]
+                postings.append(row)
+                postings.append(position)
+    
+    def commit(self) -> Optional[Path]:
+        """
+        Write pending elements as a new segment and, with auto_merge, merge
+        full size tiers.
+        
+        Returns:
+            Segment directory, or None if nothing was pending (the segment may
+            already have been merged into a larger one when this returns)
+        """
+        if not self._elements:
+            return None
+        terms = sorted(self._postings)
+        lists = [self._postings[term] for term in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings) // 2 for postings in lists], out=offsets[1:])
+        postings = np.fromiter(
+            (value for postings in lists for value in postings),
+            dtype=np.int32,
+            count=int(offsets[-1]) * 2,
+        )
+        segment_dir = _write_segment(
+            self.index_dir,
+            terms,
+            offsets,
+            postings,
+            np.array(self._elements, dtype=np.int32),
+            {
+                'documents': list(self._documents),
+                'labels': list(self._labels),
+                'element_ids': self._element_ids,
+            },
+        )
+        self._reset()
+        if self.auto_merge:
+            merge_tiers(self.index_dir, wait=False)
+        return segment_dir
+
+
+def _load_segment(segment_dir: Path, mmap_mode: Optional[str] = 'r') -> Dict:
+    with open(segment_dir / 'names.json', 'r', encoding='utf-8') as f:
+        names = json.load(f)
+    return {
+        'name': segment_dir.name,
+        'lexicon': Lexicon(
+            np.load(segment_dir / 'lexicon.npy', mmap_mode=mmap_mode),
+            np.load(segment_dir / 'lexicon_offsets.npy', mmap_mode=mmap_mode),
+        ),
+        'offsets': np.load(segment_dir / 'offsets.npy', mmap_mode=mmap_mode),
+        'postings': np.load(segment_dir / 'postings.npy', mmap_mode=mmap_mode),
+        'elements': np.load(segment_dir / 'elements.npy', mmap_mode=mmap_mode),
+        'documents': names['documents'],
+        'labels': names['labels'],
+        'element_ids': names['element_ids'],
+        'merged_from': names.get('merged_from', []),
+    }
+
+
+def merge_segments(index_dir, segment_dirs: Optional[Sequence] = None) -> Optional[Path]:
+    """
+    Merge segments of an index into one.
+    
+    Postings are remapped to the merged lexicon and element rows with array
+    operations; per-term order (element row, then position) is preserved.
+    Waits for a merge running in another process; segments it has already
+    merged away are skipped.
+    
+    Args:
+        index_dir: Index directory
+        segment_dirs: Segments to merge, in commit order (default: all segments)
+    
+    Returns:
+        Merged segment directory, or None if there was nothing to merge
+    """
+    index_dir = Path(index_dir)
+    with _merge_lock(index_dir):
+        segment_dirs = (
+            _segment_dirs(index_dir) if segment_dirs is None
+            else [Path(d) for d in segment_dirs if Path(d).is_dir()]
+        )
+        return _merge(index_dir, segment_dirs)
+
+
+def _tier(size: int) -> int:
+    """floor(log_MERGE_FACTOR(size)), with empty segments in tier 0."""
+    tier = 0
+    while size >= MERGE_FACTOR:
+        size //= MERGE_FACTOR
+        tier += 1
+    return tier
+
+
+def merge_tiers(index_dir, wait: bool = True) -> List[Path]:
+    """
+    Merge segments of similar size until no size tier holds MERGE_FACTOR segments.
+    
+    A segment's tier is floor(log_MERGE_FACTOR(elements)), so an index keeps
+    at most MERGE_FACTOR - 1 segments per tier and every element is rewritten
+    O(log n) times over the life of the index.
+    
+    Args:
+        index_dir: Index directory
+        wait: Whether to wait for a merge running in another process (otherwise skip)
+    
+    Returns:
+        Merged segment directories
+    """
+    index_dir = Path(index_dir)
+    merged = []
+    with _merge_lock(index_dir, wait=wait) as locked:
+        if not locked:
+            return merged
+        while True:
+            tiers = defaultdict(list)
+            for segment_dir in _segment_dirs(index_dir):
+                tiers[_tier(len(np.load(segment_dir / 'elements.npy', mmap_mode='r')))].append(segment_dir)
+            full = [segment_dirs for _, segment_dirs in sorted(tiers.items()) if len(segment_dirs) >= MERGE_FACTOR]
+            if not full:
+                return merged
+            merged.append(_merge(index_dir, full[0][:MERGE_FACTOR]))
+
+
+def _merge(index_dir: Path, segment_dirs: List[Path]) -> Optional[Path]:
+    """Merge segment_dirs into one segment; the caller holds the merge lock."""
+    if len(segment_dirs) <= 1:
+        return segment_dirs[0] if segment_dirs else None
+    
+    segments = [_load_segment(segment_dir, mmap_mode=None) for segment_dir in segment_dirs]
+    segment_terms = [segment['lexicon'].terms() for segment in segments]
+    terms = sorted(set().union(*segment_terms))
+    term_array = np.array(terms, dtype=object)
+    documents = {}
+    labels = {}
+    element_ids = []
+    elements = []
+    term_ids = []
+    postings = []
+    row_base = 0
+    
+    for segment, segment_term_list in zip(segments, segment_terms):
+        document_map = np.array(
+            [documents.setdefault(name, len(documents)) for name in segment['documents']], dtype=np.int32
+        )
+        label_map = np.array(
+            [labels.setdefault(name, len(labels)) for name in segment['labels']], dtype=np.int32
+        )
+        segment_elements = np.array(segment['elements'], dtype=np.int32)
+        segment_elements[:, 0] = document_map[segment_elements[:, 0]]
+        segment_elements[:, 1] = label_map[segment_elements[:, 1]]
+        elements.append(segment_elements)
+        element_ids.extend(segment['element_ids'])
+        
+        term_map = np.searchsorted(term_array, np.array(segment_term_list, dtype=object))
+        term_ids.append(np.repeat(term_map, np.diff(segment['offsets'])))
+        segment_postings = np.array(segment['postings'], dtype=np.int64)
+        segment_postings[:, 0] += row_base
+        postings.append(segment_postings)
+        row_base += len(segment_elements)
+    
+    term_ids = np.concatenate(term_ids)
+    postings = np.concatenate(postings)
+    # segments are visited in row order, so a stable sort by term keeps rows ascending
+    order = np.argsort(term_ids, kind='stable')
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+    
+    merged_dir = _write_segment(
+        index_dir,
+        terms,
+        offsets,
+        postings[order],
+        np.concatenate(elements),
+        {
+            'documents': list(documents),
+            'labels': list(labels),
+            'element_ids': element_ids,
+            # lets a reader that lists the directory mid-merge skip the sources
+            'merged_from': [segment_dir.name for segment_dir in segment_dirs],
+        },
+    )
+    for segment_dir in segment_dirs:
+        shutil.rmtree(segment_dir)
+    return merged_dir
+
+
+class SearchIndex:
+    """
+    Read-only view over the segments of an index, with memory-mapped arrays.
+    
+    Example:
+        index = SearchIndex('output/search_index')
+        tables = index.search('revenue', element_type='table')
+    """
+    
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        self.segments = self._load_segments()
+    
+    def _load_segments(self) -> List[Dict]:
+        # a concurrent merge can remove a listed segment before it is read; list again
+        while True:
+            try:
+                segments = [_load_segment(segment_dir) for segment_dir in _segment_dirs(self.index_dir)]
+                break
+            except FileNotFoundError:
+                continue
+        # sources of a merge still listed next to its result
+        merged = {name for segment in segments for name in segment['merged_from']}
+        return [segment for segment in segments if segment['name'] not in merged]
+    
+    def __len__(self) -> int:
+        return sum(len(segment['element_ids']) for segment in self.segments)
+    
+    def _term_postings(self, segment: Dict, term: str) -> Optional[np.ndarray]:
+        i = segment['lexicon'].find(term)
+        if i is None:
+            return None
+        offsets = segment['offsets']
+        return segment['postings'][offsets[i]:offsets[i + 1]]
+    
+    def _segment_rows(self, segment: Dict, query_terms: List[str], phrase: bool) -> np.ndarray:
+        """Element rows of a segment matching every term (in sequence, for phrases)."""
+        postings = []
+        for term in query_terms:
+            term_postings = self._term_postings(segment, term)
+            if term_postings is None:
+                return np.zeros(0, dtype=np.int64)
+            postings.append(term_postings)
+        
+        if not phrase or len(postings) == 1:
+            rows = np.unique(postings[0][:, 0])
+            for term_postings in postings[1:]:
+                rows = np.intersect1d(rows, term_postings[:, 0], assume_unique=False)
+                if not len(rows):
+                    break
+            return rows.astype(np.int64)
+        
+        # phrase: term k must sit at (start + k) in the same element
+        def start_keys(term_postings: np.ndarray, k: int) -> np.ndarray:
+            return (term_postings[:, 0].astype(np.int64) << 32) + (term_postings[:, 1].astype(np.int64) - k)
+        
+        keys = start_keys(postings[0], 0)
+        for k, term_postings in enumerate(postings[1:], start=1):
+            keys = np.intersect1d(keys, start_keys(term_postings, k))
+            if not len(keys):
+                break
+        return np.unique(keys >> 32)
+    
+    def search(
+        self,
+        query: str,
+        element_type: Optional[str] = None,
+        document: Optional[str] = None,
+        phrase: bool = False,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Find elements containing all query terms.
+        
+        Args:
+            query: Search text (tokenized like the indexed text)
+            element_type: Only return elements of this type (e.g. 'table')
+            document: Only return elements of this document
+            phrase: Require the terms to appear consecutively
+            limit: Maximum number of hits
+        
+        Returns:
+            List of hits with document, element_id, type and page
+        """
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+        
+        hits = []
+        for segment in self.segments:
+            label_id = document_id = None
+            if element_type is not None:
+                if element_type not in segment['labels']:
+                    continue
+                label_id = segment['labels'].index(element_type)
+            if document is not None:
+                if document not in segment['documents']:
+                    continue
+                document_id = segment['documents'].index(document)
+            
+            rows = self._segment_rows(segment, query_terms, phrase)
+            if not len(rows):
+                continue
+            elements = segment['elements'][rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if label_id is not None:
+                keep &= elements[:, 1] == label_id
+            if document_id is not None:
+                keep &= elements[:, 0] == document_id
+            
+            for row, (doc, label, page) in zip(rows[keep].tolist(), elements[keep].tolist()):
+                hits.append({
+                    'document': segment['documents'][doc],
+                    'element_id': segment['element_ids'][row],
+                    'type': segment['labels'][label],
+                    'page': page,
+                })
+                if limit is not None and len(hits) >= limit:
+                    return hits
+        return hits
+
+
+def build_search_index(
+    document_structure: Dict,
+    index_dir: Optional[str] = None,
+    document: Optional[str] = None
+) -> Dict:
+    """
+    Build search lookups for a processed document.
+    
+    Args:
+        document_structure: {'pages': [{'page': n, 'elements': [...], 'raw_output': str}, ...]};
+            element text is read from 'text', or from the page's raw_output when absent
+        index_dir: Directory to add an on-disk inverted index segment to (optional)
+        document: Document name stored with the indexed elements
+    
+    Returns:
+        Dictionary with:
+            - 'by_type': element type -> element ids
+            - 'by_page': page number -> element ids
+            - 'num_elements': number of elements indexed
+            - 'index_dir': index directory (if written)
+    """
+    by_type = defaultdict(list)
+    by_page = defaultdict(list)
+    writer = SearchIndexWriter(index_dir) if index_dir is not None else None
+    document = document or document_structure.get('document', 'document')
+    num_elements = 0
+    
+    for page in document_structure['pages']:
+        elements = page.get('elements', [])
+        texts = None
+        if elements and 'text' not in elements[0] and page.get('raw_output'):
+            texts = element_texts(page['raw_output'], elements)
+        for element in elements:
+            by_type[element['type']].append(element['id'])
+            by_page[element['page']].append(element['id'])
+        if writer is not None:
+            writer.add_elements(document, elements, texts)
+        num_elements += len(elements)
+    
+    result = {
+        'by_type': dict(by_type),
+        'by_page': dict(by_page),
+        'num_elements': num_elements,
+    }
+    if writer is not None:
+        writer.commit()
+        result['index_dir'] = str(writer.index_dir)
+    return result
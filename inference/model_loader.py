@@ -3,21 +3,54 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 import torch
-from transformers import AutoModel, AutoTokenizer
+from transformers import AutoConfig, AutoModel, AutoTokenizer
 
 MODEL_ID = "deepseek-ai/DeepSeek-OCR"
 MODEL_PATH = Path(__file__).resolve().parent.parent / "model_data" / MODEL_ID
+# Input resolutions used by the inference helpers (base_size, image_size).
+VISION_IMAGE_SIZES = (1024, 640)
+# Attention kernel for the decoder; "sdpa" avoids materialising the fp32 score tensor during prefill.
+ATTN_IMPLEMENTATION = "sdpa"
+# Fold q_absorb into q_proj for MLA checkpoints (bigger GEMM, one launch fewer per layer).
+FUSE_MLA_Q_PROJ = False
+# Memory-mapped cold experts (see inference.expert_placement).
+EXPERT_OFFLOAD_DIR = MODEL_PATH.parent.parent / "expert_offload"
+# Persistent Inductor cache so compiled vision encoders are reused across worker processes.
+COMPILE_CACHE_DIR = MODEL_PATH.parent.parent / "inductor_cache"
 
-_MODEL = None
+# One model per build configuration: (decoder_only, expert_stats_path, expert_mode)
+_MODELS = {}
 _TOKENIZER = None
 
 
-def load_model_and_tokenizer(device: str | torch.device = "cpu") -> Tuple[AutoTokenizer, AutoModel]:
-	"""Load and cache the DeepSeek OCR tokenizer and model on the requested device."""
-	global _MODEL, _TOKENIZER
+def load_model_and_tokenizer(
+	device: str | torch.device = "cpu",
+	compile_vision: bool = False,
+	decoder_only: bool = False,
+	expert_stats_path: Optional[str] = None,
+	expert_mode: str = "offload",
+) -> Tuple[AutoTokenizer, AutoModel]:
+	"""Load and cache the DeepSeek OCR tokenizer and model on the requested device.
+
+	When ``compile_vision`` is set, the SAM / CLIP encoders and projector are compiled
+	with torch.compile and warmed up for the configured resolutions on first load.
+
+	When ``decoder_only`` is set, the vision encoders are not built at all; the model
+	then expects precomputed ``image_embeds`` produced by a vision worker's
+	``model.model.encode_images``.
+
+	When ``expert_stats_path`` points to routing statistics from a calibration run
+	(``DecoderProfiler.save_expert_stats``), rarely used MoE experts are memory-mapped
+	from disk (``expert_mode="offload"``) or dropped (``expert_mode="drop"``) on first load.
+
+	Models are cached per (``decoder_only``, ``expert_stats_path``, ``expert_mode``), so a
+	call with different build options gets a model built with those options rather than
+	whichever one was loaded first.
+	"""
+	global _TOKENIZER
 
 	if not MODEL_PATH.exists():
 		raise FileNotFoundError(
@@ -34,15 +67,54 @@ def load_model_and_tokenizer(device: str | torch.device = "cpu") -> Tuple[AutoTo
 			local_files_only=True,
 		)
 
-	if _MODEL is None:
-		_MODEL = AutoModel.from_pretrained(
+	if expert_stats_path is not None:
+		expert_stats_path = str(Path(expert_stats_path).expanduser().resolve())
+	else:
+		# the expert mode only matters when experts are placed
+		expert_mode = None
+	key = (decoder_only, expert_stats_path, expert_mode)
+
+	model = _MODELS.get(key)
+	if model is None:
+		config = AutoConfig.from_pretrained(
+			str(MODEL_PATH),
+			trust_remote_code=True,
+			local_files_only=True,
+		)
+		config.vision_encoder = not decoder_only
+		model = AutoModel.from_pretrained(
 			str(MODEL_PATH),
+			config=config,
+			attn_implementation=ATTN_IMPLEMENTATION,
 			trust_remote_code=True,
 			use_safetensors=True,
 			local_files_only=True,
 		).eval()
+		if hasattr(model.model, "precompute_vision_caches"):
+			model.model.precompute_vision_caches(VISION_IMAGE_SIZES)
+		if hasattr(model.model, "absorb_mla_projections"):
+			model.model.absorb_mla_projections(fuse_q_proj=FUSE_MLA_Q_PROJ)
+		if expert_stats_path is not None:
+			from .expert_placement import apply_expert_placement
 
-	if _MODEL.device != device:
-		_MODEL.to(device)
+			apply_expert_placement(
+				model,
+				expert_stats_path,
+				mode=expert_mode,
+				offload_dir=str(EXPERT_OFFLOAD_DIR),
+			)
+		_MODELS[key] = model
+
+	if model.device != device:
+		model.to(device)
+
+	if compile_vision and not decoder_only and not getattr(model, "_vision_compiled", False):
+		base_size, image_size = VISION_IMAGE_SIZES
+		model.model.compile_vision_encoders(
+			cache_dir=str(COMPILE_CACHE_DIR),
+			base_size=base_size,
+			image_size=image_size,
+		)
+		model._vision_compiled = True
 
-	return _TOKENIZER, _MODEL
+	return _TOKENIZER, model
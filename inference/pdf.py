@@ -51,12 +51,16 @@ def process_pdf_enhanced(
     extract_options: Optional[Dict] = None,
     generate_overlays: bool = True,
     save_elements: bool = True,
+    index_dir: Optional[str] = None,
+    keep_page_results: bool = True,
 ) -> Dict:
     """
     Run OCR on each PDF page with enhanced element extraction.
     
     This extends process_pdf to extract individual elements, generate
-    type-specific overlays, and create structured JSON output.
+    type-specific overlays, and create structured JSON output. Each page is
+    written to document.jsonl, its elements.json and the search index as soon
+    as it is processed.
     
     Args:
         pdf_path: Path to input PDF
@@ -64,14 +68,29 @@ def process_pdf_enhanced(
         extract_options: Options for element extraction
         generate_overlays: Whether to generate type-specific overlay images
         save_elements: Whether to save individual element images
+        index_dir: Search index directory to add this document to; defaults to a
+            fresh output_dir/search_index. Pass a shared directory to search across documents
+        keep_page_results: Whether to keep every page's elements and raw output in
+            'pages'; when False only page numbers and file paths are kept, so memory
+            does not grow with the page count
     
     Returns:
         Dictionary with:
             - 'markdown': Combined markdown text
-            - 'pages': List of per-page results with elements
-            - 'structure': Document structure JSON
+            - 'pages': List of per-page results (with elements if keep_page_results)
+            - 'structure': Document structure summary (metadata, page summaries, hierarchy)
+            - 'document_json': Path to the per-page document JSONL
+            - 'element_store': ElementStore with every element of the document
+            - 'search_index': Path to the search index directory
             - 'output_dir': Path to output directory
     """
+    import shutil
+    
+    from .extraction import ElementStore
+    from .linking.context_extractor import attach_element_text
+    from .linking.search_indexer import SearchIndexWriter, merge_segments
+    from .structuring.json_builder import DocumentJSONBuilder
+    
     pdf_path_obj = Path(pdf_path).expanduser().resolve()
     if not pdf_path_obj.is_file():
         raise FileNotFoundError(f"PDF file not found: {pdf_path_obj}")
@@ -87,9 +106,21 @@ def process_pdf_enhanced(
     if not image_paths:
         raise ValueError(f"No pages found in PDF: {pdf_path_obj}")
 
+    if index_dir is None:
+        index_path = output_root / "search_index"
+        if index_path.exists():
+            shutil.rmtree(index_path)
+    else:
+        index_path = Path(index_dir).expanduser().resolve()
+    index_writer = SearchIndexWriter(index_path)
+    index_segments = []
+    
+    document_builder = DocumentJSONBuilder(output_root / "document.jsonl", str(pdf_path_obj))
+    
     # Process each page with enhanced extraction
     page_results = []
     page_markdowns = []
+    page_stores = []
     
     for index, image_path in enumerate(image_paths, start=1):
         print(f"\nProcessing page {index}/{len(image_paths)}...")
@@ -104,14 +135,36 @@ def process_pdf_enhanced(
             extract_options=extract_options,
             generate_overlays=generate_overlays,
             save_elements=save_elements,
+            page_number=index,
         )
         
         page_result['page_number'] = index
         page_result['image_path'] = image_path
-        page_results.append(page_result)
-        
         page_markdowns.append(page_result['markdown'].strip())
-
+        elements = page_result['elements']
+        
+        # Write the page out as soon as it is done
+        attach_element_text(elements, page_result['raw_output'])
+        document_builder.add_page(index, elements, {'image_path': image_path})
+        with open(page_output_dir / "elements.json", 'w', encoding='utf-8') as f:
+            json.dump(elements, f, indent=2)
+        index_writer.add_elements(pdf_path_obj.stem, elements)
+        index_segments.append(index_writer.commit())
+        page_stores.append(ElementStore.from_elements(elements))
+        
+        if keep_page_results:
+            page_results.append(page_result)
+        else:
+            page_results.append({
+                'page_number': index,
+                'image_path': image_path,
+                'element_paths': page_result['element_paths'],
+                'overlay_paths': page_result['overlay_paths'],
+            })
+
+    document_structure = document_builder.close()
+    merge_segments(index_path, [segment for segment in index_segments if segment is not None])
+    
     # Create combined markdown
     combined_markdown = "\n\n".join(
         f"<!-- Page {idx} -->\n{content}" if content else f"<!-- Page {idx} -->"
@@ -121,45 +174,17 @@ def process_pdf_enhanced(
     combined_path = output_root / f"{pdf_path_obj.stem}.md"
     combined_path.write_text(combined_markdown, encoding="utf-8")
 
-    # Build document structure
-    all_elements = []
-    for page_result in page_results:
-        all_elements.extend(page_result['elements'])
-    
-    document_structure = {
-        'document_metadata': {
-            'source_file': str(pdf_path_obj),
-            'filename': pdf_path_obj.name,
-            'num_pages': len(page_results),
-            'total_elements': len(all_elements),
-        },
-        'pages': [
-            {
-                'page': result['page_number'],
-                'num_elements': len(result['elements']),
-                'element_types': list(set(e['type'] for e in result['elements'])),
-            }
-            for result in page_results
-        ],
-    }
-    
-    # Save structure JSON
+    # Save structure summary
     structure_path = output_root / "document_structure.json"
     with open(structure_path, 'w', encoding='utf-8') as f:
         json.dump(document_structure, f, indent=2)
     
-    # Save detailed elements per page
-    for page_result in page_results:
-        page_num = page_result['page_number']
-        page_dir = output_root / f"page_{page_num:04d}"
-        elements_json_path = page_dir / "elements.json"
-        
-        with open(elements_json_path, 'w', encoding='utf-8') as f:
-            json.dump(page_result['elements'], f, indent=2)
-    
     return {
         'markdown': combined_markdown,
         'pages': page_results,
         'structure': document_structure,
+        'document_json': str(document_builder.output_path),
+        'element_store': ElementStore.concat(page_stores),
+        'search_index': str(index_path),
         'output_dir': str(output_root),
     }
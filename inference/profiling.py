@@ -0,0 +1,215 @@
+"""Opt-in profiling hooks for the DeepSeek-V2 decoder.
+
+Records per-layer / per-component wall time (attention, gate, routed and
+shared experts, RMSNorm), per-expert token counts from the MoE gate and the
+bytes of weights each component reads, and exports them as CSV, folded
+stacks (for flamegraph.pl / speedscope) and a JSON expert-usage file.
+
+Modules are matched by class name because the model classes are loaded as
+remote code. Timing uses wall-clock time around each forward, which is exact
+on CPU; on CUDA it only measures launch time.
+"""
+
+import csv
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+# component label per module class (routed experts are DeepseekV2MLP under mlp.experts)
+PROFILED_CLASSES = {
+    'DeepseekV2DecoderLayer': 'layer',
+    'DeepseekV2Attention': 'attention',
+    'DeepseekV2SdpaAttention': 'attention',
+    'DeepseekV2FlashAttention2': 'attention',
+    'LlamaAttention': 'attention',
+    'LlamaSdpaAttention': 'attention',
+    'LlamaFlashAttention2': 'attention',
+    'DeepseekV2MoE': 'moe',
+    'MoEGate': 'gate',
+    'DeepseekV2MLP': 'mlp',
+    'DeepseekV2RMSNorm': 'rmsnorm',
+}
+# classes whose routed experts run only for some tokens; their weight bytes are summed from children
+CONTAINER_CLASSES = {'DeepseekV2DecoderLayer', 'DeepseekV2MoE'}
+
+
+def _weight_bytes(module: torch.nn.Module) -> int:
+    return sum(p.numel() * p.element_size() for p in module.parameters())
+
+
+def _layer_index(name: str) -> Optional[int]:
+    parts = name.split('.')
+    if 'layers' in parts:
+        index = parts.index('layers') + 1
+        if index < len(parts) and parts[index].isdigit():
+            return int(parts[index])
+    return None
+
+
+class DecoderProfiler:
+    """
+    Forward-hook profiler for DeepseekOCRForCausalLM.
+
+    Example:
+        with DecoderProfiler(model) as profiler:
+            model.infer(tokenizer, ...)
+        profiler.write_csv('profile.csv')
+        profiler.write_folded('profile.folded')
+        profiler.save_expert_stats('expert_stats.json')
+    """
+
+    def __init__(self, model: torch.nn.Module):
+        self.model = model
+        self._handles = []
+        self._starts: Dict[str, List[float]] = defaultdict(list)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.tokens: Dict[str, int] = defaultdict(int)
+        self.bytes_read: Dict[str, int] = defaultdict(int)
+        # layer index -> per-expert routed token counts
+        self.expert_counts: Dict[int, torch.Tensor] = {}
+        self._modules = {}
+
+    def __enter__(self) -> 'DecoderProfiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Register the hooks."""
+        for name, module in self.model.named_modules():
+            class_name = 'lm_head' if name.split('.')[-1] == 'lm_head' else type(module).__name__
+            if class_name not in PROFILED_CLASSES and class_name != 'lm_head':
+                continue
+            weight_bytes = 0 if class_name in CONTAINER_CLASSES else _weight_bytes(module)
+            self._modules[name] = class_name
+            self._handles.append(module.register_forward_pre_hook(self._pre_hook(name)))
+            self._handles.append(
+                module.register_forward_hook(self._post_hook(name, class_name, weight_bytes), with_kwargs=True)
+            )
+
+    def stop(self) -> None:
+        """Remove the hooks; collected statistics are kept."""
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+    def _pre_hook(self, name):
+        def hook(module, args):
+            self._starts[name].append(time.perf_counter())
+        return hook
+
+    def _post_hook(self, name, class_name, weight_bytes):
+        def hook(module, args, kwargs, output):
+            self.seconds[name] += time.perf_counter() - self._starts[name].pop()
+            self.calls[name] += 1
+            hidden_states = args[0] if args else kwargs.get('hidden_states')
+            if torch.is_tensor(hidden_states):
+                self.tokens[name] += hidden_states.numel() // hidden_states.shape[-1]
+            self.bytes_read[name] += weight_bytes
+            if class_name == 'MoEGate':
+                topk_idx = output[0]
+                counts = torch.bincount(topk_idx.reshape(-1).cpu(), minlength=module.n_routed_experts)
+                layer = _layer_index(name)
+                if layer in self.expert_counts:
+                    self.expert_counts[layer] += counts
+                else:
+                    self.expert_counts[layer] = counts
+        return hook
+
+    def _children(self) -> Dict[str, List[str]]:
+        """Nearest profiled ancestor -> profiled descendants directly below it."""
+        names = sorted(self.calls)
+        children = defaultdict(list)
+        for name in names:
+            parent = name
+            while '.' in parent:
+                parent = parent.rsplit('.', 1)[0]
+                if parent in self.calls:
+                    children[parent].append(name)
+                    break
+        return children
+
+    def rows(self) -> List[Dict]:
+        """Per-module statistics with inclusive and self time."""
+        children = self._children()
+
+        def inclusive_bytes(name):
+            if self._modules[name] in CONTAINER_CLASSES:
+                return sum(inclusive_bytes(child) for child in children[name])
+            return self.bytes_read[name]
+
+        rows = []
+        for name in sorted(self.calls):
+            total = self.seconds[name]
+            child_total = sum(self.seconds[child] for child in children[name])
+            rows.append({
+                'module': name,
+                'class': self._modules[name],
+                'component': PROFILED_CLASSES.get(self._modules[name], self._modules[name]),
+                'layer': _layer_index(name),
+                'calls': self.calls[name],
+                'tokens': self.tokens[name],
+                'total_ms': total * 1000.0,
+                'self_ms': max(total - child_total, 0.0) * 1000.0,
+                'mean_ms': total * 1000.0 / self.calls[name],
+                'weight_bytes_read': inclusive_bytes(name),
+            })
+        return rows
+
+    def write_csv(self, path: str) -> Path:
+        """Write one row per profiled module."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rows = self.rows()
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ['module'])
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def write_folded(self, path: str) -> Path:
+        """Write self time in microseconds as folded stacks ('a;b;c 123'), one line per module."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in self.rows():
+                micros = int(round(row['self_ms'] * 1000.0))
+                if micros > 0:
+                    f.write(f"{row['module'].replace('.', ';')} {micros}\n")
+        return path
+
+    def expert_stats(self) -> Dict:
+        """Per-layer routed token counts, ready for JSON."""
+        return {
+            'layers': {
+                str(layer): counts.tolist()
+                for layer, counts in sorted(self.expert_counts.items(), key=lambda item: item[0])
+            },
+        }
+
+    def save_expert_stats(self, path: str) -> Path:
+        """Write expert_stats() as JSON (consumed by inference.expert_placement)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.expert_stats(), f, indent=2)
+        return path
+
+    def write_expert_csv(self, path: str) -> Path:
+        """Write one (layer, expert, tokens) row per routed expert."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['layer', 'expert', 'tokens'])
+            for layer, counts in sorted(self.expert_counts.items(), key=lambda item: item[0]):
+                for expert, count in enumerate(counts.tolist()):
+                    writer.writerow([layer, expert, count])
+        return path
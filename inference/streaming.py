@@ -0,0 +1,197 @@
+"""Streaming OCR utilities for DeepSeek OCR on CPU.
+
+Decoded text and grounding elements are yielded while the model is still
+generating, so consumers can crop figures or write partial markdown before
+the page is finished.
+"""
+
+import asyncio
+import threading
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+import torch
+from PIL import ExifTags, Image
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+from .extraction.element_extractor import build_element
+from .extraction.grounding_parser import GroundingStreamParser
+from .image import PROMPT
+from .model_loader import load_model_and_tokenizer
+
+
+# EXIF orientations that rotate the page by 90 degrees (width and height swap)
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class _StopEvent(StoppingCriteria):
+    """Ends generate() once the event is set, e.g. when the stream consumer goes away."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def _oriented_size(image_path: str) -> Tuple[int, int]:
+    """Page size after EXIF orientation, as the model's load_image sees it (without decoding)."""
+    with Image.open(image_path) as image:
+        width, height = image.size
+        orientation = image.getexif().get(ExifTags.Base.Orientation)
+    if orientation in _TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def stream_image(
+    image_path: str,
+    output_dir: Optional[str] = None,
+    page_number: int = 1,
+    extract_options: Optional[Dict] = None,
+    prompt: str = PROMPT,
+    stop_event: Optional[threading.Event] = None,
+    **infer_kwargs,
+) -> Iterator[Dict]:
+    """
+    Run OCR on a single image and yield results as they are decoded.
+
+    Generation stops at the next decode step when the consumer stops iterating
+    (break, close() or garbage collection) or when stop_event is set, and the
+    generator only returns once model.infer has finished, so the next request
+    never runs on the model concurrently with this one.
+
+    Args:
+        image_path: Path to input image
+        output_dir: Directory for the usual result files (written once generation ends)
+        page_number: Page number used for element ids
+        extract_options: Options for element extraction (see extract_all_elements)
+        prompt: Prompt passed to the model
+        stop_event: Event that ends generation early when set (created if None)
+        **infer_kwargs: Extra keyword arguments for model.infer
+
+    Yields:
+        Event dictionaries:
+            - {'type': 'text', 'text': str} for each decoded chunk
+            - {'type': 'element', 'element': dict} as soon as a <|/det|> closes
+            - {'type': 'done', 'raw_output': str} once generation has finished
+    """
+    image_path = str(Path(image_path).expanduser().resolve())
+    if output_dir is not None:
+        output_dir = str(Path(output_dir).expanduser().resolve())
+
+    tokenizer, model = load_model_and_tokenizer()
+    image_width, image_height = _oriented_size(image_path)
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=False)
+    eos_text = tokenizer.decode([tokenizer.eos_token_id], skip_special_tokens=False)
+    stop_event = stop_event or threading.Event()
+    stopping_criteria = StoppingCriteriaList(infer_kwargs.pop('stopping_criteria', None) or [])
+    stopping_criteria.append(_StopEvent(stop_event))
+    errors = []
+
+    def _generate():
+        try:
+            model.infer(
+                tokenizer,
+                prompt=prompt,
+                image_file=image_path,
+                output_path=output_dir or "",
+                base_size=1024,
+                image_size=640,
+                crop_mode=True,
+                save_results=bool(output_dir),
+                streamer=streamer,
+                stopping_criteria=stopping_criteria,
+                **infer_kwargs,
+            )
+        except Exception as exc:
+            errors.append(exc)
+            # unblock the consumer
+            streamer.end()
+
+    worker = threading.Thread(target=_generate, daemon=True)
+    worker.start()
+
+    parser = GroundingStreamParser(keep_text=True)
+    element_index = 0
+    try:
+        for chunk in streamer:
+            chunk = chunk.replace(eos_text, "")
+            if not chunk:
+                continue
+            yield {'type': 'text', 'text': chunk}
+
+            for ref in parser.feed(chunk):
+                if ref.boxes is None:
+                    continue
+                element = build_element(
+                    ref.label,
+                    ref.boxes,
+                    image_width,
+                    image_height,
+                    page_number,
+                    element_index,
+                    extract_options,
+                    span=(ref.start, ref.end),
+                )
+                if element is None:
+                    continue
+                element_index += 1
+                yield {'type': 'element', 'element': element}
+    finally:
+        # a consumer that stops early must not leave generation running on the shared model
+        stop_event.set()
+        worker.join()
+    if errors:
+        raise errors[0]
+
+    yield {'type': 'done', 'raw_output': parser.get_text().strip()}
+
+
+async def astream_image(
+    image_path: str,
+    output_dir: Optional[str] = None,
+    page_number: int = 1,
+    extract_options: Optional[Dict] = None,
+    prompt: str = PROMPT,
+    **infer_kwargs,
+) -> AsyncIterator[Dict]:
+    """
+    Async variant of stream_image; the blocking iterator is advanced in a worker thread.
+
+    Yields:
+        The same events as stream_image
+    """
+    stop_event = threading.Event()
+    events = stream_image(
+        image_path,
+        output_dir=output_dir,
+        page_number=page_number,
+        extract_options=extract_options,
+        prompt=prompt,
+        stop_event=stop_event,
+        **infer_kwargs,
+    )
+    # a cancelled await leaves next() running in its thread; close() must wait for it
+    lock = threading.Lock()
+
+    def _next():
+        with lock:
+            return next(events, sentinel)
+
+    def _close():
+        with lock:
+            events.close()
+
+    sentinel = object()
+    try:
+        while True:
+            event = await asyncio.to_thread(_next)
+            if event is sentinel:
+                break
+            yield event
+    finally:
+        # aclose(), cancellation (e.g. a client disconnect) or normal end
+        stop_event.set()
+        await asyncio.to_thread(_close)
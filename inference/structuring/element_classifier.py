@@ -0,0 +1,107 @@
+"""
+Element enrichment.
+
+Adds content statistics, type-specific details, a semantic role and the
+position on the page to extracted elements, from the element text alone.
+"""
+
+import re
+from typing import Dict, Optional
+
+TAG_PATTERN = re.compile(r'<[^>]*>')
+TABLE_ROW_PATTERN = re.compile(r'<tr\b', re.IGNORECASE)
+TABLE_CELL_PATTERN = re.compile(r'<t[dh]\b', re.IGNORECASE)
+EQUATION_PATTERN = re.compile(r'\\\[|\\\(|\$')
+EQUATION_TAG_PATTERN = re.compile(r'\\tag\{([^}]*)\}')
+LIST_ITEM_PATTERN = re.compile(r'^\s*(?:[-*+\u2022]|\d+[.)])\s+', re.MULTILINE)
+
+# Role of element types in the page layout; everything else is body content
+SEMANTIC_ROLES = {
+    'title': 'heading',
+    'sub_title': 'heading',
+    'caption': 'caption',
+    'image_caption': 'caption',
+    'table_caption': 'caption',
+    'header': 'page_header',
+    'footer': 'page_footer',
+    'image': 'figure',
+    'table': 'table',
+    'equation': 'equation',
+}
+
+
+def analyze_content(content: str) -> Dict:
+    """
+    Markdown/HTML features of element text.
+    
+    Returns:
+        Dictionary with word_count, char_count, has_equation, has_table and num_list_items
+    """
+    plain = TAG_PATTERN.sub(' ', content)
+    return {
+        'word_count': len(plain.split()),
+        'char_count': len(content),
+        'has_equation': EQUATION_PATTERN.search(content) is not None,
+        'has_table': TABLE_ROW_PATTERN.search(content) is not None,
+        'num_list_items': len(LIST_ITEM_PATTERN.findall(content)),
+    }
+
+
+def _page_region(element: Dict) -> Dict:
+    """Relative vertical position of the element's union box."""
+    height = element['image_dimensions']['height']
+    boxes = element['bounding_boxes']
+    top = min(b['y1'] for b in boxes) / height if height else 0.0
+    bottom = max(b['y2'] for b in boxes) / height if height else 0.0
+    center = (top + bottom) / 2
+    return {
+        'relative_top': top,
+        'relative_bottom': bottom,
+        'region': 'top' if center < 1 / 3 else 'bottom' if center > 2 / 3 else 'middle',
+    }
+
+
+def enrich_element(
+    element: Dict,
+    content: Optional[str] = None,
+    page_context: Optional[Dict] = None
+) -> Dict:
+    """
+    Add metadata and classification to an element.
+    
+    Args:
+        element: Element dict from extract_all_elements
+        content: Element text (default: element['text'])
+        page_context: Optional page information; 'reading_order' overrides the
+            emission order and 'num_elements' adds the relative reading position
+    
+    Returns:
+        New element dict with 'content', 'semantic_role', 'reading_order',
+        'position' and, for tables and equations, type-specific details
+    """
+    if content is None:
+        content = element.get('text', '')
+    page_context = page_context or {}
+    
+    enriched = dict(element)
+    enriched['content'] = analyze_content(content)
+    enriched['semantic_role'] = SEMANTIC_ROLES.get(element['type'], 'body')
+    # the model emits elements in reading order
+    enriched['reading_order'] = page_context.get('reading_order', element['index'])
+    enriched['position'] = _page_region(element)
+    if page_context.get('num_elements'):
+        enriched['position']['relative_order'] = enriched['reading_order'] / page_context['num_elements']
+    
+    if element['type'] == 'table':
+        rows = len(TABLE_ROW_PATTERN.findall(content))
+        enriched['table'] = {
+            'rows': rows,
+            'columns': (len(TABLE_CELL_PATTERN.findall(content)) // rows) if rows else 0,
+        }
+    elif element['type'] == 'equation':
+        tag = EQUATION_TAG_PATTERN.search(content)
+        enriched['equation'] = {
+            'length': len(content),
+            'tag': tag.group(1) if tag else None,
+        }
+    return enriched
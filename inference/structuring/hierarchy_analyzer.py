@@ -0,0 +1,96 @@
+"""
+Document hierarchy detection.
+
+Builds the section tree from heading elements as they arrive, so pages can
+be added one at a time without keeping earlier pages' elements around.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from ..linking.context_extractor import HEADING_LEVELS, heading_text
+
+
+class HierarchyBuilder:
+    """
+    Incremental section tree.
+    
+    Only heading nodes are kept; other elements are counted in the section
+    that is open when they arrive.
+    
+    Example:
+        hierarchy = HierarchyBuilder()
+        for page in pages:
+            section_ids = hierarchy.add_elements(page['elements'])
+        tree = hierarchy.to_dict()
+    """
+    
+    def __init__(self):
+        self.root = self._node(None, None, 0, None)
+        self._stack = [self.root]
+        self.num_sections = 0
+    
+    @staticmethod
+    def _node(element_id: Optional[str], title: Optional[str], level: int, page: Optional[int]) -> Dict:
+        return {
+            'id': element_id,
+            'title': title,
+            'level': level,
+            'page': page,
+            'num_elements': 0,
+            'children': [],
+        }
+    
+    def add_elements(self, elements: Iterable[Dict]) -> List[Optional[str]]:
+        """
+        Add elements in reading order.
+        
+        Args:
+            elements: Element dicts (headings need 'text')
+        
+        Returns:
+            Id of the heading whose section each element belongs to (None before the first heading);
+            a heading belongs to its own section
+        """
+        section_ids = []
+        for element in elements:
+            level = HEADING_LEVELS.get(element['type'])
+            if level is not None:
+                while self._stack[-1]['level'] >= level:
+                    self._stack.pop()
+                node = self._node(element['id'], heading_text(element), level, element['page'])
+                self._stack[-1]['children'].append(node)
+                self._stack.append(node)
+                self.num_sections += 1
+            else:
+                self._stack[-1]['num_elements'] += 1
+            section_ids.append(self._stack[-1]['id'])
+        return section_ids
+    
+    @property
+    def section_path(self) -> List[str]:
+        """Titles of the currently open sections, outermost first."""
+        return [node['title'] for node in self._stack[1:]]
+    
+    def to_dict(self) -> Dict:
+        """Section tree with per-section element counts."""
+        return {
+            'num_sections': self.num_sections,
+            'unsectioned_elements': self.root['num_elements'],
+            'sections': self.root['children'],
+        }
+
+
+def build_document_hierarchy(elements: List[Dict]) -> Dict:
+    """
+    Detect document structure (sections, subsections) from headings.
+    
+    Args:
+        elements: Elements of the document in reading order (with 'text')
+    
+    Returns:
+        Dictionary with num_sections, unsectioned_elements and the nested
+        'sections' tree (id, title, level, page, num_elements, children)
+    """
+    hierarchy = HierarchyBuilder()
+    hierarchy.add_elements(elements)
+    return hierarchy.to_dict()
@@ -0,0 +1,221 @@
+"""
+Streaming document JSON builder.
+
+Pages are written to disk as they complete instead of being collected and
+dumped at the end, so memory does not grow with the page count and an
+interrupted run keeps every finished page.
+
+Two layouts are supported:
+
+    jsonl   one record per line: a 'document' header, one 'page' record per
+            page and a closing 'summary'. Every finished page is a complete
+            line, readable with iter_document_records().
+    json    a single object {"document_metadata": ..., "pages": [...],
+            "hierarchy": ..., "statistics": ...}; pages are appended to the
+            open array and the object is closed by close().
+"""
+
+import json
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .element_classifier import enrich_element
+from .hierarchy_analyzer import HierarchyBuilder
+
+JSON_SEPARATORS = (',', ':')
+
+
+class DocumentJSONBuilder:
+    """
+    Writes the structured document page by page.
+    
+    Example:
+        builder = DocumentJSONBuilder('out/document.jsonl', 'paper.pdf')
+        for page_number, elements in pages:
+            builder.add_page(page_number, elements)
+        structure = builder.close()
+    """
+    
+    def __init__(
+        self,
+        output_path,
+        source_file: str,
+        output_format: Optional[str] = None,
+        enrich: bool = True
+    ):
+        """
+        Args:
+            output_path: File to write
+            source_file: Source document path, stored in the metadata
+            output_format: 'jsonl' or 'json' (default: from the file suffix, jsonl otherwise)
+            enrich: Whether to add enrich_element metadata to every element
+        """
+        self.output_path = Path(output_path)
+        if output_format is None:
+            output_format = 'json' if self.output_path.suffix == '.json' else 'jsonl'
+        if output_format not in ('json', 'jsonl'):
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_format = output_format
+        self.enrich = enrich
+        self.hierarchy = HierarchyBuilder()
+        self.pages: List[Dict] = []
+        self.type_counts = Counter()
+        self.total_elements = 0
+        self.document_metadata = {
+            'source_file': str(source_file),
+            'filename': Path(source_file).name,
+            'created': datetime.now(timezone.utc).isoformat(),
+        }
+        
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.output_path, 'w', encoding='utf-8')
+        if self.output_format == 'jsonl':
+            self._write_record({'record': 'document', 'document_metadata': self.document_metadata})
+        else:
+            self._file.write('{"document_metadata":')
+            self._file.write(json.dumps(self.document_metadata, ensure_ascii=False, separators=JSON_SEPARATORS))
+            self._file.write(',"pages":[')
+        self._file.flush()
+    
+    def __enter__(self) -> 'DocumentJSONBuilder':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # keep what was written; a jsonl file stays readable up to the last page
+            self._file.close()
+    
+    def _write_record(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=JSON_SEPARATORS))
+        self._file.write('\n')
+    
+    def add_page(self, page_number: int, elements: List[Dict], page_metadata: Optional[Dict] = None) -> Dict:
+        """
+        Write one page and update the running hierarchy and statistics.
+        
+        Args:
+            page_number: Page number
+            elements: Elements of the page in reading order (with 'text' for enrichment and headings)
+            page_metadata: Extra page fields to store (e.g. image_path)
+        
+        Returns:
+            Page summary (page, num_elements, element_types, section_path), as kept in memory
+        """
+        section_ids = self.hierarchy.add_elements(elements)
+        records = []
+        for element, section_id in zip(elements, section_ids):
+            record = (
+                enrich_element(element, page_context={'num_elements': len(elements)}) if self.enrich
+                else dict(element)
+            )
+            record['section_id'] = section_id
+            records.append(record)
+        
+        types = Counter(element['type'] for element in elements)
+        self.type_counts.update(types)
+        self.total_elements += len(elements)
+        summary = {
+            'page': page_number,
+            'num_elements': len(elements),
+            'element_types': list(types),
+            # sections still open at the end of the page
+            'section_path': self.hierarchy.section_path,
+        }
+        self.pages.append(summary)
+        
+        page = dict(summary)
+        page.update(page_metadata or {})
+        page['elements'] = records
+        if self.output_format == 'jsonl':
+            self._write_record({'record': 'page', **page})
+        else:
+            if len(self.pages) > 1:
+                self._file.write(',')
+            self._file.write(json.dumps(page, ensure_ascii=False, separators=JSON_SEPARATORS))
+        self._file.flush()
+        return summary
+    
+    @property
+    def statistics(self) -> Dict:
+        return {
+            'num_pages': len(self.pages),
+            'total_elements': self.total_elements,
+            'element_types': dict(self.type_counts),
+        }
+    
+    def close(self) -> Dict:
+        """
+        Write the hierarchy and statistics and close the file.
+        
+        Returns:
+            Document structure without element lists: document_metadata (with
+            num_pages and total_elements), page summaries, hierarchy and statistics
+        """
+        hierarchy = self.hierarchy.to_dict()
+        statistics = self.statistics
+        if not self._file.closed:
+            if self.output_format == 'jsonl':
+                self._write_record({'record': 'summary', 'hierarchy': hierarchy, 'statistics': statistics})
+            else:
+                self._file.write('],"hierarchy":')
+                self._file.write(json.dumps(hierarchy, ensure_ascii=False, separators=JSON_SEPARATORS))
+                self._file.write(',"statistics":')
+                self._file.write(json.dumps(statistics, ensure_ascii=False, separators=JSON_SEPARATORS))
+                self._file.write('}')
+            self._file.close()
+        
+        return {
+            'document_metadata': {
+                **self.document_metadata,
+                'num_pages': statistics['num_pages'],
+                'total_elements': statistics['total_elements'],
+            },
+            'pages': self.pages,
+            'hierarchy': hierarchy,
+            'statistics': statistics,
+        }
+
+
+def iter_document_records(path) -> Iterator[Dict]:
+    """
+    Read a jsonl document record by record.
+    
+    A truncated last line (from an interrupted run) is skipped, so every
+    page that was completed is still returned.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            yield json.loads(line)
+
+
+def build_document_json(
+    pdf_path: str,
+    pages_data: Iterable[Dict],
+    output_path: str,
+    output_format: Optional[str] = None
+) -> Dict:
+    """
+    Build the structured JSON representation of a document.
+    
+    pages_data is consumed one page at a time, so it can be a generator
+    that yields pages as they are processed.
+    
+    Args:
+        pdf_path: Source PDF path
+        pages_data: Per-page data with 'elements' and 'page_number' (or 'page')
+        output_path: Where to save the JSON / JSONL document
+        output_format: 'jsonl' or 'json' (default: from the output_path suffix)
+    
+    Returns:
+        Document structure summary (see DocumentJSONBuilder.close)
+    """
+    with DocumentJSONBuilder(output_path, pdf_path, output_format) as builder:
+        for number, page in enumerate(pages_data, start=1):
+            builder.add_page(page.get('page_number', page.get('page', number)), page['elements'])
+    return builder.close()
@@ -263,6 +263,24 @@ class CLIPVisionEmbeddings(nn.Module):
         self.register_buffer(
             "position_ids", torch.arange(self.num_positions).expand((1, -1))
         )
+        # resized position tables keyed by (num_tokens, dtype, device)
+        self._pos_embed_cache = {}
+
+    def get_position_embedding(self, tgt_size):
+        if self.training:
+            return get_abs_pos(self.position_embedding(self.position_ids), tgt_size)
+
+        weight = self.position_embedding.weight
+        key = (tgt_size, weight.dtype, weight.device)
+        pos_embed = self._pos_embed_cache.get(key)
+        if pos_embed is None:
+            with torch.no_grad():
+                pos_embed = get_abs_pos(self.position_embedding(self.position_ids), tgt_size)
+            self._pos_embed_cache[key] = pos_embed
+        return pos_embed
+
+    def clear_pos_cache(self):
+        self._pos_embed_cache.clear()
 
     def forward(self, pixel_values, patch_embeds):
         batch_size = pixel_values.shape[0]
@@ -287,7 +305,7 @@ class CLIPVisionEmbeddings(nn.Module):
         embeddings = torch.cat([class_embeds, patch_embeds], dim=1)
 
         # x = torch.cat([cls_token, x], dim=1)
-        embeddings = embeddings + get_abs_pos(self.position_embedding(self.position_ids), embeddings.size(1))
+        embeddings = embeddings + self.get_position_embedding(embeddings.size(1))
         # embeddings = embeddings + self.position_embedding(self.position_ids)
         return embeddings
 
@@ -495,6 +513,10 @@ class VitModel(nn.Module):
     def __str__(self) -> str:
         return "open_clip"
 
+    def precompute_pos_cache(self, num_tokens_list):
+        for num_tokens in num_tokens_list:
+            self.embeddings.get_position_embedding(num_tokens)
+
     def forward(
             self,
             x,
@@ -695,11 +717,47 @@ class ImageEncoderViT(nn.Module):
         self.net_2 = nn.Conv2d(256, 512, kernel_size=3, stride=2, padding=1, bias=False)
         self.net_3 = nn.Conv2d(512, 1024, kernel_size=3, stride=2, padding=1, bias=False)
 
+        # resized absolute position tables keyed by (grid_size, dtype, device)
+        self._pos_embed_cache = {}
+
+    def get_pos_embed(self, tgt_size: int) -> torch.Tensor:
+        if self.training:
+            return get_abs_pos_sam(self.pos_embed, tgt_size)
+
+        key = (tgt_size, self.pos_embed.dtype, self.pos_embed.device)
+        pos_embed = self._pos_embed_cache.get(key)
+        if pos_embed is None:
+            with torch.no_grad():
+                pos_embed = get_abs_pos_sam(self.pos_embed, tgt_size)
+            self._pos_embed_cache[key] = pos_embed
+        return pos_embed
+
+    def precompute_pos_cache(self, image_sizes) -> None:
+        """
+        Fill the absolute and relative position caches for the given input resolutions.
+
+        Args:
+            image_sizes (list(int)): Square input resolutions that will be fed to the encoder.
+        """
+        for image_size in image_sizes:
+            grid_size = image_size // self.patch_embed.proj.stride[0]
+            if self.pos_embed is not None:
+                self.get_pos_embed(grid_size)
+            for blk in self.blocks:
+                size = blk.window_size if blk.window_size > 0 else grid_size
+                if blk.attn.use_rel_pos:
+                    blk.attn.get_rel_pos_tables((size, size), (size, size))
+
+    def clear_pos_cache(self) -> None:
+        self._pos_embed_cache.clear()
+        for blk in self.blocks:
+            blk.attn._rel_pos_cache.clear()
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         x = self.patch_embed(x)
         if self.pos_embed is not None:
             # x = x + self.pos_embed
-            x = x + get_abs_pos_sam(self.pos_embed, x.size(1))
+            x = x + self.get_pos_embed(x.size(1))
 
         for blk in self.blocks:
             x = blk(x)
@@ -816,6 +874,33 @@ class Attention(nn.Module):
             self.rel_pos_h = nn.Parameter(torch.zeros(2 * input_size[0] - 1, head_dim))
             self.rel_pos_w = nn.Parameter(torch.zeros(2 * input_size[1] - 1, head_dim))
 
+        # gathered (Rh, Rw) tables keyed by (q_size, k_size, dtype, device)
+        self._rel_pos_cache = {}
+
+    def get_rel_pos_tables(
+        self, q_size: Tuple[int, int], k_size: Tuple[int, int]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Return the relative position tables (Rh, Rw) for the given query / key sizes,
+        reusing the interpolated and gathered tables outside of training.
+        """
+        if self.training:
+            return (
+                get_rel_pos(q_size[0], k_size[0], self.rel_pos_h),
+                get_rel_pos(q_size[1], k_size[1], self.rel_pos_w),
+            )
+
+        key = (q_size, k_size, self.rel_pos_h.dtype, self.rel_pos_h.device)
+        tables = self._rel_pos_cache.get(key)
+        if tables is None:
+            with torch.no_grad():
+                tables = (
+                    get_rel_pos(q_size[0], k_size[0], self.rel_pos_h),
+                    get_rel_pos(q_size[1], k_size[1], self.rel_pos_w),
+                )
+            self._rel_pos_cache[key] = tables
+        return tables
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         B, H, W, _ = x.shape
         # qkv with shape (3, B, nHead, H * W, C)
@@ -825,7 +910,10 @@ class Attention(nn.Module):
 
         rel_h, rel_w = None, None
         if self.use_rel_pos:
-            rel_h, rel_w = add_decomposed_rel_pos(q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W))
+            rel_h, rel_w = add_decomposed_rel_pos(
+                q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W),
+                rel_pos_tables=self.get_rel_pos_tables((H, W), (H, W)),
+            )
 
         q = q.view(B, self.num_heads, H * W, -1)
         k = k.view(B, self.num_heads, H * W, -1)
@@ -937,6 +1025,7 @@ def add_decomposed_rel_pos(
     rel_pos_w: torch.Tensor,
     q_size: Tuple[int, int],
     k_size: Tuple[int, int],
+    rel_pos_tables: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
 ) -> torch.Tensor:
     """
     Calculate decomposed Relative Positional Embeddings from :paper:`mvitv2`.
@@ -947,14 +1036,18 @@ def add_decomposed_rel_pos(
         rel_pos_w (Tensor): relative position embeddings (Lw, C) for width axis.
         q_size (Tuple): spatial sequence size of query q with (q_h, q_w).
         k_size (Tuple): spatial sequence size of key k with (k_h, k_w).
+        rel_pos_tables (Tuple or None): precomputed (Rh, Rw) from get_rel_pos, if available.
 
     Returns:
         attn (Tensor): attention map with added relative positional embeddings.
     """
     q_h, q_w = q_size
     k_h, k_w = k_size
-    Rh = get_rel_pos(q_h, k_h, rel_pos_h)
-    Rw = get_rel_pos(q_w, k_w, rel_pos_w)
+    if rel_pos_tables is not None:
+        Rh, Rw = rel_pos_tables
+    else:
+        Rh = get_rel_pos(q_h, k_h, rel_pos_h)
+        Rw = get_rel_pos(q_w, k_w, rel_pos_w)
 
     B, _, dim = q.shape
     r_q = q.reshape(B, q_h, q_w, dim)
@@ -2,7 +2,7 @@ from .modeling_deepseekv2 import DeepseekV2Model, DeepseekV2ForCausalLM
 from .configuration_deepseek_v2 import DeepseekV2Config
 from transformers.modeling_outputs import BaseModelOutputWithPast, CausalLMOutputWithPast
 from typing import List, Optional, Tuple, Union
-from transformers.cache_utils import Cache
+from transformers.cache_utils import Cache, DynamicCache
 import requests
 from PIL import Image, ImageOps, ImageDraw, ImageFont
 from io import BytesIO
@@ -12,16 +12,19 @@ from torch.nn import CrossEntropyLoss
 from torchvision import transforms
 from torchvision.transforms.functional import InterpolationMode
 import os
+import hashlib
 from .deepencoder import build_sam_vit_b, build_clip_l, MlpProjector
 from addict import Dict
-from transformers import TextStreamer
+from transformers import TextStreamer, LogitsProcessor, LogitsProcessorList
+from transformers.generation.candidate_generator import CandidateGenerator, PromptLookupCandidateGenerator
 from .conversation import get_conv_template
 from abc import ABC
 import math
-import re
 from tqdm import tqdm
 import numpy as np
 import time
+import gc
+from collections import OrderedDict
 
 
 def load_image(image_path):
@@ -41,17 +44,104 @@ def load_image(image_path):
             return None
 
 
-def re_match(text):
-    pattern = r'(<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>)'
-    matches = re.findall(pattern, text, re.DOTALL)
+# This file is loaded as remote code and cannot import the inference package,
+# so it keeps a local copy of the single-pass grounding scanner
+# (inference/extraction/grounding_parser.py).
+def _grounding_spans(text):
+    """Yield (start, ref_end, det_start, det_end, end) offsets of every grounding reference in one pass."""
+    pos = 0
+    while True:
+        start = text.find('<|ref|>', pos)
+        if start < 0:
+            return
+        ref_end = text.find('<|/ref|>', start + 7)
+        if ref_end < 0:
+            return
+        det_start = ref_end + 8
+        if not text.startswith('<|det|>', det_start):
+            pos = start + 7
+            continue
+        det_end = text.find('<|/det|>', det_start + 7)
+        if det_end < 0:
+            return
+        end = det_end + 8
+        yield start, ref_end, det_start, det_end, end
+        pos = end
+
+
+def iter_grounding_matches(text):
+    """Yield (full_ref, label, coords_str) for every <|ref|>..<|/ref|><|det|>..<|/det|> in one pass."""
+    for start, ref_end, det_start, det_end, end in _grounding_spans(text):
+        yield text[start:end], text[start + 7:ref_end], text[det_start + 7:det_end]
+
+
+def render_markdown(text):
+    """
+    Strip grounding references from model output in one pass.
+
+    Image references become ![](images/<n>.jpg) links numbered in order; all
+    other references are dropped. \\coloneqq / \\eqqcolon are only
+    rewritten when the page has any non-image reference.
+    """
+    parts = []
+    pos = 0
+    image_idx = 0
+    has_other = False
+    for start, ref_end, _, _, end in _grounding_spans(text):
+        parts.append(text[pos:start])
+        if text[start + 7:ref_end] == 'image':
+            parts.append(f'![](images/{image_idx}.jpg)\n')
+            image_idx += 1
+        else:
+            has_other = True
+        pos = end
+    parts.append(text[pos:])
+    markdown = ''.join(parts)
+    if has_other:
+        markdown = markdown.replace('\\coloneqq', ':=').replace('\\eqqcolon', '=:')
+    return markdown
+
+
+def parse_coordinate_list(coords_str):
+    """Parse '[[x1, y1, x2, y2], ...]' without eval; returns nested lists of numbers or None."""
+    stack, result, number = [], None, ''
+    for ch in coords_str + ' ':
+        if ch.isdigit() or ch in '.-':
+            if not stack:
+                return None
+            number += ch
+            continue
+        if number:
+            try:
+                stack[-1].append(float(number) if '.' in number else int(number))
+            except ValueError:
+                return None
+            number = ''
+        if ch == '[':
+            if result is not None:
+                return None
+            new_list = []
+            if stack:
+                stack[-1].append(new_list)
+            stack.append(new_list)
+        elif ch == ']':
+            if not stack:
+                return None
+            closed = stack.pop()
+            if not stack:
+                result = closed
+        elif ch != ',' and not ch.isspace():
+            return None
+    return None if stack else result
 
-    # pattern1 = r'<\|ref\|>.*?<\|/ref\|>\n'
-    # new_text1 = re.sub(pattern1, '', text, flags=re.DOTALL)
+
+def re_match(text):
+    matches = list(iter_grounding_matches(text))
 
     mathes_image = []
     mathes_other = []
     for a_match in matches:
-        if '<|ref|>image<|/ref|>' in a_match[0]:
+        if a_match[1] == 'image':
             mathes_image.append(a_match[0])
         else:
             mathes_other.append(a_match[0])
@@ -60,11 +150,10 @@ def re_match(text):
 
 def extract_coordinates_and_label(ref_text, image_width, image_height):
 
-    try:
-        label_type = ref_text[1]
-        cor_list = eval(ref_text[2])
-    except Exception as e:
-        print(e)
+    label_type = ref_text[1]
+    cor_list = parse_coordinate_list(ref_text[2])
+    if cor_list is None:
+        print(f"invalid coordinates: {ref_text[2]!r}")
         return None
 
     return (label_type, cor_list)
@@ -348,6 +437,276 @@ class NoEOSTextStreamer(TextStreamer):
         print(text, flush=True, end="")
 
 
+class GroundingGrammar:
+    """
+    Token-level grammar of the grounding syntax
+
+        <|ref|>label<|/ref|><|det|>[[x1, y1, x2, y2], ...]<|/det|>
+
+    with coordinates in 0-999. The label is free text; <|det|>[[ after <|/ref|> and <|/det|> after
+    the closing ]] are fully determined, and inside the coordinate list only tokens that keep the
+    text a valid prefix of the list are allowed.
+    """
+
+    COORD_CHARS = set('0123456789[], ')
+    MAX_DIGITS = 3
+    NUM_COORDS = 4
+    # how far back to look for the last grounding marker
+    WINDOW = 256
+    # memoised tails (a few per batch row and decode step)
+    STATE_CACHE_SIZE = 64
+
+    def __init__(self, tokenizer):
+        self.ref_id, self.ref_end_id, self.det_id, self.det_end_id = [
+            self._single_token_id(tokenizer, marker) for marker in ('<|ref|>', '<|/ref|>', '<|det|>', '<|/det|>')
+        ]
+        self.marker_ids = frozenset((self.ref_id, self.ref_end_id, self.det_id, self.det_end_id))
+        self.det_open_ids = tokenizer.encode('<|det|>[[', add_special_tokens=False)
+
+        # candidate tokens for the coordinate list: text made only of digits, brackets, commas and spaces
+        self.coord_token_text = {}
+        for token_id, token in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+            if not token or token_id in (self.ref_id, self.ref_end_id, self.det_id, self.det_end_id):
+                continue
+            if not set(token.replace('Ġ', ' ').replace('▁', ' ')) <= self.COORD_CHARS:
+                continue
+            text = tokenizer.convert_tokens_to_string([token])
+            if text and set(text) <= self.COORD_CHARS:
+                self.coord_token_text[token_id] = text
+        self._allowed_by_state = {}
+        self._state_by_tail = {}
+
+    @staticmethod
+    def _single_token_id(tokenizer, marker):
+        ids = tokenizer.encode(marker, add_special_tokens=False)
+        if len(ids) != 1:
+            raise ValueError(f'{marker} is not a single token for this tokenizer')
+        return ids[0]
+
+    @classmethod
+    def _advance(cls, state, text):
+        """Run the coordinate-list automaton over text; returns the new state or None if text is invalid."""
+        for ch in text:
+            kind = state[0]
+            if kind == 'start':
+                state = ('open',) if ch == '[' else None
+            elif kind == 'open':
+                state = ('num', 0, 0) if ch == '[' else None
+            elif kind == 'num':
+                _, coord, digits = state
+                if ch.isdigit() and digits < cls.MAX_DIGITS:
+                    state = ('num', coord, digits + 1)
+                elif ch == ',' and digits and coord < cls.NUM_COORDS - 1:
+                    state = ('space', coord)
+                elif ch == ']' and digits and coord == cls.NUM_COORDS - 1:
+                    state = ('box_end',)
+                else:
+                    state = None
+            elif kind == 'space':
+                state = ('num', state[1] + 1, 0) if ch == ' ' else None
+            elif kind == 'box_end':
+                state = ('box_sep',) if ch == ',' else ('done',) if ch == ']' else None
+            elif kind == 'box_sep':
+                state = ('open',) if ch == ' ' else None
+            else:
+                state = None
+            if state is None:
+                return None
+        return state
+
+    def _allowed_in_state(self, state):
+        allowed = self._allowed_by_state.get(state)
+        if allowed is None:
+            if state == ('done',):
+                allowed = [self.det_end_id]
+            else:
+                allowed = [
+                    token_id for token_id, text in self.coord_token_text.items()
+                    if self._advance(state, text) is not None
+                ]
+            self._allowed_by_state[state] = allowed
+        return allowed
+
+    def _state(self, input_ids):
+        """Grammar state at the end of a 1D id sequence: None (unconstrained), 'det_open' or a coordinate state."""
+        tail = input_ids[-self.WINDOW:]
+        # the logits processor, the draft generator and the vocabulary subset all ask for the state of
+        # the same sequences in a decode step; the state depends only on the tail, so it is memoised
+        key = tuple(tail.tolist())
+        if key in self._state_by_tail:
+            return self._state_by_tail[key]
+        if len(self._state_by_tail) >= self.STATE_CACHE_SIZE:
+            self._state_by_tail.clear()
+        state = self._compute_state(key)
+        self._state_by_tail[key] = state
+        return state
+
+    def _compute_state(self, tail):
+        last = next((i for i in range(len(tail) - 1, -1, -1) if tail[i] in self.marker_ids), None)
+        if last is None:
+            return None
+        marker = tail[last]
+        if marker == self.ref_end_id and last == len(tail) - 1:
+            return 'det_open'
+        if marker != self.det_id:
+            return None
+        text = ''.join(self.coord_token_text.get(token_id, '\0') for token_id in tail[last + 1:])
+        # malformed lists produced before the constraint was active are left alone
+        return self._advance(('start',), text)
+
+    def allowed_tokens(self, input_ids):
+        """Ids the next token may take, or None when the position is unconstrained."""
+        state = self._state(input_ids)
+        if state is None:
+            return None
+        if state == 'det_open':
+            return [self.det_open_ids[0]]
+        return self._allowed_in_state(state)
+
+    def forced_tokens(self, input_ids):
+        """Tokens fully determined by the grammar at the end of input_ids (possibly empty)."""
+        state = self._state(input_ids)
+        if state is None:
+            return []
+        if state == 'det_open':
+            return list(self.det_open_ids)
+        forced = []
+        while state is not None:
+            allowed = self._allowed_in_state(state)
+            if len(allowed) != 1:
+                break
+            forced.append(allowed[0])
+            if allowed[0] == self.det_end_id:
+                break
+            state = self._advance(state, self.coord_token_text[allowed[0]])
+        return forced
+
+
+class GroundingLogitsProcessor(LogitsProcessor):
+    """Mask every token the GroundingGrammar does not allow at the current position."""
+
+    def __init__(self, grammar: GroundingGrammar):
+        self.grammar = grammar
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        for row in range(input_ids.shape[0]):
+            allowed = self.grammar.allowed_tokens(input_ids[row])
+            if allowed is None:
+                continue
+            allowed = torch.tensor(allowed, dtype=torch.long, device=scores.device)
+            row_scores = torch.full_like(scores[row], float('-inf'))
+            row_scores[allowed] = scores[row, allowed]
+            scores[row] = row_scores
+        return scores
+
+
+class GroundingDraftCandidateGenerator(CandidateGenerator):
+    """
+    Draft generator for prompt-lookup speculative decoding of OCR output. Tokens forced by the grounding
+    grammar (e.g. <|det|>[[ after <|/ref|>) are drafted first; the draft is then extended (or, with nothing
+    forced, produced) by n-gram lookup over prompt and output. All drafted tokens are verified by the target
+    model in a single forward pass, so forced tokens cost no decode step of their own.
+    """
+
+    def __init__(self, lookup: PromptLookupCandidateGenerator, grammar: GroundingGrammar, use_lookup: bool = True):
+        self.lookup = lookup
+        self.grammar = grammar
+        self.use_lookup = use_lookup
+
+    def get_candidates(self, input_ids: torch.LongTensor):
+        cur_len = input_ids.shape[-1]
+        num_output_tokens = min(self.lookup.num_output_tokens, self.lookup.max_length - cur_len - 1)
+        if num_output_tokens <= 0:
+            return input_ids, None
+
+        forced = self.grammar.forced_tokens(input_ids[0])
+        if forced:
+            draft = torch.tensor(forced[:num_output_tokens], dtype=input_ids.dtype, device=input_ids.device)
+            input_ids = torch.cat([input_ids, draft[None, :]], dim=-1)
+
+        if self.use_lookup:
+            input_ids, _ = self.lookup.get_candidates(input_ids)
+        return input_ids[:, :cur_len + num_output_tokens], None
+
+    def update_candidate_strategy(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, num_matches: int):
+        self.lookup.update_candidate_strategy(input_ids, scores, num_matches)
+
+
+# draft length when only grammar-forced tokens are drafted (<|det|>[[ plus slack)
+GROUNDING_FORCED_DRAFT_TOKENS = 4
+
+# version 2 adds image_digest (checked on import) and valid_img_tokens to the metadata
+PREFILL_FORMAT_VERSION = '2'
+IMAGE_TOKEN_ID = 128815
+
+
+def image_file_digest(path):
+    """blake2b digest of an image file's bytes; ties an exported prefill to its page."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_prefill_inputs(path, input_ids, images_seq_mask, image_embeds, images_spatial_crop=None, metadata=None):
+    """
+    Write a page's prepared prefill inputs to a safetensors file so another process
+    (or a later run with a different prompt) can skip the vision encoders.
+
+    Args:
+        path (str): Output .safetensors path.
+        input_ids (torch.LongTensor): (L,) prompt token ids including the image tokens.
+        images_seq_mask (torch.BoolTensor): (L,) True at image token positions.
+        image_embeds (list(torch.Tensor)): Per image sample (num_image_tokens, n_embed) projected features.
+        images_spatial_crop (torch.LongTensor or None): Per sample (width_crop_num, height_crop_num).
+        metadata (dict or None): Extra string-convertible values (prompt, base_size, ...).
+    """
+    from safetensors.torch import save_file
+
+    tensors = {
+        'input_ids': input_ids.detach().reshape(-1).cpu().contiguous(),
+        'images_seq_mask': images_seq_mask.detach().reshape(-1).cpu().contiguous(),
+    }
+    for idx, embeds in enumerate(image_embeds):
+        tensors[f'image_embeds.{idx}'] = embeds.detach().cpu().contiguous()
+    if images_spatial_crop is not None:
+        tensors['images_spatial_crop'] = images_spatial_crop.detach().cpu().contiguous()
+
+    header = {str(k): str(v) for k, v in (metadata or {}).items()}
+    header['format_version'] = PREFILL_FORMAT_VERSION
+    header['num_images'] = str(len(image_embeds))
+    header['num_image_tokens'] = str(sum(int(embeds.shape[0]) for embeds in image_embeds))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    save_file(tensors, path, metadata=header)
+
+
+def load_prefill_inputs(path, device='cpu'):
+    """
+    Read a file written by save_prefill_inputs().
+
+    Returns:
+        prefill (dict): input_ids, images_seq_mask, image_embeds (list), images_spatial_crop (or None)
+            and metadata (dict of str).
+    """
+    from safetensors import safe_open
+
+    with safe_open(path, framework='pt', device=str(device)) as f:
+        metadata = dict(f.metadata() or {})
+        if metadata.get('format_version') != PREFILL_FORMAT_VERSION:
+            raise ValueError(f'{path}: unsupported prefill format version {metadata.get("format_version")!r}')
+        keys = set(f.keys())
+        image_embeds = [f.get_tensor(f'image_embeds.{idx}') for idx in range(int(metadata['num_images']))]
+        return {
+            'input_ids': f.get_tensor('input_ids'),
+            'images_seq_mask': f.get_tensor('images_seq_mask'),
+            'image_embeds': image_embeds,
+            'images_spatial_crop': f.get_tensor('images_spatial_crop') if 'images_spatial_crop' in keys else None,
+            'metadata': metadata,
+        }
+
+
 class DeepseekOCRConfig(DeepseekV2Config):
     model_type = "DeepseekOCR"
 
@@ -357,155 +716,218 @@ class DeepseekOCRModel(DeepseekV2Model):
     def __init__(self, config: DeepseekV2Config):
         super(DeepseekOCRModel, self).__init__(config)
 
-        self.sam_model = build_sam_vit_b()
-        self.vision_model = build_clip_l()
-        # self.conv_2 = nn.Conv2d(in_channels=1024, out_channels=2048, kernel_size=2, stride=2)
         n_embed = 1280
-        self.projector =  MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=n_embed))
+        # decoder-only workers (config.vision_encoder = False) take precomputed image_embeds instead
+        if getattr(config, 'vision_encoder', True):
+            self.sam_model = build_sam_vit_b()
+            self.vision_model = build_clip_l()
+            # self.conv_2 = nn.Conv2d(in_channels=1024, out_channels=2048, kernel_size=2, stride=2)
+            self.projector =  MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=n_embed))
+        else:
+            self.sam_model = None
+            self.vision_model = None
+            self.projector = None
         embed_std = 1 / torch.sqrt(torch.tensor(n_embed, dtype=torch.float32))
         self.image_newline = nn.Parameter(torch.randn(n_embed) * embed_std)
         self.view_seperator = nn.Parameter(torch.randn(n_embed) * embed_std)
 
 
+    def precompute_vision_caches(self, image_sizes=(640, 1024)):
+        """
+        Resize the SAM / CLIP position tables once for the given input resolutions
+        (e.g. base_size and image_size of the configured mode) instead of on every crop.
+        """
+        sam_model = getattr(self, 'sam_model', None)
+        vision_model = getattr(self, 'vision_model', None)
+        if sam_model is None or vision_model is None:
+            return
 
-    
-    def forward(
-        self,
-        input_ids: torch.LongTensor = None,
-        attention_mask: Optional[torch.Tensor] = None,
-        position_ids: Optional[torch.LongTensor] = None,
-        past_key_values: Optional[List[torch.FloatTensor]] = None,
-        inputs_embeds: Optional[torch.FloatTensor] = None,
-        use_cache: Optional[bool] = None,
-        output_attentions: Optional[bool] = None,
-        output_hidden_states: Optional[bool] = None,
-        images: Optional[torch.FloatTensor] = None,
-        images_seq_mask: Optional[torch.FloatTensor] = None,
-        images_spatial_crop: Optional[torch.FloatTensor] = None,
-        return_dict: Optional[bool] = None,
-    ) -> Union[Tuple, BaseModelOutputWithPast]:
+        sam_model.precompute_pos_cache(image_sizes)
+        # SAM downsamples 16x in the patch embed and 4x in net_2 / net_3; CLIP adds a cls token
+        vision_model.precompute_pos_cache([(image_size // 64) ** 2 + 1 for image_size in image_sizes])
 
+    def encode_view(self, pixel_values):
+        """Run SAM -> CLIP -> projector on a batch of views, returning (B, tokens, n_embed)."""
+        features_1 = self.sam_model(pixel_values)
+        features_2 = self.vision_model(pixel_values, features_1)
+        features = torch.cat((features_2[:, 1:], features_1.flatten(2).permute(0, 2, 1)), dim=-1)
+        return self.projector(features)
 
+    def encode_images(self, images, images_spatial_crop):
+        """
+        Encode each sample's (crops, global view) pair into the image token embeddings
+        that are scattered over the images_seq_mask positions.
 
+        Args:
+            images (list(tuple(torch.Tensor, torch.Tensor))): Per sample (patches, image_ori) as passed to forward().
+            images_spatial_crop (torch.Tensor): Per sample (width_crop_num, height_crop_num).
 
-        if inputs_embeds is None:
-            # inputs_embeds = self.embed_tokens(input_ids)
-            inputs_embeds = self.get_input_embeddings()(input_ids)
+        Returns:
+            image_embeds (list(torch.Tensor)): Per sample (num_image_tokens, n_embed) features.
+        """
+        image_embeds = []
+        for image, crop_shape in zip(images, images_spatial_crop):
+            images_in_this_batch = []
 
+            patches = image[0]
+            image_ori = image[1]
 
+            with torch.no_grad():
+            # with torch.inference_mode(): 
+                
+                if torch.sum(patches).item() != 0:
+                    # P, C, H, W = patches.shape
+                    crop_flag = 1
+                    local_features = self.encode_view(patches)
+                    # vit_time = time.time()
 
-        sam_model = getattr(self, 'sam_model', None)
-        # sam_model = self.sam_model
-        vision_model = getattr(self, 'vision_model', None)
+                    global_features = self.encode_view(image_ori)
 
+                    _, hw, n_dim = global_features.shape
+                    h = w = int(hw ** 0.5)
 
+                    _2, hw2, n_dim2 = local_features.shape
+                    h2 = w2 = int(hw2 ** 0.5)
 
-        if sam_model is not None and (input_ids.shape[1] != 1 or self.training) and torch.sum(images[0][1]).item() != 0:
+                    width_crop_num, height_crop_num = crop_shape[0], crop_shape[1]
 
-            idx = 0
-            
-            # sam_model = torch.jit.script(sam_model)
-            
-            # start_time = time.time()
-            for image, crop_shape in zip(images, images_spatial_crop):
-                images_in_this_batch = []
+                    global_features = global_features.view(h, w, n_dim)
 
-                patches = image[0]
-                image_ori = image[1]
+                    global_features = torch.cat(
+                        [global_features, self.image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
+                    )
 
-                with torch.no_grad():
-                # with torch.inference_mode(): 
-                    
-                    if torch.sum(patches).item() != 0:
-                        # P, C, H, W = patches.shape
-                        crop_flag = 1
-                        local_features_1 = sam_model(patches)
+                    global_features = global_features.view(-1, n_dim)
 
-                        local_features_2 = vision_model(patches, local_features_1)  
-                        # vit_time = time.time()
-                        local_features = torch.cat((local_features_2[:, 1:], local_features_1.flatten(2).permute(0, 2, 1)), dim=-1) 
-                        local_features = self.projector(local_features)
 
+                    local_features = local_features.view(height_crop_num, width_crop_num, h2, w2, n_dim2).permute(0, 2, 1, 3, 4).reshape(height_crop_num*h2, width_crop_num*w2, n_dim2)
+                    local_features = torch.cat(
+                        [local_features, self.image_newline[None, None, :].expand(height_crop_num * h2, 1, n_dim2)], dim=1
+                    )
+                    local_features = local_features.view(-1, n_dim2)
 
-                        global_features_1 = sam_model(image_ori)
-                        global_features_2 = vision_model(image_ori, global_features_1) 
-                        global_features = torch.cat((global_features_2[:, 1:], global_features_1.flatten(2).permute(0, 2, 1)), dim=-1) 
-                        global_features = self.projector(global_features)
+                    global_local_features = torch.cat([local_features, global_features, self.view_seperator[None, :]], dim=0)
 
-                        print('=====================')
-                        print('BASE: ', global_features.shape)
-                        print('PATCHES: ', local_features.shape)
-                        print('=====================')
+                    # end_time = time.time()
 
-                        _, hw, n_dim = global_features.shape
-                        h = w = int(hw ** 0.5)
+                    # print('sam: ', sam_time - start_time)
+                    # print('vit: ', vit_time - sam_time)
+                    # print('all: ', end_time - start_time)
 
-                        _2, hw2, n_dim2 = local_features.shape
-                        h2 = w2 = int(hw2 ** 0.5)
+                    # exit()
+               
+                else:
+                    global_features = self.encode_view(image_ori)
+                    _, hw, n_dim = global_features.shape
+                    h = w = int(hw ** 0.5)
 
-                        width_crop_num, height_crop_num = crop_shape[0], crop_shape[1]
 
-                        global_features = global_features.view(h, w, n_dim)
+                    global_features = global_features.view(h, w, n_dim)
 
-                        global_features = torch.cat(
-                            [global_features, self.image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
-                        )
+                    global_features = torch.cat(
+                        [global_features, self.image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
+                    )
 
-                        global_features = global_features.view(-1, n_dim)
+                    global_features = global_features.view(-1, n_dim)
 
+                    global_local_features = torch.cat([global_features, self.view_seperator[None, :]], dim=0)
 
-                        local_features = local_features.view(height_crop_num, width_crop_num, h2, w2, n_dim2).permute(0, 2, 1, 3, 4).reshape(height_crop_num*h2, width_crop_num*w2, n_dim2)
-                        local_features = torch.cat(
-                            [local_features, self.image_newline[None, None, :].expand(height_crop_num * h2, 1, n_dim2)], dim=1
-                        )
-                        local_features = local_features.view(-1, n_dim2)
+                images_in_this_batch.append(global_local_features)
 
-                        global_local_features = torch.cat([local_features, global_features, self.view_seperator[None, :]], dim=0)
+            image_embeds.append(torch.cat(images_in_this_batch, dim=0))
+        return image_embeds
 
-                        # end_time = time.time()
+    def release_vision_encoder(self):
+        """
+        Drop sam_model, vision_model and projector once all image embeddings have been produced,
+        turning this instance into a decoder-only worker that expects image_embeds.
+        """
+        self.sam_model = None
+        self.vision_model = None
+        self.projector = None
+        self.config.vision_encoder = False
+        gc.collect()
+
+    def compile_vision_encoders(self, compile_mode='max-autotune', cache_dir=None, base_size=1024, image_size=640,
+                                crop_batch_sizes=(6,), dtype=torch.bfloat16):
+        """
+        Compile sam_model, vision_model and projector with torch.compile using static shapes,
+        and warm them up at load time so the first request does not pay for compilation.
+
+        Args:
+            compile_mode (str): torch.compile mode.
+            cache_dir (str or None): Persistent Inductor cache directory shared between workers.
+            base_size (int): Resolution of the global view.
+            image_size (int): Resolution of the local crops.
+            crop_batch_sizes (list(int)): Crop counts to warm up (A4 / Letter portrait pages give 2x3 = 6).
+                Other crop counts are compiled on first use and land in the same on-disk cache.
+            dtype (torch.dtype): Autocast / input dtype used by infer().
+        """
+        import torch._dynamo
+        import torch._inductor.config as inductor_config
 
-                        # print('sam: ', sam_time - start_time)
-                        # print('vit: ', vit_time - sam_time)
-                        # print('all: ', end_time - start_time)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            os.environ['TORCHINDUCTOR_CACHE_DIR'] = str(cache_dir)
+        inductor_config.fx_graph_cache = True
 
-                        # exit()
-                   
-                    else:
-                        global_features_1 = sam_model(image_ori)
-                        global_features_2 = vision_model(image_ori, global_features_1) 
-                        global_features = torch.cat((global_features_2[:, 1:], global_features_1.flatten(2).permute(0, 2, 1)), dim=-1) 
-                        global_features = self.projector(global_features)
-                        print('=====================')
-                        print('BASE: ', global_features.shape)
-                        print('NO PATCHES')
-                        print('=====================')
-                        _, hw, n_dim = global_features.shape
-                        h = w = int(hw ** 0.5)
-
-
-                        global_features = global_features.view(h, w, n_dim)
-
-                        global_features = torch.cat(
-                            [global_features, self.image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
-                        )
+        # dynamic=False keeps one graph per view shape, so allow a few of them per module
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 16)
 
-                        global_features = global_features.view(-1, n_dim)
+        for module in (self.sam_model, self.vision_model, self.projector):
+            module.compile(mode=compile_mode, dynamic=False)
 
-                        global_local_features = torch.cat([global_features, self.view_seperator[None, :]], dim=0)
+        device = next(self.parameters()).device
+        view_shapes = [(1, base_size)] + [(num_crops, image_size) for num_crops in crop_batch_sizes]
+        with torch.autocast(device.type, dtype=dtype):
+            with torch.no_grad():
+                for num_views, size in view_shapes:
+                    views = torch.zeros((num_views, 3, size, size), dtype=dtype, device=device)
+                    self.encode_view(views)
 
-                    images_in_this_batch.append(global_local_features)
-                
+    
+    def forward(
+        self,
+        input_ids: torch.LongTensor = None,
+        attention_mask: Optional[torch.Tensor] = None,
+        position_ids: Optional[torch.LongTensor] = None,
+        past_key_values: Optional[List[torch.FloatTensor]] = None,
+        inputs_embeds: Optional[torch.FloatTensor] = None,
+        use_cache: Optional[bool] = None,
+        output_attentions: Optional[bool] = None,
+        output_hidden_states: Optional[bool] = None,
+        images: Optional[torch.FloatTensor] = None,
+        images_seq_mask: Optional[torch.FloatTensor] = None,
+        images_spatial_crop: Optional[torch.FloatTensor] = None,
+        image_embeds: Optional[List[torch.FloatTensor]] = None,
+        return_dict: Optional[bool] = None,
+    ) -> Union[Tuple, BaseModelOutputWithPast]:
 
-                # print(inputs_embeds.shape)
 
-                if images_in_this_batch:
-                    images_in_this_batch = torch.cat(images_in_this_batch, dim=0)
-                    mask = images_seq_mask[idx].unsqueeze(-1).to(inputs_embeds.device)
-                    images_in_this_batch = images_in_this_batch.to(inputs_embeds.device)
-                    inputs_embeds[idx].masked_scatter_(mask, images_in_this_batch)
 
-                idx += 1
-            
+
+        if inputs_embeds is None:
+            # inputs_embeds = self.embed_tokens(input_ids)
+            inputs_embeds = self.get_input_embeddings()(input_ids)
+
+
+
+        sam_model = getattr(self, 'sam_model', None)
+        # sam_model = self.sam_model
+
+        if image_embeds is None and images is not None and (inputs_embeds.shape[1] != 1 or self.training) \
+                and torch.sum(images[0][1]).item() != 0:
+            if sam_model is None:
+                raise ValueError(
+                    'The vision encoder is not loaded (config.vision_encoder = False); pass precomputed image_embeds.'
+                )
+            image_embeds = self.encode_images(images, images_spatial_crop)
+
+        if image_embeds is not None:
+            for idx, images_in_this_batch in enumerate(image_embeds):
+                mask = images_seq_mask[idx].unsqueeze(-1).to(inputs_embeds.device)
+                images_in_this_batch = images_in_this_batch.to(device=inputs_embeds.device, dtype=inputs_embeds.dtype)
+                inputs_embeds[idx].masked_scatter_(mask, images_in_this_batch)
 
         return super(DeepseekOCRModel, self).forward(
             input_ids=None, attention_mask=attention_mask, past_key_values=past_key_values,
@@ -530,6 +952,19 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
 
         # self.lm_head = nn.Linear(config.hidden_size, config.vocab_size, bias=False)
 
+        # KV snapshots of the shared bos + image prefix, keyed by page and prefix tokens (LRU)
+        self._prefix_cache = OrderedDict()
+        self.prefix_cache_size = 4
+
+        # set by infer(); wraps generate()'s prompt-lookup drafter with the grounding grammar
+        self._grounding_grammar = None
+        self._draft_lookup = True
+        # set by infer() when the grammar constraint is active; single-token steps with a
+        # restricted set of allowed tokens then only compute those rows of lm_head
+        self._vocab_grammar = None
+        self._lm_head_slices = OrderedDict()
+        self.lm_head_slice_cache_size = 64
+
         # Initialize weights and apply final processing
         self.post_init()
 
@@ -551,6 +986,8 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
         images: Optional[torch.FloatTensor] = None,
         images_seq_mask: Optional[torch.FloatTensor] = None,
         images_spatial_crop: Optional[torch.FloatTensor] = None,
+        image_embeds: Optional[List[torch.FloatTensor]] = None,
+        vocab_subset: Optional[torch.LongTensor] = None,
         return_dict: Optional[bool] = None,
         
     ) -> Union[Tuple, CausalLMOutputWithPast]:
@@ -574,6 +1011,7 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
             images=images,
             images_seq_mask = images_seq_mask,
             images_spatial_crop = images_spatial_crop,
+            image_embeds = image_embeds,
             return_dict=return_dict
             
         )
@@ -583,8 +1021,11 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
         # print(transformer_outputs)
 
         hidden_states = outputs[0]
-        logits = self.lm_head(hidden_states)
-        logits = logits.float()
+        if vocab_subset is not None and labels is None:
+            logits = self.restricted_vocab_logits(hidden_states, vocab_subset)
+        else:
+            logits = self.lm_head(hidden_states)
+            logits = logits.float()
 
         # logits
 
@@ -614,9 +1055,42 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
         )
 
 
+    def restricted_vocab_logits(self, hidden_states, vocab_subset):
+        """
+        Logits over the full vocabulary where only the vocab_subset rows of lm_head are computed;
+        every other token gets -inf. The gathered weight slices are cached per subset.
+        """
+        key = tuple(vocab_subset.tolist())
+        weight = self._lm_head_slices.get(key)
+        if weight is None:
+            weight = self.lm_head.weight.index_select(0, vocab_subset.to(self.lm_head.weight.device))
+            self._lm_head_slices[key] = weight
+            while len(self._lm_head_slices) > self.lm_head_slice_cache_size:
+                self._lm_head_slices.popitem(last=False)
+        else:
+            self._lm_head_slices.move_to_end(key)
+
+        subset_logits = nn.functional.linear(hidden_states, weight).float()
+        logits = subset_logits.new_full(hidden_states.shape[:-1] + (self.config.vocab_size,), float('-inf'))
+        logits[..., vocab_subset.to(logits.device)] = subset_logits
+        return logits
+
+    def _vocab_subset(self, input_ids):
+        """Union of the tokens the active grammar allows for every row, or None if any row is unconstrained."""
+        if self._vocab_grammar is None:
+            return None
+        allowed = set()
+        for row in range(input_ids.shape[0]):
+            row_allowed = self._vocab_grammar.allowed_tokens(input_ids[row])
+            if row_allowed is None:
+                return None
+            allowed.update(row_allowed)
+        return torch.tensor(sorted(allowed), dtype=torch.long, device=input_ids.device)
+
     def prepare_inputs_for_generation(
         self, input_ids, past_key_values=None, attention_mask=None, inputs_embeds=None, **kwargs
     ):
+        full_input_ids = input_ids
         # Omit tokens covered by past_key_values
         past_length = 0
         if past_key_values is not None:
@@ -671,25 +1145,45 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
         cache_position = torch.arange(past_length, past_length + position_ids.shape[-1], device=position_ids.device)
 
         # if `inputs_embeds` are passed, we only want to use them in the 1st generation step
-        if inputs_embeds is not None and past_key_values is None:
+        # (generate() hands us an empty cache on that step, so check the length rather than None)
+        if inputs_embeds is not None and past_length == 0:
             model_inputs = {"inputs_embeds": inputs_embeds}
         else:
             model_inputs = {"input_ids": input_ids}
 
+        # image inputs are only consumed by the prefill step
+        prefill = past_length == 0
         model_inputs.update(
             {
                 "position_ids": position_ids,
                 "past_key_values": past_key_values,
                 "use_cache": kwargs.get("use_cache"),
                 "attention_mask": attention_mask,
-                "images": kwargs.get("images", None),
+                "images": kwargs.get("images", None) if prefill else None,
                 "images_seq_mask": kwargs.get("images_seq_mask", None),
                 "images_spatial_crop": kwargs.get("images_spatial_crop", None),
+                "image_embeds": kwargs.get("image_embeds", None) if prefill else None,
+                "vocab_subset": self._vocab_subset(full_input_ids) if input_ids.shape[1] == 1 else None,
             }
         )
         return model_inputs
     
 
+    def get_grounding_grammar(self, tokenizer):
+        """GroundingGrammar for tokenizer, built once (it scans the vocabulary)."""
+        grammar = getattr(self, '_grounding_grammar_cache', None)
+        if grammar is None or grammar[0] is not tokenizer:
+            self._grounding_grammar_cache = (tokenizer, GroundingGrammar(tokenizer))
+        return self._grounding_grammar_cache[1]
+
+    def _get_candidate_generator(self, *args, **kwargs):
+        candidate_generator = super()._get_candidate_generator(*args, **kwargs)
+        if self._grounding_grammar is not None and isinstance(candidate_generator, PromptLookupCandidateGenerator):
+            candidate_generator = GroundingDraftCandidateGenerator(
+                candidate_generator, self._grounding_grammar, use_lookup=self._draft_lookup
+            )
+        return candidate_generator
+
     def disable_torch_init(self):
         """
         Disable the redundant torch default initialization to accelerate model creation.
@@ -700,12 +1194,8 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
 
 
 
-    def infer(self, tokenizer, prompt='', image_file='', output_path = '', base_size=1024, image_size=640, crop_mode=True, test_compress=False, save_results=False, eval_mode=False):
-        self.disable_torch_init()
-
-        os.makedirs(output_path, exist_ok=True)
-        os.makedirs(f'{output_path}/images', exist_ok=True)
-
+    @staticmethod
+    def _conversation(prompt, image_file):
         if prompt and image_file:
             conversation = [
                 {
@@ -738,6 +1228,18 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
         else:
             assert False, f'prompt is none!'
         
+        return conversation
+
+    def prepare_inputs(self, tokenizer, prompt='', image_file='', base_size=1024, image_size=640, crop_mode=True):
+        """
+        Build the prefill inputs for one prompt / page: token ids, image-seq mask and the
+        pixel tensors of the global view and local crops.
+
+        Returns:
+            inputs (dict): conversation, input_ids (L,), images_seq_mask (L,), images_crop, images_ori,
+                images_spatial_crop, image_draw (decoded page for box drawing) and valid_img_tokens.
+        """
+        conversation = self._conversation(prompt, image_file)
         prompt = format_messages(conversations=conversation, sft_format='plain', system_prompt='')
 
         patch_size = 16
@@ -747,7 +1249,8 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
         valid_img_tokens = 0
         ratio = 1
 
-        image_draw = images[0].copy()
+        # draw_bounding_boxes draws on its own copy, so the decoded page is shared as-is
+        image_draw = images[0]
 
         w,h = image_draw.size
         # print(w, h)
@@ -758,7 +1261,7 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
         images_seq_mask = []
 
         image_token = '<image>'
-        image_token_id = 128815
+        image_token_id = IMAGE_TOKEN_ID
         text_splits = prompt.split(image_token)
 
         images_list, images_crop_list, images_seq_mask = [], [], []
@@ -908,17 +1411,216 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
             else:
                 images_crop = torch.zeros((1, 3, base_size, base_size), dtype=torch.bfloat16, device=device)
 
+        return {
+            'conversation': conversation,
+            'input_ids': input_ids,
+            'images_seq_mask': images_seq_mask,
+            'images_crop': images_crop,
+            'images_ori': images_ori,
+            'images_spatial_crop': images_spatial_crop,
+            'image_draw': image_draw,
+            'valid_img_tokens': valid_img_tokens,
+        }
+
+    def prepare_prefill_inputs(self, tokenizer, prefill, prompt='', image_file='', base_size=1024, image_size=640,
+                               crop_mode=True):
+        """
+        Build the prefill inputs for infer(prefill_file=...) without decoding the page: the prompt text is
+        tokenized around the stored image token blocks, and the stored embeddings replace the pixels.
+
+        Raises:
+            ValueError: if the prefill was exported for another image file or other preprocessing settings.
+        """
+        metadata = prefill['metadata']
+        expected = {'base_size': str(base_size), 'image_size': str(image_size), 'crop_mode': str(crop_mode)}
+        mismatched = {k: (metadata.get(k), v) for k, v in expected.items() if metadata.get(k) != v}
+        if mismatched:
+            raise ValueError(f'prefill was exported with other settings (stored, requested): {mismatched}')
+        if image_file and image_file_digest(image_file) != metadata.get('image_digest'):
+            raise ValueError(f'prefill was exported for another image than {image_file}')
+
+        conversation = self._conversation(prompt, image_file)
+        prompt = format_messages(conversations=conversation, sft_format='plain', system_prompt='')
+        text_splits = prompt.split('<image>')
+        image_embeds = prefill['image_embeds']
+        if len(text_splits) - 1 != len(image_embeds):
+            raise ValueError(f'prompt has {len(text_splits) - 1} <image> tokens, the prefill holds {len(image_embeds)} images')
+
+        # bos, then text and image blocks as in prepare_inputs
+        tokenized_str, images_seq_mask = [0], [False]
+        for idx, text_sep in enumerate(text_splits):
+            tokenized_sep = text_encode(tokenizer, text_sep, bos=False, eos=False)
+            tokenized_str += tokenized_sep
+            images_seq_mask += [False] * len(tokenized_sep)
+            if idx < len(image_embeds):
+                num_tokens = int(image_embeds[idx].shape[0])
+                tokenized_str += [IMAGE_TOKEN_ID] * num_tokens
+                images_seq_mask += [True] * num_tokens
+
+        device = next(self.parameters()).device
+        return {
+            'conversation': conversation,
+            'input_ids': torch.LongTensor(tokenized_str).to(device),
+            'images_seq_mask': torch.tensor(images_seq_mask, dtype=torch.bool, device=device),
+            'image_embeds': image_embeds,
+            'images_spatial_crop': prefill['images_spatial_crop'],
+            'valid_img_tokens': int(metadata.get('valid_img_tokens', 0)),
+        }
+
+    def clear_prefix_cache(self):
+        self._prefix_cache.clear()
+
+    @staticmethod
+    def _fork_cache(cache):
+        """Shallow copy of a DynamicCache; update() rebinds the per-layer tensors, so the snapshot stays intact."""
+        forked = DynamicCache()
+        forked.key_cache = list(cache.key_cache)
+        forked.value_cache = list(cache.value_cache)
+        forked._seen_tokens = cache._seen_tokens
+        return forked
+
+    def get_prefix_cache(self, page_key, input_ids, images_seq_mask, images=None, image_embeds=None,
+                         images_spatial_crop=None):
+        """
+        Return a fresh fork of the KV cache covering everything up to the last image token
+        (bos, any text before <image> and the image block), building and storing it on first use.
+        Prompts that differ only after the image block then prefill just their own text tokens.
+
+        Args:
+            page_key (hashable): Identifies the page and preprocessing (path, mtime, base_size, ...).
+            input_ids (torch.LongTensor): (L,) full prompt ids.
+            images_seq_mask (torch.BoolTensor): (L,) image token positions.
+
+        Returns:
+            cache (DynamicCache or None): None when the prompt has no image tokens.
+        """
+        image_positions = images_seq_mask.nonzero()
+        if image_positions.numel() == 0:
+            return None
+        # keep at least one token for generate() to prefill
+        prefix_length = min(int(image_positions[-1]) + 1, input_ids.shape[0] - 1)
+        key = (page_key, tuple(input_ids[:prefix_length].tolist()))
+
+        cache = self._prefix_cache.get(key)
+        if cache is not None:
+            self._prefix_cache.move_to_end(key)
+            return self._fork_cache(cache)
+
+        cache = DynamicCache()
+        # run the decoder stack only; prefix logits are never needed
+        self.model(
+            input_ids=input_ids[None, :prefix_length],
+            past_key_values=cache,
+            use_cache=True,
+            images=images,
+            images_seq_mask=images_seq_mask[None, :prefix_length],
+            images_spatial_crop=images_spatial_crop,
+            image_embeds=image_embeds,
+            return_dict=True,
+        )
+        self._prefix_cache[key] = cache
+        while len(self._prefix_cache) > self.prefix_cache_size:
+            self._prefix_cache.popitem(last=False)
+        return self._fork_cache(cache)
+
+    def export_prefill(self, tokenizer, path, prompt='', image_file='', base_size=1024, image_size=640, crop_mode=True):
+        """
+        Run the vision encoders once for a page and save the prefill inputs with save_prefill_inputs().
+        The file can be fed back through infer(prefill_file=...), also with a different prompt.
+        """
+        inputs = self.prepare_inputs(tokenizer, prompt=prompt, image_file=image_file, base_size=base_size,
+                                     image_size=image_size, crop_mode=crop_mode)
+        device = inputs['input_ids'].device
+        autocast_device = "cuda" if device.type == "cuda" else "cpu"
+        with torch.autocast(autocast_device, dtype=torch.bfloat16):
+            with torch.no_grad():
+                image_embeds = self.model.encode_images(
+                    [(inputs['images_crop'], inputs['images_ori'])], inputs['images_spatial_crop']
+                )
+
+        save_prefill_inputs(
+            path, inputs['input_ids'], inputs['images_seq_mask'], image_embeds,
+            images_spatial_crop=inputs['images_spatial_crop'],
+            metadata={
+                'prompt': prompt, 'base_size': base_size, 'image_size': image_size, 'crop_mode': crop_mode,
+                'image_digest': image_file_digest(image_file), 'valid_img_tokens': inputs['valid_img_tokens'],
+            },
+        )
+        return path
+
+    def infer(self, tokenizer, prompt='', image_file='', output_path = '', base_size=1024, image_size=640, crop_mode=True, test_compress=False, save_results=False, eval_mode=False, prefill_file=None, reuse_prefix_cache=False, speculative_tokens=0, constrain_grounding=False, streamer=None, stopping_criteria=None):
+        self.disable_torch_init()
 
+        # output_path is optional when nothing is saved (e.g. streaming without output_dir)
+        if output_path:
+            os.makedirs(output_path, exist_ok=True)
+            os.makedirs(f'{output_path}/images', exist_ok=True)
+
+        # reuse image embeddings exported by export_prefill(); the prompt text may differ and the page is not decoded
+        if prefill_file is not None:
+            prefill = load_prefill_inputs(prefill_file, device=next(self.parameters()).device)
+            inputs = self.prepare_prefill_inputs(tokenizer, prefill, prompt=prompt, image_file=image_file,
+                                                 base_size=base_size, image_size=image_size, crop_mode=crop_mode)
+            image_embeds = inputs['image_embeds']
+            images = None
+            image_draw = None
+        else:
+            inputs = self.prepare_inputs(tokenizer, prompt=prompt, image_file=image_file, base_size=base_size,
+                                         image_size=image_size, crop_mode=crop_mode)
+            image_embeds = None
+            images = [(inputs['images_crop'], inputs['images_ori'])]
+            image_draw = inputs['image_draw']
+        conversation = inputs['conversation']
+        input_ids = inputs['input_ids']
+        images_seq_mask = inputs['images_seq_mask']
+        images_spatial_crop = inputs['images_spatial_crop']
+        valid_img_tokens = inputs['valid_img_tokens']
+        device = input_ids.device
 
         autocast_device = "cuda" if device.type == "cuda" else "cpu"
 
+        # speculative decoding: drafts come from n-gram lookup plus the grounding grammar.
+        # constrain_grounding masks tokens that break the grounding syntax and, through the same
+        # drafter, feeds grammar-forced tokens into the next forward instead of decoding them one by one.
+        constrain_grounding = constrain_grounding and '<|grounding|>' in conversation[0]['content']
+        prompt_lookup_num_tokens = speculative_tokens or (GROUNDING_FORCED_DRAFT_TOKENS if constrain_grounding else None)
+        self._grounding_grammar = None
+        if prompt_lookup_num_tokens:
+            self._grounding_grammar = self.get_grounding_grammar(tokenizer)
+            self._draft_lookup = bool(speculative_tokens)
+        logits_processor = LogitsProcessorList(
+            [GroundingLogitsProcessor(self._grounding_grammar)] if constrain_grounding else []
+        )
+        self._vocab_grammar = self._grounding_grammar if constrain_grounding else None
+
+        past_key_values = None
+        if reuse_prefix_cache and image_file:
+            page_key = (os.path.abspath(image_file), os.path.getmtime(image_file), base_size, image_size, crop_mode)
+            with torch.autocast(autocast_device, dtype=torch.bfloat16):
+                with torch.no_grad():
+                    past_key_values = self.get_prefix_cache(
+                        page_key, input_ids, images_seq_mask, images=images, image_embeds=image_embeds,
+                        images_spatial_crop=images_spatial_crop,
+                    )
+            if past_key_values is not None:
+                # the image block is already in the cache
+                images, image_embeds = None, None
+
         if not eval_mode:
-            streamer = NoEOSTextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=False)
+            # callers may pass their own streamer (e.g. a TextIteratorStreamer) instead of printing,
+            # and stopping_criteria to end generation early (e.g. when a stream consumer goes away)
+            if streamer is None:
+                streamer = NoEOSTextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=False)
             with torch.autocast(autocast_device, dtype=torch.bfloat16):
                 with torch.no_grad():
                     output_ids = self.generate(
                         input_ids.unsqueeze(0),
-                        images=[(images_crop, images_ori)],
+                        images=images,
+                        image_embeds=image_embeds,
+                        past_key_values=past_key_values,
+                        prompt_lookup_num_tokens=prompt_lookup_num_tokens,
+                        logits_processor=logits_processor,
+                        stopping_criteria=stopping_criteria,
                         images_seq_mask = images_seq_mask.unsqueeze(0),
                         images_spatial_crop = images_spatial_crop,
                         # do_sample=False,
@@ -936,7 +1638,12 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
                 with torch.no_grad():
                     output_ids = self.generate(
                         input_ids.unsqueeze(0),
-                        images=[(images_crop, images_ori)],
+                        images=images,
+                        image_embeds=image_embeds,
+                        past_key_values=past_key_values,
+                        prompt_lookup_num_tokens=prompt_lookup_num_tokens,
+                        logits_processor=logits_processor,
+                        stopping_criteria=stopping_criteria,
                         images_seq_mask = images_seq_mask.unsqueeze(0),
                         images_spatial_crop = images_spatial_crop,
                         # do_sample=False,
@@ -959,7 +1666,12 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
 
                 return outputs
         
+        if image_draw is None and image_file and (test_compress or save_results):
+            # prefill runs decode the page only to draw boxes / report its size
+            image_draw = load_image(image_file)
+
         if '<image>' in conversation[0]['content'] and test_compress:
+            w, h = image_draw.size
             outputs = tokenizer.decode(output_ids[0, input_ids.unsqueeze(0).shape[1]:])
             pure_texts_outputs_token_length = len(text_encode(tokenizer, outputs, bos=False, eos=False))
             print('='*50)
@@ -981,7 +1693,7 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
                 outputs = outputs[:-len(stop_str)]
             outputs = outputs.strip()
 
-            matches_ref, matches_images, mathes_other = re_match(outputs)
+            matches_ref = list(iter_grounding_matches(outputs))
             # print(matches_ref)
             result = process_image_with_refs(image_draw, matches_ref, output_path)
 
@@ -989,11 +1701,7 @@ class DeepseekOCRForCausalLM(DeepseekV2ForCausalLM):
             with open(f'{output_path}/result_raw.txt', 'w', encoding='utf-8') as afile:
                 afile.write(outputs)
 
-            for idx, a_match_image in enumerate(tqdm(matches_images, desc="image")):
-                outputs = outputs.replace(a_match_image, '![](images/' + str(idx) + '.jpg)\n')
-            
-            for idx, a_match_other in enumerate(tqdm(mathes_other, desc="other")):
-                outputs = outputs.replace(a_match_other, '').replace('\\coloneqq', ':=').replace('\\eqqcolon', '=:')
+            outputs = render_markdown(outputs)
 
 
             # if 'structural formula' in conversation[0]['content']:
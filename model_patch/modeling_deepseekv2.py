@@ -33,10 +33,14 @@ from torch.nn import BCEWithLogitsLoss, CrossEntropyLoss, MSELoss
 
 from transformers.activations import ACT2FN
 from transformers.cache_utils import Cache, DynamicCache
-from transformers.modeling_attn_mask_utils import _prepare_4d_causal_attention_mask
+from transformers.modeling_attn_mask_utils import (
+    _prepare_4d_causal_attention_mask,
+    _prepare_4d_causal_attention_mask_for_sdpa,
+)
 from transformers.models.llama.modeling_llama import (
     LlamaAttention,
-    LlamaFlashAttention2
+    LlamaFlashAttention2,
+    LlamaSdpaAttention,
 )
 from transformers.modeling_outputs import (
     BaseModelOutputWithPast,
@@ -421,6 +425,8 @@ class MoEGate(nn.Module):
             self.e_score_correction_bias = nn.Parameter(
                 torch.empty((self.n_routed_experts))
             )
+        # bool (n_routed_experts,); experts set to False are never routed to (see set_expert_mask)
+        self.register_buffer("expert_mask", None, persistent=False)
         self.reset_parameters()
 
     def reset_parameters(self) -> None:
@@ -428,6 +434,16 @@ class MoEGate(nn.Module):
 
         init.kaiming_uniform_(self.weight, a=math.sqrt(5))
 
+    def set_expert_mask(self, keep: Optional[torch.Tensor]):
+        """
+        Restrict routing to the experts where keep is True (None removes the restriction).
+        Masked experts get -inf logits before scoring, so the top-k weights are
+        renormalised over the remaining experts.
+        """
+        if keep is not None:
+            keep = keep.to(device=self.weight.device, dtype=torch.bool)
+        self.expert_mask = keep
+
     def forward(self, hidden_states):
         bsz, seq_len, h = hidden_states.shape
         ### compute gating score
@@ -435,6 +451,8 @@ class MoEGate(nn.Module):
         logits = F.linear(
             hidden_states.type(torch.float32), self.weight.type(torch.float32), None
         )
+        if self.expert_mask is not None:
+            logits = logits.masked_fill(~self.expert_mask, float("-inf"))
         if self.scoring_func == "softmax":
             scores = logits.softmax(dim=-1, dtype=torch.float32)
         elif self.scoring_func == "sigmoid":
@@ -474,6 +492,8 @@ class MoEGate(nn.Module):
         elif self.topk_method == "noaux_tc":
             assert not self.training
             scores_for_choice = scores.view(bsz * seq_len, -1) + self.e_score_correction_bias.unsqueeze(0)
+            if self.expert_mask is not None:
+                scores_for_choice = scores_for_choice.masked_fill(~self.expert_mask, float("-inf"))
             group_scores = (
                 scores_for_choice.view(bsz * seq_len, self.n_group, -1).topk(2, dim=-1)[0].sum(dim = -1)
             )  # [n, n_group]
@@ -603,6 +623,23 @@ class DeepseekV2MoE(nn.Module):
                 config=config, intermediate_size=intermediate_size
             )
 
+    def drop_experts(self, expert_ids):
+        """
+        Free the given routed experts and stop routing to them; their top-k share is
+        renormalised over the experts that remain. Only supported without expert parallelism.
+        """
+        if self.ep_size > 1:
+            raise NotImplementedError("drop_experts is not supported with expert parallelism")
+        keep = torch.ones(self.config.n_routed_experts, dtype=torch.bool)
+        if self.gate.expert_mask is not None:
+            keep &= self.gate.expert_mask.cpu()
+        for expert_id in expert_ids:
+            keep[expert_id] = False
+            self.experts[expert_id] = None
+        if int(keep.sum()) < self.num_experts_per_tok:
+            raise ValueError(f"at least num_experts_per_tok={self.num_experts_per_tok} experts must remain")
+        self.gate.set_expert_mask(keep)
+
     def forward(self, hidden_states):
         identity = hidden_states
         orig_shape = hidden_states.shape
@@ -675,7 +712,11 @@ class DeepseekV2MoE(nn.Module):
                 continue
             expert = self.experts[i + self.ep_rank * self.experts_per_rank]
             tokens_for_this_expert = sorted_tokens[start_idx:end_idx]
-            expert_out = expert(tokens_for_this_expert)
+            if expert is None:
+                # dropped expert picked only as a zero-weight filler (see drop_experts)
+                expert_out = torch.zeros_like(tokens_for_this_expert)
+            else:
+                expert_out = expert(tokens_for_this_expert)
             outputs.append(expert_out)
             start_idx = end_idx
 
@@ -780,6 +821,11 @@ class DeepseekV2Attention(nn.Module):
         )
         self._init_rope()
 
+        # filled by absorb_kv_b_proj(); otherwise derived from kv_b_proj.weight on every call
+        self.register_buffer("q_absorb", None, persistent=False)
+        self.register_buffer("out_absorb_t", None, persistent=False)
+        self.register_buffer("q_proj_absorbed", None, persistent=False)
+
         self.softmax_scale = self.q_head_dim ** (-0.5)
         if self.config.rope_scaling is not None:
             mscale_all_dim = self.config.rope_scaling.get("mscale_all_dim", 0)
@@ -847,32 +893,61 @@ class DeepseekV2Attention(nn.Module):
             .contiguous()
         )
 
-    def forward(
-        self,
-        hidden_states: torch.Tensor,
-        attention_mask: Optional[torch.Tensor] = None,
-        position_ids: Optional[torch.LongTensor] = None,
-        past_key_value: Optional[Cache] = None,
-        output_attentions: bool = False,
-        use_cache: bool = False,
-        **kwargs,
-    ) -> Tuple[torch.Tensor, Optional[torch.Tensor], Optional[Tuple[torch.Tensor]]]:
-        if "padding_mask" in kwargs:
-            warnings.warn(
-                "Passing `padding_mask` is deprecated and will be removed in v4.37. Please make sure use `attention_mask` instead.`"
-            )
-        bsz, q_len, _ = hidden_states.size()
+    @torch.no_grad()
+    def absorb_kv_b_proj(self, fuse_q_proj: bool = False):
+        """
+        Precompute contiguous absorbed projections from kv_b_proj for the absorbed-MLA forward.
 
-        if self.q_lora_rank is None:
-            q = self.q_proj(hidden_states)
-        else:
-            q = self.q_b_proj(self.q_a_layernorm(self.q_a_proj(hidden_states)))
-        q = q.view(bsz, q_len, self.num_heads, self.q_head_dim).transpose(1, 2)
+        q_absorb is stored as (num_heads, qk_nope_head_dim, kv_lora_rank) and out_absorb
+        pre-transposed as (num_heads, kv_lora_rank, v_head_dim), replacing the strided views
+        of kv_b_proj.weight taken on every call.
+
+        With ``fuse_q_proj``, q_absorb is also folded into q_proj / q_b_proj so the query comes out
+        directly in the latent space ([kv_lora_rank | qk_rope_head_dim] per head) from a single GEMM.
+        The fused weight is larger than q_proj whenever kv_lora_rank > qk_nope_head_dim, so it only
+        pays off where the extra matmul launch dominates (small batches, short contexts).
+        """
+        kv_b_proj = self.kv_b_proj.weight.view(self.num_heads, -1, self.kv_lora_rank)
+        self.q_absorb = kv_b_proj[:, : self.qk_nope_head_dim, :].contiguous()
+        self.out_absorb_t = kv_b_proj[:, self.qk_nope_head_dim :, :].mT.contiguous()
 
+        if not fuse_q_proj:
+            self.q_proj_absorbed = None
+            return
 
-        q_nope, q_pe = torch.split(
-            q, [self.qk_nope_head_dim, self.qk_rope_head_dim], dim=-1
+        q_weight = self.q_proj.weight if self.q_lora_rank is None else self.q_b_proj.weight
+        q_weight = q_weight.view(self.num_heads, self.q_head_dim, -1)
+        q_nope_weight, q_pe_weight = torch.split(
+            q_weight, [self.qk_nope_head_dim, self.qk_rope_head_dim], dim=1
         )
+        # (q_nope @ q_absorb) == x @ (q_absorb^T @ W_nope)^T, computed in fp32 then cast back
+        q_latent_weight = torch.matmul(self.q_absorb.float().mT, q_nope_weight.float()).to(q_weight.dtype)
+        self.q_proj_absorbed = torch.cat([q_latent_weight, q_pe_weight], dim=1).reshape(
+            self.num_heads * (self.kv_lora_rank + self.qk_rope_head_dim), -1
+        ).contiguous()
+
+    def _absorbed_qkv(self, hidden_states, position_ids, past_key_value):
+        """
+        Project hidden_states into the absorbed-MLA latent space and update the cache.
+
+        Returns q_nope (bsz, heads, q_len, kv_lora_rank), q_pe (bsz, heads, q_len, rope),
+        compressed_kv (bsz, kv_len, kv_lora_rank), k_pe (bsz, 1, kv_len, rope), kv_seq_len
+        and out_absorb_t (heads, kv_lora_rank, v_head_dim).
+        """
+        bsz, q_len, _ = hidden_states.size()
+
+        q_input = hidden_states if self.q_lora_rank is None else self.q_a_layernorm(self.q_a_proj(hidden_states))
+        if self.q_proj_absorbed is not None:
+            # q_nope comes out already multiplied by q_absorb
+            q = F.linear(q_input, self.q_proj_absorbed)
+            q = q.view(bsz, q_len, self.num_heads, self.kv_lora_rank + self.qk_rope_head_dim).transpose(1, 2)
+            q_nope, q_pe = torch.split(q, [self.kv_lora_rank, self.qk_rope_head_dim], dim=-1)
+        else:
+            q = self.q_proj(q_input) if self.q_lora_rank is None else self.q_b_proj(q_input)
+            q = q.view(bsz, q_len, self.num_heads, self.q_head_dim).transpose(1, 2)
+            q_nope, q_pe = torch.split(
+                q, [self.qk_nope_head_dim, self.qk_rope_head_dim], dim=-1
+            )
 
         compressed_kv = self.kv_a_proj_with_mqa(hidden_states)
         compressed_kv, k_pe = torch.split(
@@ -900,11 +975,53 @@ class DeepseekV2Attention(nn.Module):
             k_pe, compressed_kv = past_key_value.update(k_pe, compressed_kv, self.layer_idx, cache_kwargs)
             compressed_kv = compressed_kv.squeeze(1)
 
-        kv_b_proj = self.kv_b_proj.weight.view(self.num_heads, -1, self.kv_lora_rank)
-        q_absorb = kv_b_proj[:, :self.qk_nope_head_dim, :]
-        out_absorb = kv_b_proj[:, self.qk_nope_head_dim:, :]
+        if self.q_absorb is not None:
+            q_absorb, out_absorb_t = self.q_absorb, self.out_absorb_t
+        else:
+            kv_b_proj = self.kv_b_proj.weight.view(self.num_heads, -1, self.kv_lora_rank)
+            q_absorb = kv_b_proj[:, :self.qk_nope_head_dim, :]
+            out_absorb_t = kv_b_proj[:, self.qk_nope_head_dim:, :].mT
+
+        if self.q_proj_absorbed is None:
+            q_nope = torch.matmul(q_nope, q_absorb)
+        return q_nope, q_pe, compressed_kv, k_pe, kv_seq_len, out_absorb_t
+
+    def _absorbed_output(self, attn_output, out_absorb_t):
+        """Map latent attention output (bsz, heads, q_len, kv_lora_rank) back through out_absorb and o_proj."""
+        bsz, _, q_len, _ = attn_output.size()
+        attn_output = torch.matmul(attn_output, out_absorb_t)
+
+        if attn_output.size() != (bsz, self.num_heads, q_len, self.v_head_dim):
+            raise ValueError(
+                f"`attn_output` should be of size {(bsz, self.num_heads, q_len, self.v_head_dim)}, but is"
+                f" {attn_output.size()}"
+            )
+
+        attn_output = attn_output.transpose(1, 2).contiguous()
+
+        attn_output = attn_output.reshape(bsz, q_len, self.num_heads * self.v_head_dim)
 
-        q_nope = torch.matmul(q_nope, q_absorb)
+        return self.o_proj(attn_output)
+
+    def forward(
+        self,
+        hidden_states: torch.Tensor,
+        attention_mask: Optional[torch.Tensor] = None,
+        position_ids: Optional[torch.LongTensor] = None,
+        past_key_value: Optional[Cache] = None,
+        output_attentions: bool = False,
+        use_cache: bool = False,
+        **kwargs,
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor], Optional[Tuple[torch.Tensor]]]:
+        if "padding_mask" in kwargs:
+            warnings.warn(
+                "Passing `padding_mask` is deprecated and will be removed in v4.37. Please make sure use `attention_mask` instead.`"
+            )
+        bsz, q_len, _ = hidden_states.size()
+
+        q_nope, q_pe, compressed_kv, k_pe, kv_seq_len, out_absorb_t = self._absorbed_qkv(
+            hidden_states, position_ids, past_key_value
+        )
         attn_weights = (torch.matmul(q_pe, k_pe.mT) +
                         torch.matmul(q_nope, compressed_kv.unsqueeze(-3).mT)) * self.softmax_scale
         if attn_weights.size() != (bsz, self.num_heads, q_len, kv_seq_len):
@@ -912,7 +1029,7 @@ class DeepseekV2Attention(nn.Module):
                 f"Attention weights should be of size {(bsz, self.num_heads, q_len, kv_seq_len)}, but is"
                 f" {attn_weights.size()}"
             )
-        assert attention_mask is not None
+        # None for unpadded single-token decode steps (see _prepare_decode_attention_mask)
         if attention_mask is not None:
             if attention_mask.size() != (bsz, 1, q_len, kv_seq_len):
                 raise ValueError(
@@ -929,24 +1046,81 @@ class DeepseekV2Attention(nn.Module):
         )
         attn_output = torch.einsum('bhql,blc->bhqc', attn_weights, compressed_kv)
 
-        attn_output = torch.matmul(attn_output, out_absorb.mT)
+        attn_output = self._absorbed_output(attn_output, out_absorb_t)
 
-        if attn_output.size() != (bsz, self.num_heads, q_len, self.v_head_dim):
-            raise ValueError(
-                f"`attn_output` should be of size {(bsz, self.num_heads, q_len, self.v_head_dim)}, but is"
-                f" {attn_output.size()}"
+        if not output_attentions:
+            attn_weights = None
+
+        return attn_output, attn_weights, past_key_value
+
+
+class DeepseekV2SdpaAttention(DeepseekV2Attention):
+    """
+    Absorbed MLA attention through `torch.nn.functional.scaled_dot_product_attention`. The latent query
+    [q_nope @ q_absorb | q_pe] is matched against the cached key [compressed_kv | k_pe] and the values are
+    compressed_kv itself, so no (bsz, heads, q_len, kv_len) fp32 score tensor or 4D causal mask is built
+    when the prompt is unpadded. Weights are the same as `DeepseekV2Attention`.
+    """
+
+    def forward(
+        self,
+        hidden_states: torch.Tensor,
+        attention_mask: Optional[torch.Tensor] = None,
+        position_ids: Optional[torch.LongTensor] = None,
+        past_key_value: Optional[Cache] = None,
+        output_attentions: bool = False,
+        use_cache: bool = False,
+        **kwargs,
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor], Optional[Tuple[torch.Tensor]]]:
+        if output_attentions:
+            # SDPA cannot return the attention weights
+            logger.warning_once(
+                "DeepseekV2SdpaAttention does not support `output_attentions=True`, falling back to the eager implementation."
+            )
+            return super().forward(
+                hidden_states=hidden_states,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_value=past_key_value,
+                output_attentions=output_attentions,
+                use_cache=use_cache,
+                **kwargs,
             )
 
-        attn_output = attn_output.transpose(1, 2).contiguous()
+        bsz, q_len, _ = hidden_states.size()
 
-        attn_output = attn_output.reshape(bsz, q_len, self.num_heads * self.v_head_dim)
+        q_nope, q_pe, compressed_kv, k_pe, kv_seq_len, out_absorb_t = self._absorbed_qkv(
+            hidden_states, position_ids, past_key_value
+        )
 
-        attn_output = self.o_proj(attn_output)
+        query_states = torch.cat([q_nope, q_pe], dim=-1)
+        value_states = compressed_kv.unsqueeze(1)
+        key_states = torch.cat([value_states, k_pe], dim=-1)
+        # one shared latent head (MQA); expand is a view
+        key_states = key_states.expand(bsz, self.num_heads, kv_seq_len, -1)
+        value_states = value_states.expand(bsz, self.num_heads, kv_seq_len, -1)
 
-        if not output_attentions:
-            attn_weights = None
+        if attention_mask is not None:
+            if attention_mask.size() != (bsz, 1, q_len, kv_seq_len):
+                raise ValueError(
+                    f"Attention mask should be of size {(bsz, 1, q_len, kv_seq_len)}, but is {attention_mask.size()}"
+                )
+            attention_mask = attention_mask.to(query_states.dtype)
 
-        return attn_output, attn_weights, past_key_value
+        attn_output = F.scaled_dot_product_attention(
+            query_states,
+            key_states,
+            value_states,
+            attn_mask=attention_mask,
+            dropout_p=self.attention_dropout if self.training else 0.0,
+            # the mask is only dropped for unpadded prompts with kv_len == q_len, where top-left causal is correct
+            is_causal=attention_mask is None and q_len > 1,
+            scale=self.softmax_scale,
+        )
+
+        attn_output = self._absorbed_output(attn_output, out_absorb_t)
+
+        return attn_output, None, past_key_value
 
 
 # Copied from transformers.models.llama.modeling_llama.LlamaFlashAttention2 with Llama->DeepseekV2
@@ -1227,14 +1401,28 @@ class DeepseekV2FlashAttention2(DeepseekV2Attention):
         )
 
 
+def _prepare_decode_attention_mask(attention_mask, dtype):
+    """
+    Mask for a single-token decode step. Returns None when no sequence is padded, otherwise a
+    compact (bsz, 1, 1, kv_len) additive mask built from the 2D padding mask instead of the
+    full 4D causal mask.
+    """
+    if attention_mask is None or attention_mask.dim() != 2 or bool(attention_mask.all()):
+        return None
+    return (1.0 - attention_mask[:, None, None, :].to(dtype)) * torch.finfo(dtype).min
+
+
 ATTENTION_CLASSES = {
     "eager": DeepseekV2Attention,
+    "sdpa": DeepseekV2SdpaAttention,
     "flash_attention_2": DeepseekV2FlashAttention2,
 
     "mla_eager": DeepseekV2Attention,
+    "mla_sdpa": DeepseekV2SdpaAttention,
     "mla_flash_attention_2": DeepseekV2FlashAttention2,
 
     "mha_eager": LlamaAttention,
+    "mha_sdpa": LlamaSdpaAttention,
     "mha_flash_attention_2": LlamaFlashAttention2
 }
 
@@ -1361,6 +1549,7 @@ class DeepseekV2PreTrainedModel(PreTrainedModel):
     _no_split_modules = ["DeepseekV2DecoderLayer"]
     _skip_keys_device_placement = "past_key_values"
     _supports_flash_attn_2 = True
+    _supports_sdpa = True
     _supports_cache_class = True
 
     def _init_weights(self, module):
@@ -1473,6 +1662,7 @@ class DeepseekV2Model(DeepseekV2PreTrainedModel):
         )
         # print(config._attn_implementation)
         self._use_flash_attention_2 = config._attn_implementation == "flash_attention_2"
+        self._use_sdpa = config._attn_implementation == "sdpa"
         self.norm = DeepseekV2RMSNorm(config.hidden_size, eps=config.rms_norm_eps)
 
         self.gradient_checkpointing = False
@@ -1485,6 +1675,21 @@ class DeepseekV2Model(DeepseekV2PreTrainedModel):
     def set_input_embeddings(self, value):
         self.embed_tokens = value
 
+    def absorb_mla_projections(self, fuse_q_proj: bool = False):
+        """
+        Precompute the absorbed kv_b_proj weights of every eager and SDPA MLA layer (see
+        DeepseekV2Attention.absorb_kv_b_proj). Returns the number of layers updated;
+        MHA checkpoints (use_mla = False) and flash-attention layers, which do not use the
+        absorbed forward, are left untouched.
+        """
+        absorbed = 0
+        for layer in self.layers:
+            attn = layer.self_attn
+            if isinstance(attn, DeepseekV2Attention) and not isinstance(attn, DeepseekV2FlashAttention2):
+                layer.self_attn.absorb_kv_b_proj(fuse_q_proj=fuse_q_proj)
+                absorbed += 1
+        return absorbed
+
     @add_start_docstrings_to_model_forward(DeepseekV2_INPUTS_DOCSTRING)
     def forward(
         self,
@@ -1561,6 +1766,17 @@ class DeepseekV2Model(DeepseekV2PreTrainedModel):
                 if (attention_mask is not None and 0 in attention_mask)
                 else None
             )
+        elif seq_length == 1:
+            # single-token decode attends to the whole cache, so no causal mask is needed
+            attention_mask = _prepare_decode_attention_mask(attention_mask, inputs_embeds.dtype)
+        elif self._use_sdpa and not output_attentions:
+            # None for unpadded prompts, letting SDPA use is_causal instead of a 4d mask
+            attention_mask = _prepare_4d_causal_attention_mask_for_sdpa(
+                attention_mask,
+                (batch_size, seq_length),
+                inputs_embeds,
+                past_key_values_length,
+            )
         else:
             # 4d mask is passed through the layers
             attention_mask = _prepare_4d_causal_attention_mask(
@@ -79,6 +79,10 @@ def main():
         result = process_pdf_enhanced(
             pdf_path=str(pdf_path),
             output_dir=str(output_dir),
+            extract_options={
+                'metadata_format': 'jsonl',
+                'skip_unchanged': True,
+            },
             generate_overlays=True,
             save_elements=True,
         )
@@ -101,6 +105,8 @@ def main():
         print(f"  {output_dir}/")
         print(f"    ├── {pdf_path.stem}.md           # Combined markdown")
         print(f"    ├── document_structure.json       # Document structure")
+        print(f"    ├── document.jsonl                # Enriched elements, one line per page")
+        print(f"    ├── search_index/                 # Inverted index over element text")
         print(f"    ├── pages/                        # Page images")
         print(f"    └── page_XXXX/                    # Per-page results")
         print(f"        ├── result.mmd                # Page markdown")
@@ -109,7 +115,8 @@ def main():
         print(f"        ├── elements.json             # Element metadata")
         print(f"        ├── elements/                 # Individual element images")
         print(f"        │   ├── page_XXXX_elem_XXXX_TYPE.jpg")
-        print(f"        │   └── page_XXXX_elem_XXXX_TYPE.json")
+        print(f"        │   ├── elements.jsonl        # Crop metadata, one line per element")
+        print(f"        │   └── crops_manifest.json   # Crop digests for skip_unchanged")
         print(f"        ├── overlays/                 # Type-specific overlays")
         print(f"        │   ├── title_only.jpg")
         print(f"        │   ├── paragraph_only.jpg")
@@ -3,17 +3,22 @@ Script to analyze model output and catalog label types.
 This helps understand what types of elements the model detects.
 """
 
-import re
+import importlib.util
 from pathlib import Path
 from collections import Counter
 import json
 
+# Load the grounding parser straight from its file so this script does not
+# import the inference package (and with it torch / transformers).
+_PARSER_PATH = Path(__file__).resolve().parent.parent / "inference" / "extraction" / "grounding_parser.py"
+_spec = importlib.util.spec_from_file_location("grounding_parser", _PARSER_PATH)
+grounding_parser = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(grounding_parser)
+
 
 def extract_grounding_references(text):
     """Extract all grounding references from model output."""
-    pattern = r'<\|ref\|>(.*?)<\|/ref\|><\|det\|>(.*?)<\|/det\|>'
-    matches = re.findall(pattern, text, re.DOTALL)
-    return matches
+    return [(ref.label, ref.coords) for ref in grounding_parser.iter_grounding_refs(text)]
 
 
 def analyze_label_types(matches):
@@ -26,15 +31,13 @@ def analyze_label_types(matches):
         
         # Store a few examples of coordinate formats
         if len(coordinate_formats) < 10:
-            try:
-                coords_parsed = eval(coords)
+            coords_parsed = grounding_parser.parse_coordinate_list(coords)
+            if coords_parsed is not None:
                 coordinate_formats.append({
                     'label_type': label_type,
                     'coords': coords_parsed,
-                    'num_boxes': len(coords_parsed) if isinstance(coords_parsed, list) else 1
+                    'num_boxes': len(coords_parsed)
                 })
-            except:
-                pass
     
     return label_types, coordinate_formats
 
@@ -0,0 +1,110 @@
+"""
+Tests for vectorised box operations (IoU, non-maximum suppression, merging).
+"""
+
+import numpy as np
+
+from inference.extraction import iou_matrix, merge_overlapping_boxes, non_max_suppression
+
+
+def _random_boxes(count, seed=0):
+    """Integer boxes in clusters, so that many pairs overlap."""
+    rng = np.random.default_rng(seed)
+    centers = rng.integers(0, 1000, (max(count // 4, 1), 2))
+    picks = centers[rng.integers(0, len(centers), count)] + rng.integers(-15, 16, (count, 2))
+    sizes = rng.integers(5, 80, (count, 2))
+    return np.concatenate([picks, picks + sizes], axis=1).astype(np.int32)
+
+
+def _iou(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    inter = w * h if w > 0 and h > 0 else 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _brute_force_nms(boxes, iou_threshold, labels=None, scores=None):
+    order = range(len(boxes)) if scores is None else sorted(range(len(boxes)), key=lambda i: -scores[i])
+    kept = []
+    for i in order:
+        if all(
+            (labels is not None and labels[i] != labels[j]) or _iou(boxes[i], boxes[j]) < iou_threshold
+            for j in kept
+        ):
+            kept.append(i)
+    keep = np.zeros(len(boxes), dtype=bool)
+    keep[kept] = True
+    return keep
+
+
+def _brute_force_merge(boxes, iou_threshold):
+    parent = list(range(len(boxes)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i in range(len(boxes)):
+        for j in range(i + 1, len(boxes)):
+            if _iou(boxes[i], boxes[j]) >= iou_threshold:
+                ri, rj = find(i), find(j)
+                parent[max(ri, rj)] = min(ri, rj)
+    groups = {}
+    for i in range(len(boxes)):
+        groups.setdefault(find(i), []).append(i)
+    return [
+        [
+            min(boxes[i][0] for i in members), min(boxes[i][1] for i in members),
+            max(boxes[i][2] for i in members), max(boxes[i][3] for i in members),
+        ]
+        for _, members in sorted(groups.items())
+    ]
+
+
+def test_iou_matrix_matches_pairwise():
+    boxes = _random_boxes(60, seed=1)
+    other = _random_boxes(25, seed=2)
+    expected = [[_iou(a, b) for b in other.tolist()] for a in boxes.tolist()]
+    assert np.allclose(iou_matrix(boxes, other), expected)
+    assert np.allclose(np.diag(iou_matrix(boxes)), 1.0)
+
+
+def test_non_max_suppression_matches_greedy():
+    rng = np.random.default_rng(3)
+    for seed in range(5):
+        boxes = _random_boxes(120, seed=seed)
+        labels = rng.integers(0, 3, len(boxes))
+        scores = rng.random(len(boxes))
+        for threshold in (0.1, 0.5, 0.9):
+            assert np.array_equal(
+                non_max_suppression(boxes, threshold),
+                _brute_force_nms(boxes.tolist(), threshold),
+            )
+            assert np.array_equal(
+                non_max_suppression(boxes, threshold, labels=labels, scores=scores),
+                _brute_force_nms(boxes.tolist(), threshold, labels.tolist(), scores.tolist()),
+            )
+
+
+def test_non_max_suppression_keeps_first_of_duplicates():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 10], [20, 20, 30, 30], [0, 0, 10, 10]])
+    assert non_max_suppression(boxes, 0.5).tolist() == [True, False, True, False]
+    assert non_max_suppression(boxes, 0.5, labels=np.array([0, 1, 0, 1])).tolist() == [True, True, True, False]
+    assert non_max_suppression(np.zeros((0, 4)), 0.5).shape == (0,)
+
+
+def test_merge_overlapping_boxes_matches_union_find():
+    for seed in range(5):
+        boxes = _random_boxes(80, seed=10 + seed)
+        for threshold in (0.05, 0.3, 0.7):
+            merged = merge_overlapping_boxes(boxes, threshold)
+            assert merged.tolist() == _brute_force_merge(boxes.tolist(), threshold)
+
+
+def test_merge_overlapping_boxes_chains():
+    # 0-1 and 1-2 overlap but 0-2 do not: all three end up in one group
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [10, 0, 20, 10], [50, 50, 60, 60]])
+    assert merge_overlapping_boxes(boxes, 0.3).tolist() == [[0, 0, 20, 10], [50, 50, 60, 60]]
+    assert merge_overlapping_boxes(boxes[:1], 0.3).tolist() == [[0, 0, 10, 10]]
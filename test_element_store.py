@@ -0,0 +1,126 @@
+"""
+Tests for the columnar element store (ElementStore).
+"""
+
+import numpy as np
+
+from inference.extraction import ElementStore
+
+TYPES = ['text', 'title', 'table', 'image']
+PAGE_SIZES = {1: (1000, 1400), 2: (800, 1000), 3: (1200, 1600)}
+
+
+def _random_elements(page, count, seed=0):
+    """Elements of one page with 1-5 boxes each, laid out like build_element output."""
+    rng = np.random.default_rng(seed)
+    width, height = PAGE_SIZES[page]
+    elements = []
+    for i in range(count):
+        bounding_boxes = []
+        for _ in range(int(rng.integers(1, 6))):
+            x1 = int(rng.integers(0, width - 50))
+            y1 = int(rng.integers(0, height - 50))
+            bounding_boxes.append({
+                'x1': x1,
+                'y1': y1,
+                'x2': x1 + int(rng.integers(10, 50)),
+                'y2': y1 + int(rng.integers(10, 50)),
+            })
+        union_width = max(b['x2'] for b in bounding_boxes) - min(b['x1'] for b in bounding_boxes)
+        union_height = max(b['y2'] for b in bounding_boxes) - min(b['y1'] for b in bounding_boxes)
+        elements.append({
+            'id': f'page_{page:04d}_elem_{i:04d}',
+            'type': TYPES[int(rng.integers(len(TYPES)))],
+            'page': page,
+            'index': i,
+            'bounding_boxes': bounding_boxes,
+            'bounding_boxes_normalized': [
+                {'x1': b['x1'] / width, 'y1': b['y1'] / height, 'x2': b['x2'] / width, 'y2': b['y2'] / height}
+                for b in bounding_boxes
+            ],
+            'metrics': {
+                'num_boxes': len(bounding_boxes),
+                'total_area': sum((b['x2'] - b['x1']) * (b['y2'] - b['y1']) for b in bounding_boxes),
+                'width': union_width,
+                'height': union_height,
+                'aspect_ratio': union_width / union_height,
+            },
+            'image_dimensions': {'width': width, 'height': height},
+            'source_span': {'start': 10 * i, 'end': 10 * i + 7},
+        })
+    return elements
+
+
+def _pages(seed=0):
+    return [_random_elements(page, 20 + page, seed=seed + page) for page in PAGE_SIZES]
+
+
+def _brute_force_union(element):
+    boxes = element['bounding_boxes']
+    return [
+        min(b['x1'] for b in boxes), min(b['y1'] for b in boxes),
+        max(b['x2'] for b in boxes), max(b['y2'] for b in boxes),
+    ]
+
+
+def test_round_trip():
+    elements = [element for page in _pages() for element in page]
+    store = ElementStore.from_elements(elements)
+    assert len(store) == len(elements)
+    assert store.to_elements() == elements
+    assert store[-1] == elements[-1]
+
+
+def test_union_boxes_and_metrics_match_brute_force():
+    elements = [element for page in _pages(seed=1) for element in page]
+    store = ElementStore.from_elements(elements)
+
+    # reduceat over box_offsets[:-1]: every element's segment, including the last one
+    assert store.union_boxes().tolist() == [_brute_force_union(element) for element in elements]
+    metrics = store.metrics()
+    for name in ('num_boxes', 'total_area', 'width', 'height', 'aspect_ratio'):
+        assert np.allclose(metrics[name], [element['metrics'][name] for element in elements]), name
+    assert store.box_owner.tolist() == [
+        i for i, element in enumerate(elements) for _ in element['bounding_boxes']
+    ]
+
+
+def test_select_rebuilds_offsets():
+    elements = [element for page in _pages(seed=2) for element in page]
+    store = ElementStore.from_elements(elements)
+
+    mask = store.label_mask('table', 'image') & ~store.page_mask(2)
+    selected = store.select(mask)
+    expected = [e for e in elements if e['type'] in ('table', 'image') and e['page'] != 2]
+    assert selected.to_elements() == expected
+    assert selected.union_boxes().tolist() == [_brute_force_union(e) for e in expected]
+
+    rows = np.array([5, 0, 17, 3])
+    assert store.select(rows).to_elements() == [elements[i] for i in rows]
+    empty = store.select(np.zeros(len(store), dtype=bool))
+    assert len(empty) == 0 and empty.union_boxes().shape == (0, 4)
+
+
+def test_concat_remaps_labels_and_offsets():
+    pages = _pages(seed=3)
+    stores = [ElementStore.from_elements(page) for page in pages]
+    combined = ElementStore.concat(stores + [ElementStore.empty()])
+    elements = [element for page in pages for element in page]
+    assert combined.to_elements() == elements
+    assert combined.types.tolist() == [element['type'] for element in elements]
+    assert combined.union_boxes().tolist() == [_brute_force_union(element) for element in elements]
+    assert len(ElementStore.concat([])) == 0
+
+
+def test_spatial_index_returns_store_rows():
+    elements = [element for page in _pages(seed=4) for element in page]
+    store = ElementStore.from_elements(elements)
+    region = {'x1': 100, 'y1': 100, 'x2': 600, 'y2': 700}
+    expected = [
+        i for i, element in enumerate(elements)
+        if element['page'] == 2 and any(
+            b['x1'] < region['x2'] and region['x1'] < b['x2'] and b['y1'] < region['y2'] and region['y1'] < b['y2']
+            for b in element['bounding_boxes']
+        )
+    ]
+    assert store.spatial_index(2).query(region) == expected
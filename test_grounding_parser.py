@@ -0,0 +1,50 @@
+"""
+Tests for the streaming grounding parser, against the batch parser.
+"""
+
+import numpy as np
+import pytest
+
+from inference.extraction import GroundingStreamParser, iter_grounding_refs
+
+OUTPUT = (
+    "<|ref|>title<|/ref|><|det|>[[12, 40, 300, 96]]<|/det|>\n# Introduction\n\n"
+    "<|ref|>text<|/ref|><|det|>[[12, 100, 900, 400], [12, 410, 900, 500]]<|/det|>\nBody text "
+    + "with a long paragraph " * 50
+    + "\n<|ref|>broken<|/ref|> no det block\n"
+    "<|ref|>image<|/ref|><|det|>[[1, 2, 3]<|/det|>\n"
+    "<|ref|>table<|/ref|><|det|>[[5, 5, 995, 995]]<|/det|>\n<table><tr><td>a</td></tr></table>"
+    "<|ref|>unfinished<|/ref|><|det|>[[1, 2"
+)
+
+
+def _chunks(text, seed):
+    rng = np.random.default_rng(seed)
+    cuts = np.sort(rng.choice(np.arange(1, len(text)), size=len(text) // 4, replace=False))
+    return [text[a:b] for a, b in zip([0, *cuts], [*cuts, len(text)])]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_stream_matches_batch(seed):
+    expected = list(iter_grounding_refs(OUTPUT))
+    parser = GroundingStreamParser(keep_text=True)
+    refs = [ref for chunk in _chunks(OUTPUT, seed) for ref in parser.feed(chunk)]
+    assert refs == expected
+    assert [ref.label for ref in refs] == ['title', 'text', 'image', 'table']
+    assert all(OUTPUT[ref.start:ref.end].endswith('<|/det|>') for ref in refs)
+    assert parser.get_text() == OUTPUT
+
+
+def test_character_by_character():
+    parser = GroundingStreamParser()
+    refs = [ref for ch in OUTPUT for ref in parser.feed(ch)]
+    assert refs == list(iter_grounding_refs(OUTPUT))
+    # the unfinished reference is all that stays buffered
+    assert parser._buffer == OUTPUT[OUTPUT.rindex('<|ref|>'):]
+
+
+def test_get_text_requires_keep_text():
+    parser = GroundingStreamParser()
+    parser.feed('text')
+    with pytest.raises(ValueError):
+        parser.get_text()
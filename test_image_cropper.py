@@ -0,0 +1,90 @@
+"""
+Tests for parallel element cropping (save_all_elements).
+"""
+
+import io
+import json
+
+import numpy as np
+from PIL import Image
+
+from inference.extraction import save_all_elements
+
+
+def _page_elements(width, height, count, seed=0):
+    rng = np.random.default_rng(seed)
+    elements = []
+    for i in range(count):
+        x1 = int(rng.integers(0, width - 200))
+        y1 = int(rng.integers(0, height - 200))
+        x2 = x1 + int(rng.integers(20, 200))
+        y2 = y1 + int(rng.integers(20, 200))
+        bbox = {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
+        elements.append({
+            'id': f'page_0001_elem_{i:04d}',
+            'type': 'text',
+            'page': 1,
+            'index': i,
+            'bounding_boxes': [bbox],
+            'bounding_boxes_normalized': [{
+                'x1': x1 / width, 'y1': y1 / height, 'x2': x2 / width, 'y2': y2 / height,
+            }],
+            'metrics': {
+                'num_boxes': 1,
+                'total_area': (x2 - x1) * (y2 - y1),
+                'width': x2 - x1,
+                'height': y2 - y1,
+                'aspect_ratio': (x2 - x1) / (y2 - y1),
+            },
+            'image_dimensions': {'width': width, 'height': height},
+        })
+    return elements
+
+
+def _jpeg_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def test_lazily_opened_page_crops_match(tmp_path):
+    """Crops from a lazily opened PNG match crops from the decoded page, byte for byte."""
+    width, height = 1700, 2200
+    pixels = np.random.default_rng(1).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    page_path = tmp_path / 'page.png'
+    Image.fromarray(pixels).save(page_path)
+    elements = _page_elements(width, height, 100)
+
+    lazy_page = Image.open(page_path)
+    saved = save_all_elements(lazy_page, elements, tmp_path / 'elements', max_workers=8)
+
+    reference = Image.fromarray(pixels)
+    assert len(saved) == len(elements)
+    for element in elements:
+        box = element['bounding_boxes'][0]
+        expected = _jpeg_bytes(reference.crop((box['x1'], box['y1'], box['x2'], box['y2'])))
+        assert saved[element['id']].read_bytes() == expected, element['id']
+
+
+def test_manifest_only_with_skip_unchanged(tmp_path):
+    image = Image.new('RGB', (400, 400), 'white')
+    elements = _page_elements(400, 400, 5)
+
+    save_all_elements(image, elements, tmp_path / 'plain')
+    assert not (tmp_path / 'plain' / 'crops_manifest.json').exists()
+
+    save_all_elements(image, elements, tmp_path / 'cached', skip_unchanged=True)
+    with open(tmp_path / 'cached' / 'crops_manifest.json', 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert len(manifest) == len(elements)
+
+
+def test_skip_unchanged_keeps_existing_files(tmp_path):
+    image = Image.new('RGB', (400, 400), 'white')
+    elements = _page_elements(400, 400, 5)
+    output_dir = tmp_path / 'elements'
+
+    first = save_all_elements(image, elements, output_dir, skip_unchanged=True)
+    mtimes = {element_id: path.stat().st_mtime_ns for element_id, path in first.items()}
+    second = save_all_elements(image, elements, output_dir, skip_unchanged=True)
+    assert {element_id: path.stat().st_mtime_ns for element_id, path in second.items()} == mtimes
@@ -0,0 +1,115 @@
+"""
+Tests for the streaming document JSON builder.
+"""
+
+import json
+
+import pytest
+
+from inference.structuring import build_document_hierarchy, build_document_json
+from inference.structuring.json_builder import DocumentJSONBuilder, iter_document_records
+
+
+def _element(page, index, element_type, text):
+    return {
+        'id': f'page_{page:04d}_elem_{index:04d}',
+        'type': element_type,
+        'page': page,
+        'index': index,
+        'text': text,
+        'bounding_boxes': [{'x1': 10, 'y1': 100 * index, 'x2': 500, 'y2': 100 * index + 50}],
+        'image_dimensions': {'width': 1000, 'height': 1400},
+    }
+
+
+PAGES = [
+    {'page_number': 1, 'elements': [
+        _element(1, 0, 'text', 'Preface without a section.'),
+        _element(1, 1, 'title', '# Introduction'),
+        _element(1, 2, 'text', 'First paragraph.'),
+        _element(1, 3, 'sub_title', '## Background'),
+        _element(1, 4, 'table', '<table><tr><td>a</td><td>b</td></tr><tr><td>c</td><td>d</td></tr></table>'),
+    ]},
+    {'page_number': 2, 'elements': [
+        _element(2, 0, 'equation', r'\[ E = mc^2 \tag{1} \]'),
+        _element(2, 1, 'title', '# Results'),
+        _element(2, 2, 'text', 'Second paragraph.'),
+    ]},
+    {'page_number': 3, 'elements': []},
+]
+
+
+def _all_elements():
+    return [element for page in PAGES for element in page['elements']]
+
+
+def test_jsonl_records(tmp_path):
+    path = tmp_path / 'document.jsonl'
+    structure = build_document_json('paper.pdf', iter(PAGES), str(path))
+    records = list(iter_document_records(path))
+
+    assert [record['record'] for record in records] == ['document', 'page', 'page', 'page', 'summary']
+    assert records[0]['document_metadata']['filename'] == 'paper.pdf'
+    assert [record['page'] for record in records[1:4]] == [1, 2, 3]
+    elements = [element for record in records[1:4] for element in record['elements']]
+    assert [element['id'] for element in elements] == [element['id'] for element in _all_elements()]
+    assert [element['section_id'] for element in elements] == [
+        None, 'page_0001_elem_0001', 'page_0001_elem_0001', 'page_0001_elem_0003', 'page_0001_elem_0003',
+        'page_0001_elem_0003', 'page_0002_elem_0001', 'page_0002_elem_0001',
+    ]
+    assert elements[4]['table'] == {'rows': 2, 'columns': 2}
+    assert elements[5]['equation']['tag'] == '1'
+
+    assert records[-1]['statistics'] == structure['statistics']
+    assert structure['statistics']['total_elements'] == len(_all_elements())
+    assert structure['document_metadata']['num_pages'] == 3
+    assert records[2]['section_path'] == ['Results']
+
+
+def test_json_matches_jsonl(tmp_path):
+    jsonl = build_document_json('paper.pdf', PAGES, str(tmp_path / 'document.jsonl'))
+    json_structure = build_document_json('paper.pdf', PAGES, str(tmp_path / 'document.json'))
+    with open(tmp_path / 'document.json', 'r', encoding='utf-8') as f:
+        document = json.load(f)
+
+    records = list(iter_document_records(tmp_path / 'document.jsonl'))
+    pages = [{key: value for key, value in record.items() if key != 'record'} for record in records[1:-1]]
+    assert document['pages'] == pages
+    assert document['hierarchy'] == records[-1]['hierarchy'] == jsonl['hierarchy']
+    assert document['statistics'] == json_structure['statistics'] == jsonl['statistics']
+
+
+def test_hierarchy_matches_batch_builder(tmp_path):
+    structure = build_document_json('paper.pdf', PAGES, str(tmp_path / 'document.jsonl'))
+    hierarchy = build_document_hierarchy(_all_elements())
+    assert structure['hierarchy'] == hierarchy
+    assert hierarchy['num_sections'] == 3
+    assert hierarchy['unsectioned_elements'] == 1
+    introduction, results = hierarchy['sections']
+    assert (introduction['title'], introduction['num_elements']) == ('Introduction', 1)
+    assert introduction['children'][0]['title'] == 'Background'
+    assert introduction['children'][0]['num_elements'] == 2
+    assert (results['title'], results['page'], results['num_elements']) == ('Results', 2, 1)
+
+
+def test_truncated_jsonl_keeps_finished_pages(tmp_path):
+    path = tmp_path / 'document.jsonl'
+    with pytest.raises(RuntimeError):
+        with DocumentJSONBuilder(path, 'paper.pdf') as builder:
+            builder.add_page(1, PAGES[0]['elements'])
+            builder.add_page(2, PAGES[1]['elements'])
+            raise RuntimeError('interrupted')
+    complete = path.read_text(encoding='utf-8')
+    assert [record['record'] for record in iter_document_records(path)] == ['document', 'page', 'page']
+
+    # a partly written last line is dropped, earlier pages survive
+    path.write_text(complete + complete.splitlines()[2][:40], encoding='utf-8')
+    records = list(iter_document_records(path))
+    assert [record.get('page') for record in records] == [None, 1, 2]
+    path.write_text(complete[:-10], encoding='utf-8')
+    assert [record.get('page') for record in iter_document_records(path)] == [None, 1]
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        DocumentJSONBuilder(tmp_path / 'document.xml', 'paper.pdf', output_format='xml')
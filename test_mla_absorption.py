@@ -0,0 +1,48 @@
+"""
+Tests for load-time absorption of the MLA kv_b_proj weights.
+"""
+
+import pytest
+import torch
+
+from model_patch.configuration_deepseek_v2 import DeepseekV2Config
+from model_patch.modeling_deepseekv2 import DeepseekV2Model
+
+
+def _tiny_model(attn_implementation):
+    config = DeepseekV2Config(
+        vocab_size=64,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=3,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        kv_lora_rank=16,
+        q_lora_rank=None,
+        qk_rope_head_dim=8,
+        qk_nope_head_dim=8,
+        v_head_dim=8,
+        use_mla=True,
+    )
+    config._attn_implementation = attn_implementation
+    torch.manual_seed(0)
+    return DeepseekV2Model(config).eval()
+
+
+@pytest.mark.parametrize('attn_implementation', ['eager', 'sdpa'])
+@pytest.mark.parametrize('fuse_q_proj', [False, True])
+def test_absorb_updates_every_layer(attn_implementation, fuse_q_proj):
+    model = _tiny_model(attn_implementation)
+    input_ids = torch.randint(0, 64, (2, 7))
+    with torch.no_grad():
+        expected = model(input_ids=input_ids, use_cache=False).last_hidden_state
+
+    assert model.absorb_mla_projections(fuse_q_proj=fuse_q_proj) == len(model.layers)
+    for layer in model.layers:
+        assert layer.self_attn.q_absorb is not None
+        assert (layer.self_attn.q_proj_absorbed is not None) == fuse_q_proj
+
+    with torch.no_grad():
+        absorbed = model(input_ids=input_ids, use_cache=False).last_hidden_state
+    torch.testing.assert_close(absorbed, expected, rtol=1e-4, atol=1e-4)
+
@@ -0,0 +1,163 @@
+"""
+Tests for the on-disk search index (segments, merging and queries).
+"""
+
+import shutil
+
+import numpy as np
+
+from inference.linking.search_indexer import (
+    MERGE_FACTOR,
+    Lexicon,
+    SearchIndex,
+    SearchIndexWriter,
+    _segment_dirs,
+    merge_segments,
+    tokenize,
+)
+
+VOCABULARY = ['alpha', 'beta', 'gamma', 'delta', 'épsilon', 'zeta', 'ηta', 'theta']
+TYPES = ['text', 'title', 'table']
+
+
+def _random_pages(num_documents, num_pages, seed=0):
+    """(document, page number, elements) per page, with random element text."""
+    rng = np.random.default_rng(seed)
+    pages = []
+    for d in range(num_documents):
+        for page in range(1, num_pages + 1):
+            elements = []
+            for i in range(int(rng.integers(1, 6))):
+                words = rng.choice(VOCABULARY, size=int(rng.integers(0, 12)))
+                elements.append({
+                    'id': f'doc{d}_page_{page:04d}_elem_{i:04d}',
+                    'type': TYPES[int(rng.integers(len(TYPES)))],
+                    'page': page,
+                    'text': ' '.join(words),
+                })
+            pages.append((f'doc{d}', page, elements))
+    return pages
+
+
+def _brute_force(pages, query, element_type=None, document=None, phrase=False):
+    terms = tokenize(query)
+    hits = set()
+    for name, _, elements in pages:
+        if document is not None and name != document:
+            continue
+        for element in elements:
+            if element_type is not None and element['type'] != element_type:
+                continue
+            tokens = tokenize(element['text'])
+            if phrase:
+                found = any(tokens[i:i + len(terms)] == terms for i in range(len(tokens) - len(terms) + 1))
+            else:
+                found = all(term in tokens for term in terms)
+            if found:
+                hits.add(element['id'])
+    return hits
+
+
+def _write_pages(index_dir, pages, auto_merge=True):
+    writer = SearchIndexWriter(index_dir, auto_merge=auto_merge)
+    segments = []
+    for name, _, elements in pages:
+        writer.add_elements(name, elements)
+        segments.append(writer.commit())
+    return segments
+
+
+QUERIES = [
+    ('alpha', {}),
+    ('beta gamma', {}),
+    ('beta gamma', {'phrase': True}),
+    ('alpha beta alpha', {'phrase': True}),
+    ('épsilon', {'element_type': 'table'}),
+    ('ηta theta', {'document': 'doc1'}),
+    ('zeta delta', {'document': 'doc2', 'element_type': 'title', 'phrase': True}),
+    ('missing', {}),
+]
+
+
+def _check_queries(index, pages):
+    for query, options in QUERIES:
+        hits = index.search(query, **options)
+        ids = [hit['element_id'] for hit in hits]
+        assert len(ids) == len(set(ids)), query
+        assert set(ids) == _brute_force(pages, query, **options), (query, options)
+
+
+def test_lexicon_find():
+    terms = sorted(['a', 'ab', 'b', 'zeta', 'é', 'ηta', '中文'])
+    lexicon = Lexicon.from_terms(terms)
+    assert lexicon.terms() == terms
+    for i, term in enumerate(terms):
+        assert lexicon.find(term) == i
+        assert lexicon[i] == term
+    for term in ['', 'aa', 'c', 'zz', 'η']:
+        assert lexicon.find(term) is None
+    assert Lexicon.from_terms([]).find('a') is None
+
+
+def test_search_matches_brute_force(tmp_path):
+    pages = _random_pages(3, 10)
+    _write_pages(tmp_path / 'index', pages, auto_merge=False)
+    assert len(_segment_dirs(tmp_path / 'index')) == len(pages)
+    _check_queries(SearchIndex(tmp_path / 'index'), pages)
+
+
+def test_merge_remaps_documents_labels_and_rows(tmp_path):
+    pages = _random_pages(3, 10, seed=1)
+    index_dir = tmp_path / 'index'
+    _write_pages(index_dir, pages, auto_merge=False)
+    merged = merge_segments(index_dir)
+    assert _segment_dirs(index_dir) == [merged]
+
+    index = SearchIndex(index_dir)
+    assert len(index) == sum(len(elements) for _, _, elements in pages)
+    _check_queries(index, pages)
+    pages_by_id = {
+        element['id']: (name, element['type'], page)
+        for name, page, elements in pages for element in elements
+    }
+    for hit in index.search('alpha'):
+        assert pages_by_id[hit['element_id']] == (hit['document'], hit['type'], hit['page'])
+
+
+def test_merge_of_missing_segments_is_skipped(tmp_path):
+    pages = _random_pages(1, 4, seed=2)
+    index_dir = tmp_path / 'index'
+    segments = _write_pages(index_dir, pages, auto_merge=False)
+    merge_segments(index_dir, segments[:2])
+    # the first two segments are gone; merging the run's segments again keeps every element
+    merge_segments(index_dir, segments)
+    _check_queries(SearchIndex(index_dir), pages)
+
+
+def test_auto_merge_bounds_segment_count(tmp_path):
+    pages = _random_pages(4, 40, seed=3)
+    index_dir = tmp_path / 'index'
+    _write_pages(index_dir, pages)
+
+    sizes = [len(np.load(d / 'elements.npy')) for d in _segment_dirs(index_dir)]
+    tiers = {}
+    for size in sizes:
+        tier = 0
+        while size >= MERGE_FACTOR ** (tier + 1):
+            tier += 1
+        tiers[tier] = tiers.get(tier, 0) + 1
+    assert all(count < MERGE_FACTOR for count in tiers.values())
+    assert len(sizes) < len(pages)
+    assert not (index_dir / 'merge.lock').exists()
+    _check_queries(SearchIndex(index_dir), pages)
+
+
+def test_reader_skips_sources_of_a_merge(tmp_path):
+    pages = _random_pages(2, 3, seed=4)
+    index_dir = tmp_path / 'index'
+    segments = _write_pages(index_dir, pages, auto_merge=False)
+    # keep a copy of one source, as a reader listing the directory mid-merge would see it
+    shutil.copytree(segments[0], tmp_path / 'copy')
+    merge_segments(index_dir)
+    shutil.copytree(tmp_path / 'copy', segments[0])
+    _check_queries(SearchIndex(index_dir), pages)
@@ -0,0 +1,99 @@
+"""
+Tests for the uniform-grid spatial index, against brute-force scans.
+"""
+
+import numpy as np
+
+from inference.extraction import SpatialIndex
+
+
+def _random_boxes(count, seed=0, size=1000):
+    """(N, 4) boxes of mixed sizes and (N,) owners, with some elements owning several boxes."""
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(0, size, count)
+    y1 = rng.uniform(0, size, count)
+    widths = np.where(rng.random(count) < 0.1, rng.uniform(100, 400, count), rng.uniform(2, 40, count))
+    heights = np.where(rng.random(count) < 0.1, rng.uniform(100, 400, count), rng.uniform(2, 40, count))
+    boxes = np.stack([x1, y1, x1 + widths, y1 + heights], axis=1)
+    owners = np.sort(rng.integers(0, count * 2 // 3, count))
+    return boxes, owners
+
+
+def _random_regions(count, seed=0, size=1000):
+    rng = np.random.default_rng(seed)
+    regions = []
+    for _ in range(count):
+        x, y = rng.uniform(-100, size + 100, 2)
+        w, h = rng.uniform(0, 300, 2)
+        regions.append((x, y, x + w, y + h))
+    # points and regions on the page corners
+    regions += [(500.0, 500.0, 500.0, 500.0), (0.0, 0.0, 1.0, 1.0), (-50.0, -50.0, -10.0, -10.0)]
+    return regions
+
+
+def _gap(box, region):
+    dx = max(region[0] - box[2], box[0] - region[2], 0.0)
+    dy = max(region[1] - box[3], box[1] - region[3], 0.0)
+    return float(np.hypot(dx, dy))
+
+
+def _owners_where(owners, hit):
+    return sorted(set(owners[hit].tolist()))
+
+
+def test_query_within_containing_match_brute_force():
+    boxes, owners = _random_boxes(300, seed=1)
+    for cell_size in (None, 7.0, 250.0):
+        index = SpatialIndex(boxes, owners, cell_size)
+        for region in _random_regions(50, seed=2):
+            x1, y1, x2, y2 = region
+            overlap = (boxes[:, 0] < x2) & (x1 < boxes[:, 2]) & (boxes[:, 1] < y2) & (y1 < boxes[:, 3])
+            assert index.query(region) == _owners_where(owners, overlap)
+
+            inside = (boxes[:, 0] >= x1) & (boxes[:, 1] >= y1) & (boxes[:, 2] <= x2) & (boxes[:, 3] <= y2)
+            all_inside = [
+                owner for owner in sorted(set(owners.tolist()))
+                if inside[owners == owner].all()
+            ]
+            assert index.within(region) == all_inside
+
+            contains = (boxes[:, 0] <= x1) & (boxes[:, 1] <= y1) & (boxes[:, 2] >= x2) & (boxes[:, 3] >= y2)
+            assert index.containing(region) == _owners_where(owners, contains)
+
+
+def test_nearest_matches_brute_force():
+    boxes, owners = _random_boxes(400, seed=3)
+    for cell_size in (None, 5.0, 120.0):
+        index = SpatialIndex(boxes, owners, cell_size)
+        for region in _random_regions(40, seed=4):
+            for k, exclude in ((1, ()), (5, ()), (12, (int(owners[0]), int(owners[-1])))):
+                best = {}
+                for box, owner in zip(boxes, owners.tolist()):
+                    if owner in exclude:
+                        continue
+                    best[owner] = min(best.get(owner, float('inf')), _gap(box, region))
+                expected = sorted(best.items(), key=lambda item: (item[1], item[0]))[:k]
+                assert index.nearest(region, k=k, exclude=exclude) == expected
+
+
+def test_nearest_stops_early_but_exactly():
+    # a dense cluster near the query and one far outlier: the ring search must not stop
+    # before a closer box in a neighbouring ring has been seen
+    boxes = np.array([
+        [100, 100, 110, 110],
+        [125, 100, 135, 110],
+        [100, 131, 110, 141],
+        [900, 900, 910, 910],
+    ], dtype=np.float64)
+    index = SpatialIndex(boxes, cell_size=10.0)
+    assert [owner for owner, _ in index.nearest((112, 105), k=2)] == [0, 1]
+    assert index.nearest((112, 105), k=4)[-1][0] == 3
+    assert index.nearest((112, 105), k=10) == index.nearest((112, 105), k=4)
+
+
+def test_empty_index():
+    index = SpatialIndex(np.zeros((0, 4)))
+    assert len(index) == 0
+    assert index.query((0, 0, 10, 10)) == []
+    assert index.within((0, 0, 10, 10)) == []
+    assert index.nearest((5, 5), k=3) == []